@@ -1,14 +1,14 @@
 # main.py - Principal de la aplicación UNT
 import streamlit as st
-from src.database.database import DatabaseManager
+from src.database.database import get_db
 from src.auth.auth import AuthManager
 from src.utils.image_manager import ImageManager
-from src.utils.email_manager import EmailManager
+from src.utils.email_manager import get_email_manager
 from src.dashboards.admin import admin_dashboard
 from src.dashboards.bibliotecario import bibliotecario_dashboard
 from src.dashboards.usuario import usuario_dashboard
 from src.database.models import init_database
-from src.utils.alerts import verificar_alertas
+from src.utils.alerts import iniciar_planificador_alertas
 from src.utils.alert_utils import show_sweet_alert
 import time
 import re
@@ -21,21 +21,19 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Inicializar managers globales
-db_manager = DatabaseManager()
+# Inicializar managers (la conexión a la BD es por sesión)
+db_manager = get_db()
 image_manager = ImageManager()
-email_manager = EmailManager()
+email_manager = get_email_manager()
 
 # --- Funciones de soporte ---
 def get_facultades_options():
     """Obtiene lista de facultades para filtros"""
-    db_manager = DatabaseManager()
     facultades = db_manager.execute_query("SELECT facultad_id, nombre FROM facultades WHERE activa = TRUE ORDER BY nombre")
     return {f['nombre']: f['facultad_id'] for f in facultades} if facultades else {}
 
 def get_escuelas_options():
     """Obtiene lista de escuelas para filtros"""
-    db_manager = DatabaseManager()
     escuelas = db_manager.execute_query("SELECT escuela_id, nombre FROM escuelas WHERE activa = TRUE ORDER BY nombre")
     return {e['nombre']: e['escuela_id'] for e in escuelas} if escuelas else {}
 
@@ -228,13 +226,18 @@ def mostrar_login():
 # Lógica principal de la aplicación
 if "token" not in st.session_state:
     init_database()
+
+# Una vez por proceso y con el esquema ya creado (toda sesión nueva pasa primero por el login)
+iniciar_planificador_alertas()
+
+if "token" not in st.session_state:
     mostrar_login()
 else:
     # Lógica de enrutamiento basada en el rol del usuario
     user = st.session_state.user
     if user['role'] == 'admin':
-        admin_dashboard(user)
+        admin_dashboard(user, db_manager)
     elif user['role'] == 'bibliotecario':
-        bibliotecario_dashboard(user)
+        bibliotecario_dashboard(user, db_manager)
     else: # estudiante o docente
-        usuario_dashboard(user)
+        usuario_dashboard(user, db_manager)
@@ -0,0 +1,30 @@
+# scripts/compile_templates.py - Precompila las plantillas de correo
+"""
+Compila templates/emails/*.html a módulos Python dentro de templates/compiled_templates.zip.
+EmailManager carga ese zip con jinja2.ModuleLoader cuando es más nuevo que las plantillas,
+así el primer envío tras un despliegue no paga el parseo/compilación.
+
+Uso (desde la raíz del proyecto, en el build):
+    python scripts/compile_templates.py
+"""
+from pathlib import Path
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+ROOT = Path(__file__).resolve().parents[1]
+TEMPLATES_DIR = ROOT / "templates" / "emails"
+TARGET = ROOT / "templates" / "compiled_templates.zip"
+
+
+def main():
+    # Mismo autoescape que en src/utils/email_manager.py: queda fijado en el código compilado
+    env = Environment(
+        loader=FileSystemLoader(str(TEMPLATES_DIR)),
+        autoescape=select_autoescape(["html", "xml"])
+    )
+    env.compile_templates(str(TARGET), zip="deflated", ignore_errors=False)
+    print(f"Plantillas compiladas en {TARGET}")
+
+
+if __name__ == "__main__":
+    main()
@@ -18,6 +18,7 @@ from src.services.graficos import generar_graficos
 from src.services.perfil import perfil_usuario
 from src.utils.image_manager import ImageManager
 from src.auth.auth import require_auth
+from src.utils.alerts import verificar_alertas
 
 LIMA_TZ = ZoneInfo("America/Lima")
 
@@ -47,7 +48,7 @@ def _fmt12_lima(value) -> str:
     except Exception:
         return str(value)
 
-def admin_dashboard(user):
+def admin_dashboard(user, db_manager: DatabaseManager | None = None):
 
     # --- Auth (JWT) ---
     require_auth(required_roles=("admin",))
@@ -55,12 +56,15 @@ def admin_dashboard(user):
     st.title("Administrador UNT")
     st.write(f"Bienvenido, **{user['nombre_completo']}**")
 
-    db_manager = DatabaseManager()
+    db_manager = db_manager or DatabaseManager()
     image_manager = ImageManager()
 
     # Mostrar información del usuario 
     mostrar_info_usuario(user, image_manager, db_manager)
 
+    # Alertas generadas por el planificador (préstamos por vencer/vencidos, reservas por expirar)
+    verificar_alertas(db_manager)
+
     # --- Métricas rápidas ---
     col1, col2, col3, col4 = st.columns(4)
     with col1:
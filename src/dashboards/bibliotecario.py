@@ -11,11 +11,12 @@ from src.services.reservas import gestion_reservas
 from src.services.usuarios import validar_cuentas  
 from src.services.libros import gestion_libros
 from src.utils.alert_utils import show_sweet_alert
-from src.utils.email_manager import EmailManager  
+from src.utils.email_manager import get_email_manager, get_email_dispatcher
 from src.services.sanciones import gestion_sanciones
 from src.services.perfil import perfil_usuario 
 from src.utils.image_manager import ImageManager
 from src.auth.auth import require_auth
+from src.utils.alerts import verificar_alertas
 import math
 
 # --------- Utilidades locales ----------
@@ -47,7 +48,36 @@ def _mensaje_reserva(row: dict) -> str:
         f"Acércate a recogerla o actualiza tu reserva. Si ya lo hiciste, ignora este mensaje."
     )
 
-def bibliotecario_dashboard(user):
+_ENVIOS_KEY = "envios_lote"
+
+def _encolar_envio(tipo: str, etiqueta: str, rows: list):
+    """Encola el lote en segundo plano y guarda sus futures para informar el resultado en un rerun posterior."""
+    futuros = get_email_dispatcher().encolar_lote(tipo, rows)
+    st.session_state.setdefault(_ENVIOS_KEY, []).append((etiqueta, futuros))
+    show_sweet_alert("Envío en curso", f"{len(rows)} correos en cola; se enviarán en segundo plano.", "info")
+
+def _estado_envios():
+    """
+    Resumen de los lotes encolados en esta sesión. Los hilos del despachador no tienen
+    contexto de Streamlit, así que el resultado (ok/total) se muestra aquí y no desde el worker.
+    """
+    pendientes = []
+    for etiqueta, futuros in st.session_state.get(_ENVIOS_KEY, []):
+        hechos = [f for f in futuros if f.done()]
+        if len(hechos) < len(futuros):
+            st.info(f"{etiqueta}: {len(hechos)}/{len(futuros)} correos procesados…")
+            pendientes.append((etiqueta, futuros))
+            continue
+        ok = sum(1 for f in futuros if f.exception() is None and f.result())
+        if ok == len(futuros):
+            st.success(f"{etiqueta}: {ok}/{len(futuros)} correos enviados.")
+        else:
+            st.warning(f"{etiqueta}: {ok}/{len(futuros)} correos enviados; {len(futuros) - ok} fallaron.")
+    st.session_state[_ENVIOS_KEY] = pendientes
+    if pendientes:
+        st.button("🔄 Actualizar estado de envíos")
+
+def bibliotecario_dashboard(user, db_manager: DatabaseManager | None = None):
 
     # --- Auth (JWT) ---
     require_auth(required_roles=("bibliotecario","admin",))
@@ -56,12 +86,15 @@ def bibliotecario_dashboard(user):
     st.title(f"📚 Bibliotecario UNT")
     st.write(f"Bienvenido, **{user['nombre_completo']}**")
 
-    db_manager = DatabaseManager()
+    db_manager = db_manager or DatabaseManager()
     image_manager = ImageManager()
 
     # Mostrar información del usuario 
     mostrar_info_usuario(user, image_manager, db_manager)
 
+    # Alertas generadas por el planificador (préstamos por vencer/vencidos, reservas por expirar)
+    verificar_alertas(db_manager)
+
     # Métricas principales
     col1, col2, col3, col4 = st.columns(4)
     with col1:
@@ -76,7 +109,7 @@ def bibliotecario_dashboard(user):
         st.metric("Préstamos Atrasados", prestamos_atrasados, delta=None, delta_color="inverse")
     with col3:
         reservas_pendientes = db_manager.execute_query(
-            "SELECT COUNT(*) as count FROM reservas WHERE estado = 'pendiente'"
+            "SELECT COUNT(*) as count FROM reservas WHERE estado = 'pendiente' AND fecha_expiracion >= UNIX_TIMESTAMP()"
         )[0]['count']
         st.metric("Reservas Pendientes", reservas_pendientes)
     with col4:
@@ -104,7 +137,7 @@ def bibliotecario_dashboard(user):
     st.sidebar.subheader("✉️ Probar correo")
     test_to = st.sidebar.text_input("Enviar prueba a:", value=user.get("email", "you@example.com"))
     if st.sidebar.button("Enviar prueba ahora"):
-        em = EmailManager()
+        em = get_email_manager()
         ok = em.send_email(test_to, "Biblioteca UNT",
                            html="<p>¡Hola! Esto es una prueba desde la Biblioteca UNT.</p>")
         show_sweet_alert("Prueba de correo", "¡Enviado!" if ok else "Fallo en el envío", "success" if ok else "error")
@@ -174,6 +207,7 @@ def bibliotecario_dashboard(user):
 
     elif opcion == "Alertas y Notificaciones":
         st.header("Alertas y Notificaciones")
+        _estado_envios()
 
         with st.expander("⚙️ Configuración de umbrales", expanded=False):
             dias_por_vencer = st.number_input(
@@ -184,7 +218,6 @@ def bibliotecario_dashboard(user):
             )
 
         tabs = st.tabs(["Préstamos atrasados", "Préstamos por vencer", "Reservas pendientes", "Mensajes (lote)"])
-        em = EmailManager()
 
         # --- Préstamos atrasados ---
         with tabs[0]:
@@ -208,9 +241,7 @@ def bibliotecario_dashboard(user):
 
                 # Botón de envío
                 if st.button("✉️ Enviar correos — Atrasos"):
-                    rows = mostrar.to_dict("records")
-                    res = em.bulk_atrasos(rows)
-                    show_sweet_alert("Envío completado", f"Enviados {res['ok']} de {res['total']} correos.", "success" if res["ok"] else "warning")
+                    _encolar_envio("atrasos", "Atrasos", mostrar.to_dict("records"))
 
                 csv = mostrar.to_csv(index=False).encode("utf-8")
                 st.download_button("Descargar mensajes (CSV)", csv, "mensajes_atrasos.csv", "text/csv")
@@ -239,9 +270,7 @@ def bibliotecario_dashboard(user):
                 st.dataframe(mostrar, use_container_width=True, hide_index=True)
 
                 if st.button("✉️ Enviar correos — Por vencer"):
-                    rows = mostrar.to_dict("records")
-                    res = em.bulk_por_vencer(rows)
-                    show_sweet_alert("Envío completado", f"Enviados {res['ok']} de {res['total']} correos.", "success" if res["ok"] else "warning")
+                    _encolar_envio("por_vencer", "Por vencer", mostrar.to_dict("records"))
 
                 csv = mostrar.to_csv(index=False).encode("utf-8")
                 st.download_button("Descargar mensajes (CSV)", csv, "mensajes_por_vencer.csv", "text/csv")
@@ -258,6 +287,7 @@ def bibliotecario_dashboard(user):
                 JOIN libros l ON r.libro_id = l.libro_id
                 JOIN usuarios u ON r.usuario_id = u.user_id
                 WHERE r.estado = 'pendiente'
+                  AND r.fecha_expiracion >= UNIX_TIMESTAMP()
                   AND r.fecha_reserva < (UNIX_TIMESTAMP() - {int(dias_reserva_pendiente)} * 86400)
                 ORDER BY r.fecha_reserva ASC
             """)
@@ -269,9 +299,7 @@ def bibliotecario_dashboard(user):
                 st.dataframe(mostrar, use_container_width=True, hide_index=True)
 
                 if st.button("✉️ Enviar correos — Reservas"):
-                    rows = mostrar.to_dict("records")
-                    res = em.bulk_reservas(rows)
-                    show_sweet_alert("Envío completado", f"Enviados {res['ok']} de {res['total']} correos.", "success" if res["ok"] else "warning")
+                    _encolar_envio("reservas", "Reservas", mostrar.to_dict("records"))
 
                 csv = mostrar.to_csv(index=False).encode("utf-8")
                 st.download_button("Descargar mensajes (CSV)", csv, "mensajes_reservas.csv", "text/csv")
@@ -320,6 +348,7 @@ def bibliotecario_dashboard(user):
                 JOIN libros l ON r.libro_id = l.libro_id
                 JOIN usuarios u ON r.usuario_id = u.user_id
                 WHERE r.estado = 'pendiente'
+                  AND r.fecha_expiracion >= UNIX_TIMESTAMP()
                   AND r.fecha_reserva < (UNIX_TIMESTAMP() - {int(dias_reserva_pendiente)} * 86400)
                 ORDER BY r.fecha_reserva ASC
             """)
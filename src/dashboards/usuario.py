@@ -9,7 +9,7 @@ import plotly.express as px
 import plotly.graph_objects as go
 
 from src.database.database import DatabaseManager
-from src.utils.image_manager import ImageManager
+from src.utils.image_manager import ImageManager, miniatura
 from src.services.libros import gestion_libros
 from src.utils.alert_utils import show_sweet_alert
 from src.services.perfil import perfil_usuario 
@@ -34,7 +34,7 @@ def _usuario_sancionado_vigente(db: DatabaseManager, user_id: int) -> bool:
 # ============================
 # Dashboard principal
 # ============================
-def usuario_dashboard(user):
+def usuario_dashboard(user, db_manager: DatabaseManager | None = None):
 
     # --- Auth (JWT) ---
     require_auth(required_roles=("estudiante","docente",))
@@ -44,7 +44,7 @@ def usuario_dashboard(user):
     st.title(f"🎓 {titulo_rol} UNT")
     st.write(f"Bienvenido, **{user['nombre_completo']}**")
 
-    db_manager = DatabaseManager()
+    db_manager = db_manager or DatabaseManager()
     image_manager = ImageManager()
 
     # Verificar si está sancionado
@@ -79,7 +79,7 @@ def usuario_dashboard(user):
 
     with col2:
         reservas_pendientes = db_manager.execute_query(
-            "SELECT COUNT(*) as count FROM reservas WHERE usuario_id = %s AND estado = 'pendiente'",
+            "SELECT COUNT(*) as count FROM reservas WHERE usuario_id = %s AND estado = 'pendiente' AND fecha_expiracion >= UNIX_TIMESTAMP()",
             (user['user_id'],)
         )[0]['count']
         st.metric("Reservas Pendientes", reservas_pendientes)
@@ -294,7 +294,7 @@ def mostrar_inicio(db_manager, user):
             col1, col2 = st.columns([1, 3])
             with col1:
                 if libro['portada_id'] and os.path.exists(libro['portada_id']):
-                    st.image(libro['portada_id'], width=80)
+                    st.image(miniatura(libro['portada_id']), width=80)
                 else:
                     st.image(ImageManager().get_default_cover(), width=80)
             with col2:
@@ -350,6 +350,7 @@ def mostrar_reservas(db_manager, user, sanc_bloq: bool):
         JOIN libros l ON r.libro_id = l.libro_id
         JOIN autores a ON l.autor_id = a.autor_id
         WHERE r.usuario_id = %s AND r.estado = 'pendiente'
+          AND r.fecha_expiracion >= UNIX_TIMESTAMP()
     """, (user['user_id'],))
 
     if reservas:
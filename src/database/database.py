@@ -6,6 +6,7 @@ import streamlit as st
 class DatabaseManager:
     def __init__(self):
         self.connection = None
+        self._prepared = {}
 
     # -----------------------------
     # Conexión
@@ -75,6 +76,75 @@ class DatabaseManager:
             if cursor:
                 cursor.close()
 
+    def execute_many(self, query, seq_params):
+        """
+        Ejecuta la misma escritura para varias filas con executemany y un solo commit.
+        Retorna True o None si hubo error.
+        """
+        conn = self.get_connection()
+        if conn is None:
+            return None
+
+        cursor = None
+        try:
+            cursor = conn.cursor()
+            cursor.executemany(query, list(seq_params))
+            conn.commit()
+            return True
+        except Exception as e:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            self.show_alert_local("Error", f"❌ Error ejecutando consulta: {e}", "error")
+            return None
+        finally:
+            if cursor:
+                cursor.close()
+
+    # -----------------------------
+    # Sentencias preparadas
+    # -----------------------------
+    def execute_prepared(self, name, query, params=None):
+        """
+        Ejecuta una escritura frecuente como sentencia preparada en el servidor.
+        El cursor preparado se guarda por `name` y se reutiliza mientras la conexión siga
+        siendo la misma, así MySQL solo analiza la sentencia la primera vez.
+        Retorna True o None si hubo error (igual que execute_query con return_result=False).
+        """
+        conn = self.get_connection()
+        if conn is None:
+            return None
+
+        entry = self._prepared.get(name)
+        if entry is None or entry[0] is not conn or entry[1] != query:
+            if entry is not None:
+                try:
+                    entry[2].close()
+                except Exception:
+                    pass
+            entry = (conn, query, conn.cursor(prepared=True))
+            self._prepared[name] = entry
+
+        cursor = entry[2]
+        try:
+            cursor.execute(query, params or ())
+            conn.commit()
+            return True
+        except Exception as e:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            # El cursor puede quedar inservible: se vuelve a preparar en la siguiente llamada
+            self._prepared.pop(name, None)
+            try:
+                cursor.close()
+            except Exception:
+                pass
+            self.show_alert_local("Error", f"❌ Error ejecutando consulta: {e}", "error")
+            return None
+
     # -----------------------------
     # Procedimientos almacenados
     # -----------------------------
@@ -131,3 +201,15 @@ class DatabaseManager:
         finally:
             if cursor:
                 cursor.close()
+
+
+def get_db() -> DatabaseManager:
+    """
+    DatabaseManager de la sesión actual de Streamlit.
+    La conexión sobrevive a los reruns de la sesión, pero no se comparte entre
+    navegadores ni hilos: mysql.connector no es thread-safe y commit()/rollback()
+    afectarían el trabajo de otros usuarios.
+    """
+    if "db_manager" not in st.session_state:
+        st.session_state.db_manager = DatabaseManager()
+    return st.session_state.db_manager
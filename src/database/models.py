@@ -160,6 +160,18 @@ def init_database():
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         FOREIGN KEY (usuario_id) REFERENCES usuarios(user_id)
         )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS alertas_pendientes (
+        alerta_id INT AUTO_INCREMENT PRIMARY KEY,
+        clave VARCHAR(100) NOT NULL UNIQUE,
+        titulo VARCHAR(100) NOT NULL,
+        mensaje TEXT NOT NULL,
+        icono ENUM('success','error','warning','info') NOT NULL DEFAULT 'info',
+        visto BOOLEAN NOT NULL DEFAULT FALSE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        INDEX ix_alertas_visto (visto)
+        )
         """
     ]
 
@@ -169,6 +181,68 @@ def init_database():
             show_sweet_alert("Error de Conexión", db_manager.get_last_error(), "error")
             break
 
+    # Columnas agregadas después de la creación inicial
+    columnas = [
+        # Búsqueda exacta de nombre sin LOWER() sobre la columna (permite usar índice)
+        ("usuarios", "nombre_completo_lower",
+         "ALTER TABLE usuarios ADD COLUMN nombre_completo_lower VARCHAR(255) "
+         "GENERATED ALWAYS AS (LOWER(nombre_completo)) STORED"),
+    ]
+
+    if tables_created_successfully:
+        for tabla, columna, ddl in columnas:
+            check_col = db_manager.execute_query(
+                "SELECT COUNT(*) as count FROM INFORMATION_SCHEMA.COLUMNS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s",
+                (tabla, columna)
+            )
+            if check_col and check_col[0]['count'] == 0:
+                db_manager.execute_query(ddl, return_result=False)
+
+    # Índices de soporte (MySQL no admite CREATE INDEX IF NOT EXISTS)
+    indices = [
+        # Reportes "Libros más prestados" / "Usuarios con más préstamos"
+        ("prestamos", "ix_prestamos_fecha_libro",
+         "CREATE INDEX ix_prestamos_fecha_libro ON prestamos (fecha_prestamo, libro_id)"),
+        ("prestamos", "ix_prestamos_fecha_usuario",
+         "CREATE INDEX ix_prestamos_fecha_usuario ON prestamos (fecha_prestamo, usuario_id)"),
+        # Métricas de préstamos activos / atrasados
+        ("prestamos", "ix_prestamos_estado_fdevest",
+         "CREATE INDEX ix_prestamos_estado_fdevest ON prestamos (estado, fecha_devolucion_estimada)"),
+        # Búsqueda de libros reservables por título / ISBN / autor
+        ("libros", "ft_libros_titulo_isbn",
+         "CREATE FULLTEXT INDEX ft_libros_titulo_isbn ON libros (titulo, isbn)"),
+        ("autores", "ft_autores_nombre",
+         "CREATE FULLTEXT INDEX ft_autores_nombre ON autores (nombre_completo)"),
+        # Reservas pendientes por vencimiento / duplicados por usuario y libro
+        ("reservas", "ix_reservas_estado_exp",
+         "CREATE INDEX ix_reservas_estado_exp ON reservas (estado, fecha_expiracion)"),
+        ("reservas", "ix_reservas_user_libro_estado",
+         "CREATE INDEX ix_reservas_user_libro_estado ON reservas (usuario_id, libro_id, estado)"),
+        # Sanciones activas de un usuario
+        ("sanciones", "ix_sanciones_user_estado",
+         "CREATE INDEX ix_sanciones_user_estado ON sanciones (usuario_id, estado)"),
+        # Búsqueda de usuarios por subcadena de nombre / correo / código (parser ngram).
+        # Sin stopwords: con la lista por defecto el parser ngram descarta todo bigrama con "a" o "i".
+        ("usuarios", "ft_usuarios_search", (
+            "SET SESSION innodb_ft_enable_stopword = OFF",
+            "CREATE FULLTEXT INDEX ft_usuarios_search ON usuarios (nombre_completo, email, codigo_unt) WITH PARSER ngram",
+        )),
+        ("usuarios", "ix_usuarios_nombre_lower",
+         "CREATE INDEX ix_usuarios_nombre_lower ON usuarios (nombre_completo_lower)"),
+    ]
+
+    if tables_created_successfully:
+        for tabla, indice, ddl in indices:
+            check_idx = db_manager.execute_query(
+                "SELECT COUNT(*) as count FROM INFORMATION_SCHEMA.STATISTICS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s",
+                (tabla, indice)
+            )
+            if check_idx and check_idx[0]['count'] == 0:
+                for stmt in (ddl if isinstance(ddl, tuple) else (ddl,)):
+                    db_manager.execute_query(stmt, return_result=False)
+
     if tables_created_successfully:
         try:            
             # Insertar sedes
@@ -5,6 +5,9 @@
 # - registrar_devolucion(p_prestamo_id, p_estado_libro, p_observaciones)
 # - eliminar_prestamo_activo(p_prestamo_id)
 # - eliminar_libro_y_prestamos(p_libro_id)   
+# - crear_sancion(p_usuario_id, p_dias, p_motivo, p_monto)
+# Evento programado:
+# - expirar_reservas (cada minuto marca como 'expirada' las reservas vencidas)
 # ------------------------------------------------------------
 from src.database.database import DatabaseManager
 from src.utils.alert_utils import show_sweet_alert
@@ -387,6 +390,72 @@ def create_procedures() -> bool:
         END
         """)
 
+        # ============================== crear_sancion ============================
+        cur.execute("DROP PROCEDURE IF EXISTS crear_sancion")
+        cur.execute("""
+        CREATE PROCEDURE crear_sancion(
+            IN p_usuario_id INT,
+            IN p_dias INT,
+            IN p_motivo TEXT,
+            IN p_monto DECIMAL(10,2)
+        )
+        BEGIN
+            DECLARE v_inicio BIGINT;
+            DECLARE v_fin BIGINT;
+
+            DECLARE EXIT HANDLER FOR SQLEXCEPTION
+            BEGIN
+                ROLLBACK;
+                SIGNAL SQLSTATE '45000'
+                    SET MESSAGE_TEXT = 'Error creando la sanción';
+            END;
+
+            IF p_dias IS NULL OR p_dias <= 0 THEN
+                SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Los días de sanción deben ser mayores a 0';
+            END IF;
+
+            SET v_inicio = UNIX_TIMESTAMP();
+            SET v_fin = v_inicio + p_dias * 86400;
+
+            START TRANSACTION;
+
+                INSERT INTO sanciones (usuario_id, prestamo_id, fecha_inicio, fecha_fin, motivo, monto, estado)
+                VALUES (p_usuario_id, NULL, v_inicio, v_fin, p_motivo, COALESCE(p_monto, 0), 'activa');
+
+                UPDATE usuarios
+                   SET sancionado = TRUE,
+                       fecha_fin_sancion = v_fin
+                 WHERE user_id = p_usuario_id;
+
+            COMMIT;
+
+            SELECT LAST_INSERT_ID() AS sancion_id;
+        END
+        """)
+
+        # ============================== expirar_reservas (EVENT) ================
+        # Requiere privilegio EVENT y event_scheduler=ON. Si no se puede crear, todas las
+        # lecturas de reservas 'pendiente' filtran además por fecha_expiracion, y se avisa.
+        try:
+            cur.execute("DROP EVENT IF EXISTS expirar_reservas")
+            cur.execute("""
+            CREATE EVENT expirar_reservas
+                ON SCHEDULE EVERY 1 MINUTE
+                DO
+                    UPDATE reservas
+                       SET estado = 'expirada'
+                     WHERE estado = 'pendiente'
+                       AND fecha_expiracion < UNIX_TIMESTAMP()
+            """)
+            cur.execute("SET GLOBAL event_scheduler = ON")
+        except Exception as e:
+            show_sweet_alert(
+                "Aviso",
+                f"No se pudo programar la expiración automática de reservas (evento MySQL): {e}. "
+                "Las reservas vencidas se ocultan en las consultas, pero su estado no se actualiza.",
+                "warning"
+            )
+
         conn.commit()
         show_sweet_alert("Procedimientos listos", "Procedimientos almacenados creados/actualizados con éxito.", "success")
         return True
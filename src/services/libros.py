@@ -3,7 +3,7 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime
 from src.database.database import DatabaseManager
-from src.utils.image_manager import ImageManager
+from src.utils.image_manager import ImageManager, miniatura
 from src.utils.alert_utils import show_sweet_alert
 import os
 import re
@@ -116,7 +116,7 @@ def gestion_libros(db_manager, show_sweet_alert, user_role):
             for libro in libros_data:
                 col1, col2 = st.columns([1, 2])
                 with col1:
-                    st.image(libro['portada_id'] if libro['portada_id'] and os.path.exists(libro['portada_id']) else default_cover, width=100)
+                    st.image(miniatura(libro['portada_id']) if libro['portada_id'] and os.path.exists(libro['portada_id']) else default_cover, width=100)
                 with col2:
                     st.markdown(f"**Título:** {libro['titulo']}")
                     st.markdown(f"**Autor:** {libro['autor']}")
@@ -161,7 +161,7 @@ def gestion_libros(db_manager, show_sweet_alert, user_role):
                                     
                                     # ¿Reservas ACTIVAS?
                                     cnt_res = db_manager.execute_query(
-                                        "SELECT COUNT(*) AS c FROM reservas WHERE libro_id = %s AND estado = 'pendiente'",
+                                        "SELECT COUNT(*) AS c FROM reservas WHERE libro_id = %s AND estado = 'pendiente' AND fecha_expiracion >= UNIX_TIMESTAMP()",
                                         (libro['libro_id'],)
                                     )
                                     if cnt_res and int(cnt_res[0]['c']) > 0:
@@ -253,7 +253,7 @@ def gestion_libros(db_manager, show_sweet_alert, user_role):
                 st.subheader("Detalles del Libro")
                 col_img, col_info = st.columns([1, 2])
                 with col_img:
-                    st.image(libro['portada_id'] if libro['portada_id'] and os.path.exists(libro['portada_id']) else default_cover, width=200)
+                    st.image(miniatura(libro['portada_id']) if libro['portada_id'] and os.path.exists(libro['portada_id']) else default_cover, width=200)
                 with col_info:
                     st.write(f"**Título:** {libro['titulo']}")
                     st.write(f"**Autor:** {libro['autor']}")
@@ -370,7 +370,7 @@ def gestion_libros(db_manager, show_sweet_alert, user_role):
             st.subheader("Detalles del Libro")
             col_img, col_info = st.columns([1, 2])
             with col_img:
-                st.image(libro['portada_id'] if libro['portada_id'] and os.path.exists(libro['portada_id']) else default_cover, width=200)
+                st.image(miniatura(libro['portada_id']) if libro['portada_id'] and os.path.exists(libro['portada_id']) else default_cover, width=200)
             with col_info:
                 st.write(f"**Título:** {libro['titulo']}")
                 st.write(f"**Autor:** {libro['autor']}")
@@ -452,7 +452,8 @@ def gestion_libros(db_manager, show_sweet_alert, user_role):
                         )
                         show_sweet_alert("Éxito", "Libro agregado correctamente.", "success")
                     except Exception as e:
-                        if portada_file and portada_id != default_cover: image_manager.delete_image_by_path(portada_id)
+                        # El libro no llegó a insertarse: ninguna referencia en la BD es propia
+                        if portada_file and portada_id != default_cover: image_manager.delete_image_by_path(portada_id, propias=0)
                         show_sweet_alert("Error de Base de Datos", str(e), "error")
 
     # ========================
@@ -224,7 +224,8 @@ def perfil_usuario(db: DatabaseManager, user: dict, show_alert=show_sweet_alert)
         old = u.get("foto_perfil_id")
         cambios["foto_perfil_id"] = nueva_foto_path
 
-        if old and os.path.exists(old) and "default" not in os.path.basename(old).lower():
+        # Con nombres por contenido, volver a subir la misma foto da la misma ruta
+        if old and old != nueva_foto_path and os.path.exists(old) and "default" not in os.path.basename(old).lower():
             try:
                 img.delete_image_by_path(old)
             except Exception:
@@ -1,12 +1,18 @@
 # src/services/reportes.py - Reportes y estadísticas por rol 
 import os
-from typing import List, Dict, Tuple, Optional
+import json
+import hashlib
+from math import ceil
+from typing import Callable, List, Dict, Tuple, Optional
 import streamlit as st
+import numpy as np
 import pandas as pd
-from datetime import datetime, date, time as dt_time, timedelta
+import pyarrow as pa
+import pyarrow.compute as pc
+from datetime import datetime, date, timedelta
 from zoneinfo import ZoneInfo
 from pathlib import Path
-from src.database.database import DatabaseManager
+from src.database.database import DatabaseManager, get_db
 from src.utils.alert_utils import show_sweet_alert
 
 try:
@@ -14,7 +20,125 @@ try:
 except Exception:
     generar_reporte_pdf = None
 
+try:
+    import orjson
+except Exception:
+    orjson = None
+
 LIMA = ZoneInfo("America/Lima")
+_EPOCH = date(1970, 1, 1)
+_OFFSET = int(datetime.now(LIMA).utcoffset().total_seconds())  # Lima no usa horario de verano
+
+# Encabezados en español para las tablas de la UI
+_COLUMN_ES_MAP = {
+    # préstamos
+    "prestamo_id": "ID",
+    "titulo": "Título",
+    "autor": "Autor",
+    "usuario": "Usuario",
+    "role": "Rol",
+    "cantidad": "Cantidad",
+    "fecha_prestamo": "Fecha de préstamo",
+    "fecha_devolucion_estimada": "Devolución estimada",
+    "fecha_devolucion_real": "Devolución real",
+    "observaciones": "Observaciones",
+    "atrasado": "¿Atrasado?",
+    # libros / inventario
+    "libro_id": "ID Libro",
+    "editorial": "Editorial",
+    "isbn": "ISBN",
+    "categoria": "Categoría",
+    "ejemplares_disponibles": "Disponibles",
+    "ejemplares_totales": "Totales",
+    "prestados_activos": "Prestados activos",
+    "veces_prestado": "Veces prestado",
+    # sanciones
+    "sancion_id": "ID Sanción",
+    "motivo": "Motivo",
+    "monto": "Monto",
+    "fecha_inicio": "Inicio",
+    "fecha_fin": "Fin",
+    # reservas
+    "reserva_id": "ID Reserva",
+    "fecha_reserva": "Fecha de reserva",
+    "fecha_expiracion": "Expira",
+}
+
+_SI_NO_MAP = {1: "Sí", True: "Sí", 0: "No", False: "No"}
+
+# Valores cerrados (ENUM de la BD) traducidos una sola vez por categoría
+_ESTADO_ES = {e: e.capitalize() for e in (
+    "activo", "devuelto", "atrasado", "dañado", "perdido",      # préstamos
+    "activa", "pagada", "condonada",                            # sanciones
+    "pendiente", "completada", "cancelada", "expirada",         # reservas
+)}
+_ESTADO_CAT = pd.CategoricalDtype(list(_ESTADO_ES))
+_ROLE_ES = {r: r.capitalize() for r in ("estudiante", "docente", "bibliotecario", "admin")}
+_ROLE_CAT = pd.CategoricalDtype(list(_ROLE_ES))
+
+# A partir de este tamaño la tabla se formatea con pyarrow.compute
+_ARROW_MIN_ROWS = 2000
+
+# Reportes con historial sin tope: se paginan en el servidor
+_PAGE_SIZE = 100
+# Consultas base (sin LIMIT): la grilla pide una página y el PDF el reporte completo
+_SQL_PAGINADOS = {
+    "Préstamos devueltos": """
+        SELECT p.prestamo_id,
+               l.titulo,
+               a.nombre_completo AS autor,
+               u.nombre_completo AS usuario,
+               u.role,
+               p.cantidad,
+               p.fecha_prestamo,
+               p.fecha_devolucion_estimada,
+               p.fecha_devolucion_real,
+               p.estado,
+               COUNT(*) OVER() AS _total
+        FROM prestamos p
+        JOIN libros l   ON p.libro_id = l.libro_id
+        JOIN autores a  ON l.autor_id = a.autor_id
+        JOIN usuarios u ON p.usuario_id = u.user_id
+        WHERE p.estado IN ('devuelto','dañado','perdido')
+          AND p.fecha_devolucion_real BETWEEN %s AND %s
+        ORDER BY p.fecha_devolucion_real DESC
+    """,
+    "Sanciones aplicadas": """
+        SELECT s.sancion_id,
+               u.nombre_completo AS usuario,
+               u.role,
+               LEFT(s.motivo, 120) AS motivo,
+               s.monto,
+               s.estado,
+               s.fecha_inicio,
+               s.fecha_fin,
+               l.titulo AS libro,
+               COUNT(*) OVER() AS _total
+        FROM sanciones s
+        JOIN usuarios u ON s.usuario_id = u.user_id
+        LEFT JOIN prestamos p ON s.prestamo_id = p.prestamo_id
+        LEFT JOIN libros l     ON p.libro_id = l.libro_id
+        WHERE s.fecha_inicio BETWEEN %s AND %s
+        ORDER BY s.fecha_inicio DESC
+    """,
+    "Reservas activas": """
+        SELECT r.reserva_id,
+               l.titulo,
+               u.nombre_completo AS usuario,
+               u.role,
+               r.fecha_reserva,
+               r.fecha_expiracion,
+               r.estado,
+               COUNT(*) OVER() AS _total
+        FROM reservas r
+        JOIN libros l   ON r.libro_id = l.libro_id
+        JOIN usuarios u ON r.usuario_id = u.user_id
+        WHERE r.estado = 'pendiente'
+          AND r.fecha_expiracion >= UNIX_TIMESTAMP()
+          AND r.fecha_reserva BETWEEN %s AND %s
+        ORDER BY r.fecha_expiracion
+    """,
+}
 
 
 # ---------------------------
@@ -34,14 +158,25 @@ def _date_defaults() -> Tuple[date, date]:
 
 
 def _to_ts_range(d1: date, d2: date) -> Tuple[int, int]:
-    """Convierte fechas a epoch [00:00:00, 23:59:59]."""
-    if d1 > d2:
-        d1, d2 = d2, d1
-    start = int(datetime.combine(d1, dt_time.min).timestamp())
-    end = int(datetime.combine(d2, dt_time.max).timestamp())
+    """Convierte fechas a epoch [00:00:00, 23:59:59] (hora Lima) con aritmética entera."""
+    a, b = (d1, d2) if d1 <= d2 else (d2, d1)
+    start = (a - _EPOCH).days * 86400 - _OFFSET
+    end = (b - _EPOCH).days * 86400 + 86399 - _OFFSET
     return start, end
 
 
+def _marcar_atrasados(datos: List[Dict]) -> List[Dict]:
+    """Agrega 'atrasado' a cada fila con una sola comparación vectorizada contra la hora actual."""
+    if not datos:
+        return datos
+    now = int(datetime.now(tz=LIMA).timestamp())
+    estimadas = np.fromiter((r["fecha_devolucion_estimada"] for r in datos), dtype=np.int64, count=len(datos))
+    # Se guarda 0/1 y no bool: _SI_NO_MAP traduce enteros y el motor de PDF también los reconoce
+    for r, atrasado in zip(datos, (estimadas < now).astype(np.int8).tolist()):
+        r["atrasado"] = atrasado
+    return datos
+
+
 def _traducir_df(df: pd.DataFrame) -> pd.DataFrame:
     """
     Traduce encabezados y normaliza valores visibles en la UI sin afectar la BD.
@@ -50,53 +185,36 @@ def _traducir_df(df: pd.DataFrame) -> pd.DataFrame:
         return df
 
     if "atrasado" in df.columns:
-        df["atrasado"] = df["atrasado"].map({1: "Sí", True: "Sí", 0: "No", False: "No"}).fillna(df["atrasado"])
+        df["atrasado"] = df["atrasado"].map(_SI_NO_MAP).fillna(df["atrasado"])
 
     if "role" in df.columns:
-        df["role"] = df["role"].astype(str).str.capitalize()
+        df["role"] = df["role"].astype(_ROLE_CAT).cat.rename_categories(_ROLE_ES)
 
     if "estado" in df.columns:
-        df["estado"] = df["estado"].astype(str).str.capitalize()
-
-    mapping = {
-        # préstamos
-        "prestamo_id": "ID",
-        "titulo": "Título",
-        "autor": "Autor",
-        "usuario": "Usuario",
-        "role": "Rol",
-        "cantidad": "Cantidad",
-        "fecha_prestamo": "Fecha de préstamo",
-        "fecha_devolucion_estimada": "Devolución estimada",
-        "fecha_devolucion_real": "Devolución real",
-        "observaciones": "Observaciones",
-        "atrasado": "¿Atrasado?",
-        # libros / inventario
-        "libro_id": "ID Libro",
-        "editorial": "Editorial",
-        "isbn": "ISBN",
-        "categoria": "Categoría",
-        "ejemplares_disponibles": "Disponibles",
-        "ejemplares_totales": "Totales",
-        "prestados_activos": "Prestados activos",
-        "veces_prestado": "Veces prestado",
-        # sanciones
-        "sancion_id": "ID Sanción",
-        "motivo": "Motivo",
-        "monto": "Monto",
-        "fecha_inicio": "Inicio",
-        "fecha_fin": "Fin",
-        # reservas
-        "reserva_id": "ID Reserva",
-        "fecha_reserva": "Fecha de reserva",
-        "fecha_expiracion": "Expira",
-    }
-
-    rename_cols = {c: mapping[c] for c in df.columns if c in mapping}
-    if rename_cols:
-        df = df.rename(columns=rename_cols)
-
-    return df
+        df["estado"] = df["estado"].astype(_ESTADO_CAT).cat.rename_categories(_ESTADO_ES)
+
+    return df.rename(columns=_COLUMN_ES_MAP)
+
+
+def _es_epoch(col: str) -> bool:
+    return col.startswith("fecha_") or col.endswith("_ts") or col.endswith("_epoch")
+
+
+def _df_arrow(datos: List[Dict]) -> pd.DataFrame:
+    """
+    Reportes grandes: formatea fechas epoch y 'atrasado' con kernels de pyarrow.compute
+    sobre la tabla Arrow (una pasada por columna en C) antes de pasar a pandas.
+    """
+    table = pa.Table.from_pylist(datos)
+    for i, name in enumerate(table.column_names):
+        col = table.column(i)
+        if _es_epoch(name) and pa.types.is_integer(col.type):
+            ts = pc.cast(col, pa.timestamp("s", tz="America/Lima"))
+            txt = pc.fill_null(pc.strftime(ts, format="%d/%m/%Y %I:%M %p"), "-")
+            table = table.set_column(i, name, txt)
+        elif name == "atrasado":
+            table = table.set_column(i, name, pc.if_else(pc.cast(col, pa.bool_()), "Sí", "No"))
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
 
 
 def _mostrar_df(datos: List[Dict], formato_humano: bool = True):
@@ -105,70 +223,180 @@ def _mostrar_df(datos: List[Dict], formato_humano: bool = True):
         st.info("No hay datos para el periodo/criterio seleccionado.")
         return
 
-    df = pd.DataFrame(datos)
+    if formato_humano and len(datos) > _ARROW_MIN_ROWS:
+        df = _df_arrow(datos)
+    else:
+        df = pd.DataFrame(datos)
 
-    if formato_humano:
-        for col in df.columns:
-            if (col.startswith("fecha_") or col.endswith("_ts") or col.endswith("_epoch")) and df[col].notna().any():
-                try:
-                    df[col] = df[col].apply(_fmt12)
-                except Exception:
-                    pass
+        if formato_humano:
+            for col in df.columns:
+                if _es_epoch(col) and df[col].notna().any():
+                    try:
+                        df[col] = df[col].apply(_fmt12)
+                    except Exception:
+                        pass
 
     df = _traducir_df(df)
 
+    # Columnas de texto a string de Arrow: st.dataframe las serializa sin conversión por celda
+    str_cols = [c for c in df.select_dtypes(include="object").columns
+                if pd.api.types.infer_dtype(df[c], skipna=True) == "string"]
+    if str_cols:
+        df[str_cols] = df[str_cols].astype(pd.ArrowDtype(pa.string()))
+
     st.dataframe(df, use_container_width=True, hide_index=True)
     st.caption(f"{len(df)} registro(s)")
 
 
-def _boton_descarga_pdf(report_id: str, datos: List[Dict], titulo: str):
+def _pdf_bytes(report_id: str, datos: List[Dict], titulo: str) -> Tuple[bytes, str]:
+    """Ejecuta el generador de PDF y normaliza su retorno a (bytes, nombre de archivo)."""
+    res = generar_reporte_pdf(report_id, datos, titulo)
+
+    pdf_bytes: bytes
+    file_name: str = f"{report_id}.pdf"
+
+    if isinstance(res, bytes):
+        pdf_bytes = res
+
+    elif isinstance(res, (bytearray, memoryview)):
+        pdf_bytes = bytes(res)
+
+    elif hasattr(res, "read"):
+        try:
+            file_name = getattr(res, "name", file_name)
+        except Exception:
+            pass
+        pdf_bytes = res.read()
+
+    elif isinstance(res, (str, os.PathLike, Path)):
+        p = Path(res)
+        file_name = p.name or file_name
+        with open(p, "rb") as f:
+            pdf_bytes = f.read()
+
+    else:
+        raise TypeError(f"Tipo de retorno no soportado: {type(res)}. Retorna bytes, BytesIO o ruta.")
+
+    return pdf_bytes, file_name
+
+
+def _datos_digest(datos: List[Dict]) -> bytes:
+    """Huella del conjunto de filas para identificar el PDF en caché (orjson si está disponible)."""
+    if orjson is not None:
+        raw = orjson.dumps(datos, option=orjson.OPT_NON_STR_KEYS, default=str)
+    else:
+        raw = json.dumps(datos, default=str).encode("utf-8")
+    return hashlib.blake2b(raw, digest_size=16).digest()
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _pdf_cacheado(key: bytes, report_id: str, titulo: str, _datos: List[Dict]) -> Tuple[bytes, str]:
+    """PDF cacheado por huella de datos; `_datos` no se hashea (Streamlit ignora args con '_')."""
+    return _pdf_bytes(report_id, _datos, titulo)
+
+
+def _boton_descarga_pdf(report_id: str, datos: List[Dict], titulo: str,
+                        cargar: Optional[Callable[[], List[Dict]]] = None):
     """
-    Muestra directamente un st.download_button con el PDF listo.
-    (Genera el PDF y lo carga como bytes para evitar problemas de no-descarga.)
+    Descarga en dos pasos: el PDF solo se genera al pulsar "Preparar PDF" y se guarda
+    en session_state; si ya está listo se muestra el st.download_button con esos bytes.
+    `cargar` (reportes paginados) trae el reporte completo al pulsar, en lugar de la página visible.
     """
+    if not datos:
+        st.caption("Nada que descargar.")
+        return
+
     if generar_reporte_pdf is None:
         show_sweet_alert("PDF no disponible", "❌ No se encontró el generador de PDF.", "error")
         return
 
-    try:
-        res = generar_reporte_pdf(report_id, datos, titulo)
-
-        pdf_bytes: bytes
-        file_name: str = f"{report_id}.pdf"
+    state_key = f"pdf_{report_id}"
 
-        if isinstance(res, (bytes, bytearray)):
-            pdf_bytes = bytes(res)
-
-        elif hasattr(res, "read"):
-            try:
-                file_name = getattr(res, "name", file_name)
-            except Exception:
-                pass
-            pdf_bytes = res.read()
-
-        elif isinstance(res, (str, os.PathLike, Path)):
-            p = Path(res)
-            file_name = p.name or file_name
-            with open(p, "rb") as f:
-                pdf_bytes = f.read()
-
-        else:
-            raise TypeError(f"Tipo de retorno no soportado: {type(res)}. Retorna bytes, BytesIO o ruta.")
+    if st.button("Preparar PDF", key=f"prep_{report_id}"):
+        try:
+            filas = cargar() if cargar else datos
+            st.session_state[state_key] = _pdf_cacheado(_datos_digest(filas), report_id, titulo, filas)
+        except Exception as e:
+            show_sweet_alert("❌ Error al generar PDF", str(e), "error")
+            return
 
+    listo = st.session_state.get(state_key)
+    if listo:
+        pdf_bytes, file_name = listo
         st.download_button(
             label="Descargar PDF",
             data=pdf_bytes,
             file_name=file_name,
             mime="application/pdf",
-            key=f"dl_{report_id}_{len(datos)}_{abs(hash(titulo)) % 10000}"
+            key=f"dl_{report_id}"
         )
-    except Exception as e:
-        show_sweet_alert("❌ Error al generar PDF", str(e), "error")
+
+
+def _detalle_observaciones(db: DatabaseManager, datos: List[Dict]):
+    """Consulta bajo demanda las observaciones de un préstamo listado en el reporte."""
+    with st.expander("Ver observaciones de un préstamo"):
+        ids = [r["prestamo_id"] for r in datos]
+        prestamo_id = st.selectbox("Préstamo (ID)", ids, key="rep_obs_prestamo")
+        if st.button("Consultar", key="btn_rep_obs"):
+            r = db.execute_query(
+                "SELECT observaciones FROM prestamos WHERE prestamo_id=%s",
+                (int(prestamo_id),)
+            )
+            obs = r[0]["observaciones"] if r else None
+            st.write(obs or "Sin observaciones.")
+
+
+def _consultar_paginado(db: DatabaseManager, report_type: str, ts_ini: int, ts_fin: int,
+                        page: int) -> Tuple[List[Dict], int]:
+    """Ejecuta una página de un reporte paginado. Retorna (filas, total de registros)."""
+    datos = db.execute_query(
+        _SQL_PAGINADOS[report_type] + " LIMIT %s OFFSET %s",
+        (ts_ini, ts_fin, _PAGE_SIZE, (int(page) - 1) * _PAGE_SIZE),
+    ) or []
+    total = int(datos[0]["_total"]) if datos else 0
+    for r in datos:
+        r.pop("_total", None)
+    return datos, total
+
+
+def _consultar_completo(db: DatabaseManager, report_type: str, ts_ini: int, ts_fin: int) -> List[Dict]:
+    """Todas las filas de un reporte paginado (para el PDF); solo se ejecuta al preparar la descarga."""
+    datos = db.execute_query(_SQL_PAGINADOS[report_type], (ts_ini, ts_fin)) or []
+    for r in datos:
+        r.pop("_total", None)
+    return datos
+
+
+def _top_con_detalle(db: DatabaseManager, top: List[Dict], id_col: str, detalle_sql: str,
+                     orden: List[str]) -> List[Dict]:
+    """
+    Completa un ranking agrupado solo por ID con los datos de presentación de sus filas
+    (una consulta IN sobre los ganadores) y lo ordena por conteo desc / nombre asc.
+    """
+    if not top:
+        return []
+    ids = [r[id_col] for r in top]
+    detalle = db.execute_query(
+        detalle_sql.format(ids=", ".join(["%s"] * len(ids))),
+        tuple(ids),
+    ) or []
+    if not detalle:
+        return []
+    df = pd.merge(pd.DataFrame(detalle), pd.DataFrame(top), on=id_col)
+    df = df.sort_values(orden, ascending=[False, True])
+    return df.to_dict("records")
+
+
+def _guardar_reporte(state_key: str, report_id: str, **reporte):
+    """Guarda el último reporte generado y descarta el PDF preparado del anterior."""
+    st.session_state[state_key] = {"report_id": report_id, **reporte}
+    st.session_state.pop(f"pdf_{report_id}", None)
 
 
 # ---------------------------
 # VISTA: Admin / Bibliotecario
 # ---------------------------
+@st.fragment
 def _admin_biblio_view(db: DatabaseManager):
     st.subheader("Reportes y Estadísticas")
 
@@ -194,6 +422,7 @@ def _admin_biblio_view(db: DatabaseManager):
     if st.button("Generar", key="btn_rep_admin"):
         ts_ini, ts_fin = _to_ts_range(f_ini, f_fin)
         datos: List[Dict] = []
+        total: Optional[int] = None
         titulo = f"Reporte — {report_type}"
 
         if report_type == "Préstamos activos":
@@ -206,8 +435,7 @@ def _admin_biblio_view(db: DatabaseManager):
                        u.role,
                        p.cantidad,
                        p.fecha_prestamo,
-                       p.fecha_devolucion_estimada,
-                       (p.fecha_devolucion_estimada < UNIX_TIMESTAMP()) AS atrasado
+                       p.fecha_devolucion_estimada
                 FROM prestamos p
                 JOIN libros l   ON p.libro_id = l.libro_id
                 JOIN autores a  ON l.autor_id = a.autor_id
@@ -218,6 +446,7 @@ def _admin_biblio_view(db: DatabaseManager):
                 """,
                 (ts_ini, ts_fin),
             ) or []
+            _marcar_atrasados(datos)
 
         elif report_type == "Préstamos atrasados":
             datos = db.execute_query(
@@ -242,111 +471,61 @@ def _admin_biblio_view(db: DatabaseManager):
                 (ts_ini, ts_fin),
             ) or []
 
-        elif report_type == "Préstamos devueltos":
-            datos = db.execute_query(
+        elif report_type == "Libros más prestados":
+            top = db.execute_query(
                 """
-                SELECT p.prestamo_id,
-                       l.titulo,
-                       a.nombre_completo AS autor,
-                       u.nombre_completo AS usuario,
-                       u.role,
-                       p.cantidad,
-                       p.fecha_prestamo,
-                       p.fecha_devolucion_estimada,
-                       p.fecha_devolucion_real,
-                       p.estado,
-                       p.observaciones
-                FROM prestamos p
-                JOIN libros l   ON p.libro_id = l.libro_id
-                JOIN autores a  ON l.autor_id = a.autor_id
-                JOIN usuarios u ON p.usuario_id = u.user_id
-                WHERE p.estado IN ('devuelto','dañado','perdido')
-                  AND p.fecha_devolucion_real BETWEEN %s AND %s
-                ORDER BY p.fecha_devolucion_real DESC
+                SELECT libro_id, COUNT(*) AS veces_prestado
+                FROM prestamos
+                WHERE fecha_prestamo BETWEEN %s AND %s
+                GROUP BY libro_id
+                ORDER BY veces_prestado DESC
+                LIMIT 50
                 """,
                 (ts_ini, ts_fin),
             ) or []
-
-        elif report_type == "Libros más prestados":
-            datos = db.execute_query(
+            datos = _top_con_detalle(
+                db, top, "libro_id",
                 """
                 SELECT l.libro_id,
                        l.titulo,
                        a.nombre_completo AS autor,
                        l.editorial,
                        l.isbn,
-                       c.nombre AS categoria,
-                       COUNT(p.prestamo_id) AS veces_prestado
-                FROM prestamos p
-                JOIN libros l     ON p.libro_id = l.libro_id
+                       c.nombre AS categoria
+                FROM libros l
                 JOIN autores a    ON l.autor_id = a.autor_id
                 JOIN categorias c ON l.categoria_id = c.categoria_id
-                WHERE p.fecha_prestamo BETWEEN %s AND %s
-                GROUP BY l.libro_id, l.titulo, a.nombre_completo, l.editorial, l.isbn, c.nombre
-                ORDER BY veces_prestado DESC, l.titulo
-                LIMIT 50
+                WHERE l.libro_id IN ({ids})
                 """,
-                (ts_ini, ts_fin),
-            ) or []
+                orden=["veces_prestado", "titulo"],
+            )
 
         elif report_type == "Usuarios con más préstamos":
-            datos = db.execute_query(
+            top = db.execute_query(
                 """
-                SELECT u.user_id,
-                       u.nombre_completo AS usuario,
-                       u.role,
-                       COUNT(p.prestamo_id) AS prestamos
-                FROM prestamos p
-                JOIN usuarios u ON p.usuario_id = u.user_id
-                WHERE p.fecha_prestamo BETWEEN %s AND %s
-                GROUP BY u.user_id, u.nombre_completo, u.role
-                ORDER BY prestamos DESC, usuario
+                SELECT usuario_id AS user_id, COUNT(*) AS prestamos
+                FROM prestamos
+                WHERE fecha_prestamo BETWEEN %s AND %s
+                GROUP BY usuario_id
+                ORDER BY prestamos DESC
                 LIMIT 50
                 """,
                 (ts_ini, ts_fin),
             ) or []
-
-        elif report_type == "Sanciones aplicadas":
-            datos = db.execute_query(
+            datos = _top_con_detalle(
+                db, top, "user_id",
                 """
-                SELECT s.sancion_id,
-                       u.nombre_completo AS usuario,
-                       u.role,
-                       s.motivo,
-                       s.monto,
-                       s.estado,
-                       s.fecha_inicio,
-                       s.fecha_fin,
-                       l.titulo AS libro
-                FROM sanciones s
-                JOIN usuarios u ON s.usuario_id = u.user_id
-                LEFT JOIN prestamos p ON s.prestamo_id = p.prestamo_id
-                LEFT JOIN libros l     ON p.libro_id = l.libro_id
-                WHERE s.fecha_inicio BETWEEN %s AND %s
-                ORDER BY s.fecha_inicio DESC
+                SELECT user_id,
+                       nombre_completo AS usuario,
+                       role
+                FROM usuarios
+                WHERE user_id IN ({ids})
                 """,
-                (ts_ini, ts_fin),
-            ) or []
+                orden=["prestamos", "usuario"],
+            )
 
-        elif report_type == "Reservas activas":
-            datos = db.execute_query(
-                """
-                SELECT r.reserva_id,
-                       l.titulo,
-                       u.nombre_completo AS usuario,
-                       u.role,
-                       r.fecha_reserva,
-                       r.fecha_expiracion,
-                       r.estado
-                FROM reservas r
-                JOIN libros l   ON r.libro_id = l.libro_id
-                JOIN usuarios u ON r.usuario_id = u.user_id
-                WHERE r.estado = 'pendiente'
-                  AND r.fecha_reserva BETWEEN %s AND %s
-                ORDER BY r.fecha_expiracion
-                """,
-                (ts_ini, ts_fin),
-            ) or []
+        elif report_type in _SQL_PAGINADOS:
+            datos, total = _consultar_paginado(db, report_type, ts_ini, ts_fin, 1)
 
         elif report_type == "Inventario de libros":
             datos = db.execute_query(
@@ -371,123 +550,170 @@ def _admin_biblio_view(db: DatabaseManager):
                 """,
             ) or []
 
-        # Mostrar tabla traducida y botón de descarga PDF
-        _mostrar_df(datos, formato_humano=True)
-        _boton_descarga_pdf(report_type.lower().replace(" ", "_"), datos, titulo)
-
+        metricas = None
         if report_type in ("Préstamos activos", "Préstamos atrasados", "Préstamos devueltos"):
-            colm1, colm2, colm3 = st.columns(3)
             tot = db.execute_query(
                 "SELECT COUNT(*) AS c FROM prestamos WHERE fecha_prestamo BETWEEN %s AND %s",
                 (ts_ini, ts_fin)
             )[0]["c"]
-            colm1.metric("Préstamos (periodo)", tot)
             act = db.execute_query(
                 "SELECT COUNT(*) AS c FROM prestamos WHERE estado='activo'"
             )[0]["c"]
-            colm2.metric("Activos hoy", act)
             atr = db.execute_query(
                 "SELECT COUNT(*) AS c FROM prestamos WHERE estado='activo' AND fecha_devolucion_estimada < UNIX_TIMESTAMP()"
             )[0]["c"]
+            metricas = (tot, act, atr)
+
+        _guardar_reporte("rep_admin", report_type.lower().replace(" ", "_"),
+                         datos=datos, titulo=titulo, metricas=metricas,
+                         report_type=report_type, ts=(ts_ini, ts_fin), page=1, total=total)
+        st.session_state["rep_adm_page"] = 1
+
+    # Mostrar tabla traducida y botón de descarga PDF (persisten entre reruns)
+    rep = st.session_state.get("rep_admin")
+    if rep:
+        if rep["total"] is not None:
+            total_pages = max(1, ceil(rep["total"] / _PAGE_SIZE))
+            page = st.number_input("Página", min_value=1, max_value=total_pages, step=1, key="rep_adm_page")
+            if page != rep["page"]:
+                datos, total = _consultar_paginado(db, rep["report_type"], *rep["ts"], page)
+                rep.update(datos=datos, total=total, page=page)
+            st.caption(f"Página {rep['page']} de {total_pages} • {rep['total']} registros")
+
+        _mostrar_df(rep["datos"], formato_humano=True)
+        if rep["datos"]:
+            cargar = None
+            if rep["total"] is not None:
+                # El PDF exporta el reporte completo, no solo la página en pantalla
+                cargar = lambda: _consultar_completo(db, rep["report_type"], *rep["ts"])
+            _boton_descarga_pdf(rep["report_id"], rep["datos"], rep["titulo"], cargar)
+
+        if rep["report_id"] == "préstamos_devueltos" and rep["datos"]:
+            _detalle_observaciones(db, rep["datos"])
+
+        if rep["metricas"]:
+            tot, act, atr = rep["metricas"]
+            colm1, colm2, colm3 = st.columns(3)
+            colm1.metric("Préstamos (periodo)", tot)
+            colm2.metric("Activos hoy", act)
             colm3.metric("Atrasados hoy", atr)
 
 
 # ---------------------------
 # VISTA: Docente / Estudiante
 # ---------------------------
-def _usuario_view(db: DatabaseManager, user: Dict):
-    st.subheader("Mis reportes")
+@st.fragment
+def _mis_prestamos(db: DatabaseManager, user: Dict):
+    default_ini, default_fin = _date_defaults()
+    c1, c2 = st.columns(2)
+    with c1:
+        f_ini = st.date_input("Desde", value=default_ini, key="mis_prest_ini")
+    with c2:
+        f_fin = st.date_input("Hasta", value=default_fin, key="mis_prest_fin")
 
-    tab1, tab2 = st.tabs(["Mis préstamos", "Mis sanciones"])
+    filtro = st.radio("Tipo", ["Activos", "Historial"], horizontal=True)
 
-    # --- Mis préstamos ---
-    with tab1:
-        default_ini, default_fin = _date_defaults()
-        c1, c2 = st.columns(2)
-        with c1:
-            f_ini = st.date_input("Desde", value=default_ini, key="mis_prest_ini")
-        with c2:
-            f_fin = st.date_input("Hasta", value=default_fin, key="mis_prest_fin")
-
-        filtro = st.radio("Tipo", ["Activos", "Historial"], horizontal=True)
-
-        if st.button("Generar", key="btn_mis_prest"):
-            ts_ini, ts_fin = _to_ts_range(f_ini, f_fin)
-            datos: List[Dict] = []
-            titulo = f"Mis préstamos — {filtro}"
-
-            if filtro == "Activos":
-                datos = db.execute_query(
-                    """
-                    SELECT p.prestamo_id,
-                           l.titulo,
-                           p.cantidad,
-                           p.fecha_prestamo,
-                           p.fecha_devolucion_estimada,
-                           (p.fecha_devolucion_estimada < UNIX_TIMESTAMP()) AS atrasado
-                    FROM prestamos p
-                    JOIN libros l ON p.libro_id = l.libro_id
-                    WHERE p.usuario_id = %s
-                      AND p.estado = 'activo'
-                      AND p.fecha_prestamo BETWEEN %s AND %s
-                    ORDER BY p.fecha_devolucion_estimada
-                    """,
-                    (int(user["user_id"]), ts_ini, ts_fin),
-                ) or []
-            else:
-                datos = db.execute_query(
-                    """
-                    SELECT p.prestamo_id,
-                           l.titulo,
-                           p.cantidad,
-                           p.fecha_prestamo,
-                           p.fecha_devolucion_estimada,
-                           p.fecha_devolucion_real,
-                           p.estado
-                    FROM prestamos p
-                    JOIN libros l ON p.libro_id = l.libro_id
-                    WHERE p.usuario_id = %s
-                      AND p.estado IN ('devuelto','dañado','perdido')
-                      AND p.fecha_devolucion_real BETWEEN %s AND %s
-                    ORDER BY p.fecha_devolucion_real DESC
-                    """,
-                    (int(user["user_id"]), ts_ini, ts_fin),
-                ) or []
-
-            _mostrar_df(datos, formato_humano=True)
-            _boton_descarga_pdf("mis_prestamos", datos, titulo)
-
-    # --- Mis sanciones ---
-    with tab2:
-        default_ini, default_fin = _date_defaults()
-        c1, c2 = st.columns(2)
-        with c1:
-            f_ini = st.date_input("Desde", value=default_ini, key="mis_sanc_ini")
-        with c2:
-            f_fin = st.date_input("Hasta", value=default_fin, key="mis_sanc_fin")
-
-        if st.button("Generar", key="btn_mis_sanc"):
-            ts_ini, ts_fin = _to_ts_range(f_ini, f_fin)
+    if st.button("Generar", key="btn_mis_prest"):
+        ts_ini, ts_fin = _to_ts_range(f_ini, f_fin)
+        datos: List[Dict] = []
+        titulo = f"Mis préstamos — {filtro}"
+
+        if filtro == "Activos":
             datos = db.execute_query(
                 """
-                SELECT s.sancion_id,
-                       s.motivo,
-                       s.monto,
-                       s.estado,
-                       s.fecha_inicio,
-                       s.fecha_fin,
-                       l.titulo AS libro
-                FROM sanciones s
-                LEFT JOIN prestamos p ON s.prestamo_id = p.prestamo_id
-                LEFT JOIN libros l     ON p.libro_id = l.libro_id
-                WHERE s.usuario_id = %s
-                  AND s.fecha_inicio BETWEEN %s AND %s
-                ORDER BY s.fecha_inicio DESC
+                SELECT p.prestamo_id,
+                       l.titulo,
+                       p.cantidad,
+                       p.fecha_prestamo,
+                       p.fecha_devolucion_estimada
+                FROM prestamos p
+                JOIN libros l ON p.libro_id = l.libro_id
+                WHERE p.usuario_id = %s
+                  AND p.estado = 'activo'
+                  AND p.fecha_prestamo BETWEEN %s AND %s
+                ORDER BY p.fecha_devolucion_estimada
                 """,
                 (int(user["user_id"]), ts_ini, ts_fin),
             ) or []
-            _mostrar_df(datos, formato_humano=True)
-            _boton_descarga_pdf("mis_sanciones", datos, "Mis sanciones")
+            _marcar_atrasados(datos)
+        else:
+            datos = db.execute_query(
+                """
+                SELECT p.prestamo_id,
+                       l.titulo,
+                       p.cantidad,
+                       p.fecha_prestamo,
+                       p.fecha_devolucion_estimada,
+                       p.fecha_devolucion_real,
+                       p.estado
+                FROM prestamos p
+                JOIN libros l ON p.libro_id = l.libro_id
+                WHERE p.usuario_id = %s
+                  AND p.estado IN ('devuelto','dañado','perdido')
+                  AND p.fecha_devolucion_real BETWEEN %s AND %s
+                ORDER BY p.fecha_devolucion_real DESC
+                """,
+                (int(user["user_id"]), ts_ini, ts_fin),
+            ) or []
+
+        _guardar_reporte("rep_mis_prest", "mis_prestamos", datos=datos, titulo=titulo)
+
+    rep = st.session_state.get("rep_mis_prest")
+    if rep:
+        _mostrar_df(rep["datos"], formato_humano=True)
+        if rep["datos"]:
+            _boton_descarga_pdf(rep["report_id"], rep["datos"], rep["titulo"])
+
+
+@st.fragment
+def _mis_sanciones(db: DatabaseManager, user: Dict):
+    default_ini, default_fin = _date_defaults()
+    c1, c2 = st.columns(2)
+    with c1:
+        f_ini = st.date_input("Desde", value=default_ini, key="mis_sanc_ini")
+    with c2:
+        f_fin = st.date_input("Hasta", value=default_fin, key="mis_sanc_fin")
+
+    if st.button("Generar", key="btn_mis_sanc"):
+        ts_ini, ts_fin = _to_ts_range(f_ini, f_fin)
+        datos = db.execute_query(
+            """
+            SELECT s.sancion_id,
+                   s.motivo,
+                   s.monto,
+                   s.estado,
+                   s.fecha_inicio,
+                   s.fecha_fin,
+                   l.titulo AS libro
+            FROM sanciones s
+            LEFT JOIN prestamos p ON s.prestamo_id = p.prestamo_id
+            LEFT JOIN libros l     ON p.libro_id = l.libro_id
+            WHERE s.usuario_id = %s
+              AND s.fecha_inicio BETWEEN %s AND %s
+            ORDER BY s.fecha_inicio DESC
+            """,
+            (int(user["user_id"]), ts_ini, ts_fin),
+        ) or []
+        _guardar_reporte("rep_mis_sanc", "mis_sanciones", datos=datos, titulo="Mis sanciones")
+
+    rep = st.session_state.get("rep_mis_sanc")
+    if rep:
+        _mostrar_df(rep["datos"], formato_humano=True)
+        if rep["datos"]:
+            _boton_descarga_pdf(rep["report_id"], rep["datos"], rep["titulo"])
+
+
+def _usuario_view(db: DatabaseManager, user: Dict):
+    st.subheader("Mis reportes")
+
+    tab1, tab2 = st.tabs(["Mis préstamos", "Mis sanciones"])
+
+    # Cada pestaña es un fragmento: sus widgets solo re-ejecutan su propio cuerpo
+    with tab1:
+        _mis_prestamos(db, user)
+
+    with tab2:
+        _mis_sanciones(db, user)
 
 
 # ---------------------------
@@ -499,7 +725,7 @@ def gestion_reportes(db_manager: Optional[DatabaseManager] = None, user: Optiona
     - admin / bibliotecario: vista completa con tipos de reporte
     - docente / estudiante: vista personal (mis préstamos / mis sanciones)
     """
-    db = db_manager or DatabaseManager()
+    db = db_manager or get_db()
     role = (user or {}).get("role", "admin")
     if role in ("admin", "bibliotecario"):
         _admin_biblio_view(db)
@@ -1,26 +1,40 @@
 # src/services/reservas.py - Gestión de reservas 
 import os
+import re
+import base64
+import mimetypes
 from math import ceil
 from datetime import datetime, date, time as dt_time, timedelta
 from zoneinfo import ZoneInfo
 
+import pandas as pd
 import streamlit as st
 from src.database.database import DatabaseManager
 from src.utils.alert_utils import show_sweet_alert
+from src.utils.image_manager import miniatura
 
 LIMA = ZoneInfo("America/Lima")
+_COVER_DIRS = ("uploads", "assets")
+_FT_OPERADORES = re.compile(r'[+\-<>()~*"@]')
+_FT_MIN_TOKEN = 3  # innodb_ft_min_token_size por defecto
+_ACCIONES_PENDIENTES = ["—", "Entregar", "Cancelar"]
+_VISTAS_ADMIN = ["Reservas pendientes", "Crear reserva", "Historial reciente"]
 
 # ---------------------------
 # Helpers
 # ---------------------------
 
-def _fmt12(ts) -> str:
-    try:
-        return datetime.fromtimestamp(int(ts), tz=LIMA).strftime("%d/%m/%Y %I:%M %p")
-    except Exception:
-        return "-"
+def _sql_fmt12(col: str) -> str:
+    """Expresión SQL que formatea un epoch como 'DD/MM/YYYY hh:mm AM/PM' en hora de Lima (UTC-5, sin DST)."""
+    return (f"DATE_FORMAT('1970-01-01' + INTERVAL ({col} - 18000) SECOND, "
+            f"'%d/%m/%Y %h:%i %p')")
+
+
+def _now_ts() -> int:
+    return int(datetime.now(tz=LIMA).timestamp())
 
 
+@st.cache_resource
 def _default_cover_path():
     for p in ("assets/default_cover.jpg", "assets/default_cover.png", "default_cover.jpg", "default_cover.png"):
         if os.path.exists(p):
@@ -28,20 +42,46 @@ def _default_cover_path():
     return None
 
 
+@st.cache_resource(ttl=60, show_spinner=False)
+def _asset_index() -> dict:
+    """Índice {ruta: ruta} de las imágenes en disco, armado con un scandir por carpeta."""
+    index = {}
+    for folder in _COVER_DIRS:
+        try:
+            with os.scandir(folder) as it:
+                for entry in it:
+                    if entry.is_file():
+                        path = os.path.normpath(os.path.join(folder, entry.name))
+                        index[path] = path
+        except OSError:
+            continue
+    return index
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _portada_uri(path: str) -> str | None:
+    """data: URI de una portada local (ImageColumn no sirve archivos del disco). Recibe la miniatura, no el original."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    mime = mimetypes.guess_type(path)[0] or "image/jpeg"
+    return f"data:{mime};base64,{base64.b64encode(data).decode()}"
+
+
 def _paginador(total: int, key: str, default_size: int = 9, options=(6, 9, 12, 15)):
-    if f"{key}_page" not in st.session_state:
-        st.session_state[f"{key}_page"] = 0
-    if f"{key}_size" not in st.session_state:
-        st.session_state[f"{key}_size"] = default_size
+    page_key, size_key = f"{key}_page", f"{key}_size"
+    st.session_state.setdefault(page_key, 0)
+    st.session_state.setdefault(size_key, default_size)
 
     cols = st.columns([1, 3, 2, 1, 1])
     with cols[1]:
         size = st.selectbox("Tamaño de página", list(options), index=list(options).index(default_size), key=f"{key}_size_sel")
-        st.session_state[f"{key}_size"] = size
+        st.session_state[size_key] = size
 
-    size = st.session_state[f"{key}_size"]
     total_pages = max(1, ceil(total / size))
-    page = min(st.session_state[f"{key}_page"], total_pages - 1)
+    page = min(st.session_state[page_key], total_pages - 1)
 
     with cols[0]:
         if st.button("<< Anterior", disabled=(page <= 0), key=f"{key}_prev"):
@@ -52,7 +92,7 @@ def _paginador(total: int, key: str, default_size: int = 9, options=(6, 9, 12, 1
     with cols[2]:
         st.markdown(f"**Página {page + 1} de {total_pages}**")
 
-    st.session_state[f"{key}_page"] = page
+    st.session_state[page_key] = page
     return page, size, total_pages
 
 
@@ -65,39 +105,70 @@ def _en_horario_habil() -> bool:
 # Reglas de sanción
 # ---------------------------
 
-def _usuario_sancionado_vigente(db: DatabaseManager, user_id: int) -> bool:
-    r = db.execute_query(
+@st.cache_data(ttl=30, show_spinner=False)
+def _sanc_status_cached(_db: DatabaseManager, user_id: int) -> tuple[bool, int]:
+    """(sancionado, fecha_fin_sancion) del usuario; se reutiliza entre reruns cercanos."""
+    r = _db.execute_query(
         "SELECT sancionado, COALESCE(fecha_fin_sancion,0) AS fin FROM usuarios WHERE user_id=%s",
         (int(user_id),)
     )
     if not r:
-        return False
+        return False, 0
     sanc = bool(r[0]["sancionado"]) if isinstance(r[0]["sancionado"], (int, bool)) else str(r[0]["sancionado"]).lower() == 'true'
-    fin = int(r[0]["fin"] or 0)
-    now = int(datetime.now(tz=LIMA).timestamp())
-    return sanc and (fin == 0 or fin > now)
+    return sanc, int(r[0]["fin"] or 0)
+
+
+def invalidar_estado_sancion():
+    """Descarta el estado de sanción cacheado (llamar tras crear/finalizar sanciones)."""
+    _sanc_status_cached.clear()
+    _destinatarios_reserva.clear()
+
+
+def _usuario_sancionado_vigente(db: DatabaseManager, user_id: int) -> bool:
+    sanc, fin = _sanc_status_cached(db, int(user_id))
+    return sanc and (fin == 0 or fin > _now_ts())
 
 
 # ---------------------------
 # Libros reservables con paginación
 # ---------------------------
 
-def _contar_reservables(db: DatabaseManager, search: str) -> int:
-    q = """
+def _filtro_busqueda(search: str):
+    """(sql, params) del filtro de texto: FULLTEXT si hay términos indexables, LIKE si no."""
+    terms = [t for t in _FT_OPERADORES.sub(" ", search or "").split() if len(t) >= _FT_MIN_TOKEN]
+    if terms:
+        q = " ".join(f"+{t}*" for t in terms)
+        return (
+            "AND (MATCH(l.titulo, l.isbn) AGAINST(%s IN BOOLEAN MODE) "
+            "OR MATCH(a.nombre_completo) AGAINST(%s IN BOOLEAN MODE))",
+            (q, q),
+        )
+    if search:
+        like = f"%{search}%"
+        return "AND (l.titulo LIKE %s OR a.nombre_completo LIKE %s OR l.isbn LIKE %s)", (like, like, like)
+    return "", ()
+
+
+# Cacheados por (búsqueda, página): los reruns de Streamlit no repiten los LIKE+JOIN
+@st.cache_data(ttl=60, show_spinner=False)
+def _contar_reservables(_db: DatabaseManager, search: str) -> int:
+    filtro, params = _filtro_busqueda(search)
+    q = f"""
         SELECT COUNT(*) AS c
         FROM libros l
         JOIN autores a ON l.autor_id = a.autor_id
         WHERE l.activo = TRUE
           AND l.ejemplares_disponibles > 0
-          AND (l.titulo LIKE %s OR a.nombre_completo LIKE %s OR l.isbn LIKE %s)
+          {filtro}
     """
-    like = f"%{search or ''}%"
-    r = db.execute_query(q, (like, like, like))
+    r = _db.execute_query(q, params)
     return int(r[0]["c"]) if r else 0
 
 
-def _listar_reservables(db: DatabaseManager, search: str, limit: int, offset: int):
-    q = """
+@st.cache_data(ttl=60, show_spinner=False)
+def _listar_reservables(_db: DatabaseManager, search: str, limit: int, offset: int):
+    filtro, params = _filtro_busqueda(search)
+    q = f"""
         SELECT l.libro_id, l.titulo, l.editorial, l.anio_publicacion, l.isbn,
                a.nombre_completo AS autor, l.ejemplares_disponibles, l.ejemplares_totales,
                l.portada_id AS portada
@@ -105,12 +176,11 @@ def _listar_reservables(db: DatabaseManager, search: str, limit: int, offset: in
         JOIN autores a ON l.autor_id = a.autor_id
         WHERE l.activo = TRUE
           AND l.ejemplares_disponibles > 0
-          AND (l.titulo LIKE %s OR a.nombre_completo LIKE %s OR l.isbn LIKE %s)
+          {filtro}
         ORDER BY l.titulo
         LIMIT %s OFFSET %s
     """
-    like = f"%{search or ''}%"
-    return db.execute_query(q, (like, like, like, int(limit), int(offset))) or []
+    return _db.execute_query(q, (*params, int(limit), int(offset))) or []
 
 
 def _selector_libro_reserva(db: DatabaseManager, key_prefix: str):
@@ -131,40 +201,40 @@ def _selector_libro_reserva(db: DatabaseManager, key_prefix: str):
         st.info("No hay libros disponibles que coincidan con la búsqueda.")
         return None, None
 
+    covers = _asset_index()
+    fallback = _default_cover_path()
+
+    def _portada(lib):
+        path = covers.get(os.path.normpath(lib["portada"])) if lib.get("portada") else None
+        path = path or fallback
+        # Se embebe la miniatura: el original (hasta 2 MB) iría en base64 en cada página de la tabla
+        return _portada_uri(miniatura(path)) if path else None
+
+    # Una sola tabla con selección de fila en lugar de una grilla de tarjetas con botones
+    tabla = pd.DataFrame({
+        "Portada": [_portada(lib) for lib in libros],
+        "Título": [lib["titulo"] for lib in libros],
+        "Autor": [lib["autor"] for lib in libros],
+        "Editorial": [lib["editorial"] for lib in libros],
+        "Año": [lib["anio_publicacion"] for lib in libros],
+        "Disponibles": [f"{lib['ejemplares_disponibles']}/{lib['ejemplares_totales']}" for lib in libros],
+        "ISBN": [lib.get("isbn") or "-" for lib in libros],
+    })
+    evento = st.dataframe(
+        tabla,
+        column_config={"Portada": st.column_config.ImageColumn("Portada", width="small")},
+        hide_index=True,
+        use_container_width=True,
+        selection_mode="single-row",
+        on_select="rerun",
+        # La clave cambia con la página/búsqueda para no arrastrar la fila seleccionada
+        key=f"{key_prefix}_tabla_{page}_{size}_{search}",
+    )
+    if evento.selection.rows:
+        st.session_state[f"{key_prefix}_lib_sel"] = libros[evento.selection.rows[0]]["libro_id"]
+
     sel_id = st.session_state.get(f"{key_prefix}_lib_sel")
-    sel_row = None
-    cols_per_row = 3
-
-    for i in range(0, len(libros), cols_per_row):
-        row = st.columns(cols_per_row)
-        for j, col in enumerate(row):
-            if i + j >= len(libros):
-                break
-            lib = libros[i + j]
-            with col:
-                portada = lib.get("portada")
-                if portada and os.path.exists(portada):
-                    st.image(portada, width=140)
-                else:
-                    fallback = _default_cover_path()
-                    if fallback:
-                        st.image(fallback, width=140)
-                    else:
-                        st.caption("🖼️ Sin portada")
-
-                st.markdown(f"**{lib['titulo']}**")
-                st.caption(f"{lib['autor']} · {lib['editorial']} · {lib['anio_publicacion']}")
-                st.caption(f"Disponibles: {lib['ejemplares_disponibles']}/{lib['ejemplares_totales']} · ISBN: {lib.get('isbn', '-')}")
-                if st.button("Seleccionar", key=f"{key_prefix}_lib_{lib['libro_id']}"):
-                    st.session_state[f"{key_prefix}_lib_sel"] = lib["libro_id"]
-                    sel_id = lib["libro_id"]
-                    sel_row = lib
-
-    if sel_id and not sel_row:
-        for lib in libros:
-            if lib["libro_id"] == sel_id:
-                sel_row = lib
-                break
+    sel_row = next((lib for lib in libros if lib["libro_id"] == sel_id), None)
     if sel_id:
         st.success(f"Libro seleccionado: #{sel_id}")
 
@@ -178,73 +248,61 @@ def _selector_libro_reserva(db: DatabaseManager, key_prefix: str):
 # Reglas y acciones de reservas
 # ---------------------------
 
-def _actualizar_expiradas(db: DatabaseManager):
-    db.execute_query(
-        "UPDATE reservas SET estado='expirada' "
-        "WHERE estado='pendiente' AND fecha_expiracion < UNIX_TIMESTAMP()",
-        return_result=False
-    )
-
-
-def _dias_exp(db: DatabaseManager) -> int:
-    r = db.execute_query("SELECT valor FROM configuracion WHERE parametro='dias_reserva_expiracion'")
+@st.cache_data(ttl=600, show_spinner=False)
+def _dias_exp(_db: DatabaseManager) -> int:
+    # El parámetro de configuración cambia rara vez; se cachea para no consultarlo en cada reserva
+    r = _db.execute_query("SELECT valor FROM configuracion WHERE parametro='dias_reserva_expiracion'")
     try:
         return int((r[0]["valor"] if r else "2") or "2")
     except Exception:
         return 2
 
 
-def _hay_cupo_reserva(db: DatabaseManager, libro_id: int) -> bool:
-    """Cupo = disponibles - reservas pendientes (no vencidas) > 0"""
-    r1 = db.execute_query("SELECT ejemplares_disponibles AS d FROM libros WHERE libro_id=%s AND activo=TRUE", (libro_id,))
-    if not r1 or int(r1[0]["d"]) <= 0:
-        return False
-    r2 = db.execute_query(
-        "SELECT COUNT(*) AS c FROM reservas WHERE libro_id=%s AND estado='pendiente' AND fecha_expiracion >= UNIX_TIMESTAMP()",
-        (libro_id,)
-    )
-    disponibles = int(r1[0]["d"])
-    pendientes = int(r2[0]["c"]) if r2 else 0
-    return (disponibles - pendientes) > 0
-
-
 def _crear_reserva(db: DatabaseManager, libro_id: int, usuario_id: int) -> tuple[bool, str]:
-    # Solo estudiante/docente y activos
-    u = db.execute_query(
-        "SELECT role, activo, sancionado, COALESCE(fecha_fin_sancion,0) AS fin_sanc "
-        "FROM usuarios WHERE user_id=%s", (usuario_id,)
+    now_ts = _now_ts()
+    # Todas las validaciones en un solo viaje a la BD
+    r = db.execute_query(
+        """
+        SELECT u.role, u.activo, u.sancionado, COALESCE(u.fecha_fin_sancion,0) AS fin_sanc,
+               l.activo AS libro_activo,
+               COALESCE(l.ejemplares_disponibles,0) AS disp,
+               (SELECT COUNT(*) FROM reservas
+                 WHERE libro_id=l.libro_id AND estado='pendiente' AND fecha_expiracion >= %s) AS pend,
+               EXISTS(SELECT 1 FROM prestamos
+                       WHERE usuario_id=u.user_id AND libro_id=l.libro_id AND estado='activo') AS dup_p,
+               EXISTS(SELECT 1 FROM reservas
+                       WHERE usuario_id=u.user_id AND libro_id=l.libro_id AND estado='pendiente'
+                         AND fecha_expiracion >= %s) AS dup_r
+        FROM usuarios u
+        LEFT JOIN libros l ON l.libro_id = %s
+        WHERE u.user_id = %s
+        """,
+        (now_ts, now_ts, libro_id, usuario_id)
     )
-    if not u or not u[0]["activo"]:
+    # Solo estudiante/docente y activos
+    if not r or not r[0]["activo"]:
         return False, "Usuario no encontrado o inactivo"
-    if u[0]["role"] not in ("estudiante", "docente"):
+    v = r[0]
+    if v["role"] not in ("estudiante", "docente"):
         return False, "Solo docentes o estudiantes pueden reservar"
     # Bloqueo por sanción vigente
-    if u[0]["sancionado"] and (int(u[0]["fin_sanc"]) == 0 or int(u[0]["fin_sanc"]) > int(datetime.now(tz=LIMA).timestamp())):
+    if v["sancionado"] and (int(v["fin_sanc"]) == 0 or int(v["fin_sanc"]) > now_ts):
         return False, "Usuario con sanción vigente"
 
     # Libro activo y con cupo
-    l = db.execute_query("SELECT activo FROM libros WHERE libro_id=%s", (libro_id,))
-    if not l or not l[0]["activo"]:
+    if not v["libro_activo"]:
         return False, "Libro no encontrado o inactivo"
 
-    if not _hay_cupo_reserva(db, libro_id):
+    disp = int(v["disp"])
+    if disp <= 0 or (disp - int(v["pend"])) <= 0:
         return False, "No hay cupo de reserva para este libro"
 
     # Sin préstamo activo de ese libro
-    dup_prest = db.execute_query(
-        "SELECT 1 FROM prestamos WHERE usuario_id=%s AND libro_id=%s AND estado='activo' LIMIT 1",
-        (usuario_id, libro_id)
-    )
-    if dup_prest:
+    if v["dup_p"]:
         return False, "Ya existe un préstamo activo de este libro para el usuario"
 
     # Sin reserva pendiente duplicada
-    dup_res = db.execute_query(
-        "SELECT 1 FROM reservas WHERE usuario_id=%s AND libro_id=%s AND estado='pendiente' "
-        "AND fecha_expiracion >= UNIX_TIMESTAMP() LIMIT 1",
-        (usuario_id, libro_id)
-    )
-    if dup_res:
+    if v["dup_r"]:
         return False, "Ya existe una reserva pendiente para este libro"
 
     # Crear
@@ -262,123 +320,179 @@ def _crear_reserva(db: DatabaseManager, libro_id: int, usuario_id: int) -> tuple
 # Vistas: Admin/Bibliotecario
 # ---------------------------
 
-def _vista_admin_biblio(db: DatabaseManager, user: dict):
-    st.subheader("Gestión de Reservas")
-    _actualizar_expiradas(db)
+@st.fragment
+def _pendientes_fragment(db: DatabaseManager, user: dict):
+    now_ts = _now_ts()
+    r = db.execute_query(
+        f"""
+        SELECT r.reserva_id, r.libro_id, l.titulo,
+               u.user_id, u.nombre_completo AS usuario, u.role,
+               r.fecha_reserva, r.fecha_expiracion,
+               {_sql_fmt12("r.fecha_reserva")} AS fecha_reserva_str,
+               {_sql_fmt12("r.fecha_expiracion")} AS fecha_expiracion_str,
+               u.sancionado, COALESCE(u.fecha_fin_sancion,0) AS fin_sanc,
+               %s AS now_ts
+        FROM reservas r
+        JOIN libros l   ON r.libro_id = l.libro_id
+        JOIN usuarios u ON r.usuario_id = u.user_id
+        WHERE r.estado='pendiente' AND r.fecha_expiracion >= %s
+        ORDER BY r.fecha_expiracion
+        """,
+        (now_ts, now_ts)
+    ) or []
+    if not r:
+        st.info("No hay reservas pendientes.")
+        return
+
+    en_horario = _en_horario_habil()
+    bloqueos = {}
+    for row in r:
+        # Estado de sanción ya viene en la fila (evita una consulta por reserva)
+        fin_sanc = int(row["fin_sanc"] or 0)
+        if bool(row["sancionado"]) and (fin_sanc == 0 or fin_sanc > int(row["now_ts"])):
+            bloqueos[row["reserva_id"]] = "Sanción vigente"
+        elif not en_horario:
+            bloqueos[row["reserva_id"]] = "Fuera de horario"
+
+    # Una sola grilla editable con columna de acción en lugar de 2 botones por fila
+    tabla = pd.DataFrame({
+        "ID": [row["reserva_id"] for row in r],
+        "Libro": [row["titulo"] for row in r],
+        "Usuario (Rol)": [f"{row['usuario']} ({row['role']})" for row in r],
+        "Reservado": [row["fecha_reserva_str"] for row in r],
+        "Expira": [row["fecha_expiracion_str"] for row in r],
+        "Observación": [bloqueos.get(row["reserva_id"], "") for row in r],
+        "Acción": ["—"] * len(r),
+    })
+    editada = st.data_editor(
+        tabla,
+        column_config={
+            "Acción": st.column_config.SelectboxColumn("Acción", options=_ACCIONES_PENDIENTES, required=True),
+        },
+        disabled=[c for c in tabla.columns if c != "Acción"],
+        hide_index=True,
+        use_container_width=True,
+        key="res_pend_editor",
+    )
 
-    tabs = st.tabs(["Reservas pendientes", "Crear reserva", "Historial reciente"])
+    if st.button("Aplicar acciones", key="res_pend_aplicar"):
+        filas = {int(row["reserva_id"]): row for row in r}
+        nuevos_estados: dict[int, str] = {}
+        errores = []
+        for rid, accion in zip(editada["ID"], editada["Acción"]):
+            rid, row = int(rid), filas[int(rid)]
+            if accion == "Entregar":
+                # Entregar -> convierte en préstamo (cantidad 1), operador = user actual
+                if rid in bloqueos:
+                    errores.append(f"#{rid}: {bloqueos[rid]}")
+                    continue
+                res = db.call_procedure(
+                    "registrar_prestamo",
+                    [int(row["libro_id"]), int(row["user_id"]), int(user["user_id"]), 1]
+                )
+                if isinstance(res, dict) and res.get("error"):
+                    errores.append(f"#{rid}: " + str(res["error"]).split(": ", 1)[-1])
+                elif res:
+                    nuevos_estados[rid] = "completada"
+                else:
+                    errores.append(f"#{rid}: No se pudo completar la operación.")
+            elif accion == "Cancelar":
+                nuevos_estados[rid] = "cancelada"
+
+        if nuevos_estados:
+            # Un único UPDATE para todas las filas procesadas
+            casos = " ".join(["WHEN %s THEN %s"] * len(nuevos_estados))
+            marcas = ", ".join(["%s"] * len(nuevos_estados))
+            params = [v for par in nuevos_estados.items() for v in par] + list(nuevos_estados)
+            db.execute_query(
+                f"UPDATE reservas SET estado = CASE reserva_id {casos} END WHERE reserva_id IN ({marcas})",
+                tuple(params),
+                return_result=False
+            )
+            if "completada" in nuevos_estados.values():
+                # El préstamo cambia los disponibles: invalidar el catálogo cacheado
+                _contar_reservables.clear()
+                _listar_reservables.clear()
+
+        if errores:
+            show_sweet_alert("Atención", "No se procesaron: " + "; ".join(errores), "warning")
+        elif nuevos_estados:
+            show_sweet_alert("Listo", f"{len(nuevos_estados)} reserva(s) actualizada(s).", "success")
+        if nuevos_estados:
+            # Las filas cambiaron: descartar las ediciones previas de la grilla
+            st.session_state.pop("res_pend_editor", None)
+            st.rerun(scope="fragment")
+
+
+@st.cache_data(ttl=120, show_spinner=False)
+def _destinatarios_reserva(_db: DatabaseManager) -> list[tuple[int, str]]:
+    """(user_id, etiqueta) de docentes/estudiantes activos y validados SIN sanción vigente."""
+    usuarios = _db.execute_query(
+        "SELECT user_id, nombre_completo, role "
+        "FROM usuarios "
+        "WHERE activo=TRUE AND validado=TRUE AND role IN ('docente','estudiante') "
+        "AND NOT (sancionado = TRUE AND (fecha_fin_sancion IS NULL OR fecha_fin_sancion > %s)) "
+        "ORDER BY nombre_completo",
+        (_now_ts(),)
+    ) or []
+    return [(u["user_id"], f"{u['nombre_completo']} — {u['role']}") for u in usuarios]
+
+
+@st.fragment
+def _crear_reserva_fragment(db: DatabaseManager):
+    st.caption("Crear reserva en nombre de un docente o estudiante.")
+    lib_id, lib_row = _selector_libro_reserva(db, key_prefix="adm_res")
+    # selector usuario permitido (SIN sanción vigente)
+    usuarios = _destinatarios_reserva(db)
+    destinatario_id = None
+    if not usuarios:
+        st.info("No hay usuarios válidos para reservar (sin sanción vigente).")
+    else:
+        idx = st.selectbox("Usuario", range(len(usuarios)), format_func=lambda i: usuarios[i][1], key="adm_res_usr")
+        destinatario_id = usuarios[idx][0]
 
-    # Pendientes
-    with tabs[0]:
-        r = db.execute_query(
-            """
-            SELECT r.reserva_id, r.libro_id, l.titulo,
-                   u.user_id, u.nombre_completo AS usuario, u.role,
-                   r.fecha_reserva, r.fecha_expiracion,
-                   (r.fecha_expiracion < UNIX_TIMESTAMP()) AS expirada
-            FROM reservas r
-            JOIN libros l   ON r.libro_id = l.libro_id
-            JOIN usuarios u ON r.usuario_id = u.user_id
-            WHERE r.estado='pendiente'
-            ORDER BY r.fecha_expiracion
-            """
-        ) or []
-        if not r:
-            st.info("No hay reservas pendientes.")
+    bloqueado = bool(destinatario_id and _usuario_sancionado_vigente(db, destinatario_id))
+    if bloqueado:
+        st.error("El usuario tiene una sanción vigente. No se pueden crear reservas.")
+
+    if st.button("Reservar", disabled=not (lib_id and destinatario_id) or bloqueado):
+        ok, msg = _crear_reserva(db, int(lib_id), int(destinatario_id))
+        if ok:
+            show_sweet_alert("Éxito", msg, "success"); st.rerun()
         else:
-            head = st.columns([1, 3, 3, 2, 2, 2])
-            head[0].markdown("**ID**")
-            head[1].markdown("**Libro**")
-            head[2].markdown("**Usuario (Rol)**")
-            head[3].markdown("**Reservado**")
-            head[4].markdown("**Expira**")
-            head[5].markdown("**Acciones**")
+            show_sweet_alert("No permitido", msg, "error")
 
-            for row in r:
-                c = st.columns([1, 3, 3, 2, 2, 2])
-                c[0].markdown(f"**{row['reserva_id']}**")
-                c[1].markdown(row["titulo"])
-                c[2].markdown(f"{row['usuario']} ({row['role']})")
-                c[3].markdown(_fmt12(row["fecha_reserva"]))
-                c[4].markdown(_fmt12(row["fecha_expiracion"]))
-
-                with c[5]:
-                    # Entregar -> convierte en préstamo (cantidad 1), operador = user actual
-                    sanc_bloq = _usuario_sancionado_vigente(db, int(row['user_id']))
-                    entregar_dis = (not _en_horario_habil()) or bool(row["expirada"]) or sanc_bloq
-                    if sanc_bloq:
-                        st.warning("El usuario tiene sanción vigente; no se puede entregar.")
-
-                    if st.button("Entregar", key=f"ent_{row['reserva_id']}", disabled=entregar_dis):
-                        res = db.call_procedure(
-                            "registrar_prestamo",
-                            [int(row["libro_id"]), int(row["user_id"]), int(user["user_id"]), 1]
-                        )
-                        if isinstance(res, dict) and res.get("error"):
-                            show_sweet_alert("Error", str(res["error"]).split(": ", 1)[-1], "error")
-                        elif res:
-                            db.execute_query(
-                                "UPDATE reservas SET estado='completada' WHERE reserva_id=%s",
-                                (int(row["reserva_id"]),),
-                                return_result=False
-                            )
-                            show_sweet_alert("Éxito", "Préstamo registrado desde reserva.", "success")
-                            st.rerun()
-                        else:
-                            show_sweet_alert("Error", "No se pudo completar la operación.", "error")
-
-                    if st.button("Cancelar", key=f"can_{row['reserva_id']}", disabled=bool(row["expirada"])):
-                        db.execute_query(
-                            "UPDATE reservas SET estado='cancelada' WHERE reserva_id=%s",
-                            (int(row["reserva_id"]),),
-                            return_result=False
-                        )
-                        show_sweet_alert("Listo", "Reserva cancelada.", "success")
-                        st.rerun()
 
-    # Crear reserva para un usuario (docente/estudiante)
-    with tabs[1]:
-        st.caption("Crear reserva en nombre de un docente o estudiante.")
-        lib_id, lib_row = _selector_libro_reserva(db, key_prefix="adm_res")
-        # selector usuario permitido (SIN sanción vigente)
-        usuarios = db.execute_query(
-            "SELECT user_id, nombre_completo, role, sancionado, COALESCE(fecha_fin_sancion,0) AS fin "
-            "FROM usuarios "
-            "WHERE activo=TRUE AND validado=TRUE AND role IN ('docente','estudiante') "
-            "AND NOT (sancionado = TRUE AND (fecha_fin_sancion IS NULL OR fecha_fin_sancion > UNIX_TIMESTAMP())) "
-            "ORDER BY nombre_completo"
-        ) or []
-        destinatario_id = None
-        if not usuarios:
-            st.info("No hay usuarios válidos para reservar (sin sanción vigente).")
-        else:
-            etiquetas = [f"{u['nombre_completo']} — {u['role']}" for u in usuarios]
-            idx = st.selectbox("Usuario", range(len(etiquetas)), format_func=lambda i: etiquetas[i], key="adm_res_usr")
-            destinatario_id = usuarios[idx]["user_id"]
+def _vista_admin_biblio(db: DatabaseManager, user: dict):
+    st.subheader("Gestión de Reservas")
 
-        bloqueado = bool(destinatario_id and _usuario_sancionado_vigente(db, destinatario_id))
-        if bloqueado:
-            st.error("El usuario tiene una sanción vigente. No se pueden crear reservas.")
+    # st.tabs ejecuta las tres pestañas en cada rerun; con un radio solo corre la vista elegida
+    vista = st.radio("Vista", _VISTAS_ADMIN, horizontal=True, key="adm_res_vista",
+                     label_visibility="collapsed")
 
-        if st.button("Reservar", disabled=not (lib_id and destinatario_id) or bloqueado):
-            ok, msg = _crear_reserva(db, int(lib_id), int(destinatario_id))
-            if ok:
-                show_sweet_alert("Éxito", msg, "success"); st.rerun()
-            else:
-                show_sweet_alert("No permitido", msg, "error")
+    if vista == "Reservas pendientes":
+        _pendientes_fragment(db, user)
+
+    # Crear reserva para un usuario (docente/estudiante)
+    elif vista == "Crear reserva":
+        _crear_reserva_fragment(db)
 
     # Historial
-    with tabs[2]:
+    else:
         rows = db.execute_query(
-            """
+            f"""
             SELECT r.reserva_id, l.titulo, u.nombre_completo AS usuario, u.role,
-                   r.fecha_reserva, r.fecha_expiracion, r.estado
+                   {_sql_fmt12("r.fecha_reserva")} AS fecha_reserva_str,
+                   {_sql_fmt12("r.fecha_expiracion")} AS fecha_expiracion_str,
+                   CASE WHEN r.estado='pendiente' AND r.fecha_expiracion < %s
+                        THEN 'expirada' ELSE r.estado END AS estado
             FROM reservas r
             JOIN libros l   ON r.libro_id = l.libro_id
             JOIN usuarios u ON r.usuario_id = u.user_id
             ORDER BY r.fecha_reserva DESC
             LIMIT 200
-            """
+            """,
+            (_now_ts(),)
         ) or []
         if not rows:
             st.info("No hay historial por mostrar.")
@@ -386,7 +500,7 @@ def _vista_admin_biblio(db: DatabaseManager, user: dict):
             for row in rows:
                 st.write(
                     f"#{row['reserva_id']} • {row['titulo']} • {row['usuario']} ({row['role']}) — "
-                    f"Reserva: {_fmt12(row['fecha_reserva'])} • Expira: {_fmt12(row['fecha_expiracion'])} • "
+                    f"Reserva: {row['fecha_reserva_str']} • Expira: {row['fecha_expiracion_str']} • "
                     f"Estado: {row['estado'].capitalize()}"
                 )
 
@@ -395,9 +509,21 @@ def _vista_admin_biblio(db: DatabaseManager, user: dict):
 # Vistas: Docente/Estudiante
 # ---------------------------
 
+@st.fragment
+def _reservar_fragment(db: DatabaseManager, user: dict, sanc_bloq: bool):
+    lib_id, _ = _selector_libro_reserva(db, key_prefix=f"user{user['user_id']}")
+    if sanc_bloq:
+        st.warning("Tienes una sanción activa. No puedes realizar reservas.")
+    if st.button("Reservar", disabled=not bool(lib_id) or sanc_bloq):
+        ok, msg = _crear_reserva(db, int(lib_id), int(user["user_id"]))
+        if ok:
+            show_sweet_alert("Éxito", msg, "success"); st.rerun()
+        else:
+            show_sweet_alert("No permitido", msg, "error")
+
+
 def _vista_usuario(db: DatabaseManager, user: dict):
     st.subheader("Mis Reservas")
-    _actualizar_expiradas(db)
 
     # Chequeo de sanción activa — deshabilita reservar
     sanc_bloq = _usuario_sancionado_vigente(db, int(user["user_id"]))
@@ -406,27 +532,23 @@ def _vista_usuario(db: DatabaseManager, user: dict):
 
     # Reservar libro
     with tab1:
-        lib_id, _ = _selector_libro_reserva(db, key_prefix=f"user{user['user_id']}")
-        if sanc_bloq:
-            st.warning("Tienes una sanción activa. No puedes realizar reservas.")
-        if st.button("Reservar", disabled=not bool(lib_id) or sanc_bloq):
-            ok, msg = _crear_reserva(db, int(lib_id), int(user["user_id"]))
-            if ok:
-                show_sweet_alert("Éxito", msg, "success"); st.rerun()
-            else:
-                show_sweet_alert("No permitido", msg, "error")
+        _reservar_fragment(db, user, sanc_bloq)
 
     # Mis reservas
     with tab2:
         r = db.execute_query(
-            """
-            SELECT r.reserva_id, l.titulo, r.fecha_reserva, r.fecha_expiracion, r.estado
+            f"""
+            SELECT r.reserva_id, l.titulo,
+                   {_sql_fmt12("r.fecha_reserva")} AS fecha_reserva_str,
+                   {_sql_fmt12("r.fecha_expiracion")} AS fecha_expiracion_str,
+                   CASE WHEN r.estado='pendiente' AND r.fecha_expiracion < %s
+                        THEN 'expirada' ELSE r.estado END AS estado
             FROM reservas r
             JOIN libros l ON r.libro_id = l.libro_id
             WHERE r.usuario_id=%s
             ORDER BY r.fecha_reserva DESC
             """,
-            (user["user_id"],)
+            (_now_ts(), user["user_id"])
         ) or []
         if not r:
             st.info("No tienes reservas registradas.")
@@ -434,7 +556,7 @@ def _vista_usuario(db: DatabaseManager, user: dict):
             for row in r:
                 st.write(
                     f"#{row['reserva_id']} • {row['titulo']} — "
-                    f"Reserva: {_fmt12(row['fecha_reserva'])} • Expira: {_fmt12(row['fecha_expiracion'])} • "
+                    f"Reserva: {row['fecha_reserva_str']} • Expira: {row['fecha_expiracion_str']} • "
                     f"Estado: {row['estado'].capitalize()}"
                 )
 
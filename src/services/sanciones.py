@@ -1,40 +1,36 @@
 # src/services/sanciones.py - Gestión simple de sanciones por rol (actualizado con paginación)
 import streamlit as st
 import pandas as pd
-from datetime import datetime
 from zoneinfo import ZoneInfo
 
 from src.database.database import DatabaseManager
 from src.utils.alert_utils import show_sweet_alert
+from src.services.reservas import invalidar_estado_sancion
 
 LIMA = ZoneInfo("America/Lima")
 
-def _fmt12(ts):
-    """Convierte epoch a 'DD/MM/YYYY hh:mm AM/PM' en zona America/Lima."""
-    try:
-        return datetime.fromtimestamp(int(ts), tz=LIMA).strftime('%d/%m/%Y %I:%M %p')
-    except Exception:
-        return "-"
+def _fmt12_col(serie: pd.Series) -> pd.Series:
+    """Convierte una columna de epochs a 'DD/MM/YYYY hh:mm AM/PM' en zona America/Lima."""
+    fechas = pd.to_datetime(pd.to_numeric(serie, errors="coerce"), unit="s", utc=True)
+    return fechas.dt.tz_convert(LIMA).dt.strftime('%d/%m/%Y %I:%M %p').fillna("-")
 
 def _df_sanciones(rows, incluir_usuario=True):
     """Convierte rows de sanciones a DataFrame en español."""
     if not rows:
         return None
-    out = []
-    for r in rows:
-        fila = {
-            "ID": r["sancion_id"],
-            "Motivo": r["motivo"],
-            "Monto": r.get("monto", 0.0),
-            "Estado": r["estado"].capitalize(),
-            "Inicio": _fmt12(r["fecha_inicio"]),
-            "Fin": _fmt12(r["fecha_fin"]),
-        }
-        if incluir_usuario:
-            fila["Usuario"] = r.get("nombre_completo", "-")
-            fila["Rol"] = r.get("role", "-")
-        out.append(fila)
-    return pd.DataFrame(out)
+    df = pd.DataFrame.from_records(rows)
+    out = pd.DataFrame({
+        "ID": df["sancion_id"],
+        "Motivo": df["motivo"],
+        "Monto": df["monto"] if "monto" in df else 0.0,
+        "Estado": df["estado"].str.capitalize(),
+        "Inicio": _fmt12_col(df["fecha_inicio"]),
+        "Fin": _fmt12_col(df["fecha_fin"]),
+    })
+    if incluir_usuario:
+        out["Usuario"] = df["nombre_completo"] if "nombre_completo" in df else "-"
+        out["Rol"] = df["role"] if "role" in df else "-"
+    return out
 
 # ============================
 # PAGINADOR AUXILIAR
@@ -49,20 +45,20 @@ def _paginador_df(df: pd.DataFrame, key_prefix: str = ""):
     total = len(df)
     total_pages = max((total + page_size - 1) // page_size, 1)
 
-    if f"{key_prefix}_pag" not in st.session_state:
-        st.session_state[f"{key_prefix}_pag"] = 1
+    pag_key = f"{key_prefix}_pag"
+    st.session_state.setdefault(pag_key, 1)
 
     with col_b:
         page = st.number_input(
             "Página",
             min_value=1,
             max_value=total_pages,
-            value=st.session_state[f"{key_prefix}_pag"],
+            value=st.session_state[pag_key],
             step=1,
             key=f"{key_prefix}_input"
         )
 
-    st.session_state[f"{key_prefix}_pag"] = page
+    st.session_state[pag_key] = page
 
     start = (page - 1) * page_size
     end = start + page_size
@@ -70,6 +66,34 @@ def _paginador_df(df: pd.DataFrame, key_prefix: str = ""):
     st.caption(f"Página {page} de {total_pages} • {total} registros")
     return df_page
 
+def _paginador_sql(total: int, key_prefix: str = ""):
+    """Igual que _paginador_df, pero devuelve (limit, offset) para paginar en SQL."""
+    col_a, col_b = st.columns([1, 3])
+    with col_a:
+        page_size = st.selectbox("Filas por página", [5, 10, 20, 50], index=1, key=f"{key_prefix}_size")
+    total_pages = max((total + page_size - 1) // page_size, 1)
+
+    pag_key = f"{key_prefix}_pag"
+    st.session_state.setdefault(pag_key, 1)
+
+    with col_b:
+        page = st.number_input(
+            "Página",
+            min_value=1,
+            max_value=total_pages,
+            value=min(st.session_state[pag_key], total_pages),
+            step=1,
+            key=f"{key_prefix}_input"
+        )
+
+    st.session_state[pag_key] = page
+    st.caption(f"Página {page} de {total_pages} • {total} registros")
+    return page_size, (page - 1) * page_size
+
+def _contar(db: DatabaseManager, q: str, params=()) -> int:
+    r = db.execute_query(q, params)
+    return int(r[0]["c"]) if r else 0
+
 # ============================
 # GESTIÓN DE SANCIONES
 # ============================
@@ -81,8 +105,9 @@ def _hay_otras_sanciones_activas(db: DatabaseManager, user_id: int) -> bool:
     )
     return bool(row and int(row[0]["c"]) > 0)
 
-def _listar_destinatarios(db: DatabaseManager):
-    """Solo estudiantes y docentes activos."""
+@st.cache_data(ttl=120, show_spinner=False)
+def _listar_destinatarios(_db: DatabaseManager):
+    """Solo estudiantes y docentes activos, como (user_id, etiqueta)."""
     q = """
         SELECT user_id, nombre_completo, role
         FROM usuarios
@@ -90,7 +115,7 @@ def _listar_destinatarios(db: DatabaseManager):
           AND role IN ('estudiante','docente')
         ORDER BY role, nombre_completo
     """
-    return db.execute_query(q) or []
+    return [(u["user_id"], f"{u['nombre_completo']} — {u['role']}") for u in _db.execute_query(q) or []]
 
 def gestion_sanciones(db_manager: DatabaseManager, show_sweet_alert, user: dict | None = None):
     role = (user or {}).get("role", "admin")
@@ -108,7 +133,7 @@ def gestion_sanciones(db_manager: DatabaseManager, show_sweet_alert, user: dict
         with tab1:
             busc = st.text_input("Buscar por usuario o motivo")
             q = """
-                SELECT s.sancion_id, u.nombre_completo, u.role, s.motivo, s.monto, s.estado,
+                SELECT s.sancion_id, s.usuario_id, u.nombre_completo, u.role, s.motivo, s.monto, s.estado,
                        s.fecha_inicio, s.fecha_fin
                 FROM sanciones s
                 JOIN usuarios u ON s.usuario_id = u.user_id
@@ -126,6 +151,7 @@ def gestion_sanciones(db_manager: DatabaseManager, show_sweet_alert, user: dict
                 opciones = [f"#{r['sancion_id']} • {r['nombre_completo']} • {r['motivo']}" for r in rows]
                 idx = st.selectbox("Selecciona sanción", list(range(len(opciones))), format_func=lambda i: opciones[i])
                 sancion_id = rows[idx]["sancion_id"]
+                uid = rows[idx]["usuario_id"]
 
                 if st.button("Finalizar sanción"):
                     db_manager.execute_query(
@@ -133,15 +159,13 @@ def gestion_sanciones(db_manager: DatabaseManager, show_sweet_alert, user: dict
                         (sancion_id,),
                         return_result=False
                     )
-                    uid_row = db_manager.execute_query("SELECT usuario_id FROM sanciones WHERE sancion_id=%s", (sancion_id,))
-                    if uid_row:
-                        uid = uid_row[0]["usuario_id"]
-                        if not _hay_otras_sanciones_activas(db_manager, uid):
-                            db_manager.execute_query(
-                                "UPDATE usuarios SET sancionado=FALSE, fecha_fin_sancion=NULL WHERE user_id=%s",
-                                (uid,),
-                                return_result=False
-                            )
+                    if not _hay_otras_sanciones_activas(db_manager, uid):
+                        db_manager.execute_query(
+                            "UPDATE usuarios SET sancionado=FALSE, fecha_fin_sancion=NULL WHERE user_id=%s",
+                            (uid,),
+                            return_result=False
+                        )
+                    invalidar_estado_sancion()
                     show_sweet_alert("Listo", "Sanción finalizada (condonada).", "success")
                     st.rerun()
             else:
@@ -149,19 +173,19 @@ def gestion_sanciones(db_manager: DatabaseManager, show_sweet_alert, user: dict
 
         # ---- Historial ----
         with tab2:
-            qh = """
-                SELECT s.sancion_id, u.nombre_completo, u.role, s.motivo, s.monto, s.estado,
-                       s.fecha_inicio, s.fecha_fin
-                FROM sanciones s
-                JOIN usuarios u ON s.usuario_id = u.user_id
-                ORDER BY s.fecha_inicio DESC
-                LIMIT 200
-            """
-            hist = db_manager.execute_query(qh) or []
-            dfh = _df_sanciones(hist, incluir_usuario=True)
-            if dfh is not None and not dfh.empty:
-                df_page = _paginador_df(dfh, key_prefix="sanc_hist")
-                st.dataframe(df_page, use_container_width=True)
+            total = _contar(db_manager, "SELECT COUNT(*) AS c FROM sanciones")
+            if total:
+                limit, offset = _paginador_sql(total, key_prefix="sanc_hist")
+                qh = """
+                    SELECT s.sancion_id, u.nombre_completo, u.role, s.motivo, s.monto, s.estado,
+                           s.fecha_inicio, s.fecha_fin
+                    FROM sanciones s
+                    JOIN usuarios u ON s.usuario_id = u.user_id
+                    ORDER BY s.fecha_inicio DESC
+                    LIMIT %s OFFSET %s
+                """
+                hist = db_manager.execute_query(qh, (limit, offset)) or []
+                st.dataframe(_df_sanciones(hist, incluir_usuario=True), use_container_width=True)
             else:
                 st.info("Sin historial por mostrar.")
 
@@ -172,9 +196,8 @@ def gestion_sanciones(db_manager: DatabaseManager, show_sweet_alert, user: dict
             if not usuarios:
                 st.info("No hay estudiantes/docentes activos.")
             else:
-                etiquetas = [f"{u['nombre_completo']} — {u['role']}" for u in usuarios]
-                idx = st.selectbox("Usuario", list(range(len(etiquetas))), format_func=lambda i: etiquetas[i])
-                destinatario_id = usuarios[idx]["user_id"]
+                idx = st.selectbox("Usuario", list(range(len(usuarios))), format_func=lambda i: usuarios[i][1])
+                destinatario_id = usuarios[idx][0]
 
                 motivo = st.text_area("Motivo", placeholder="Ej.: Conducta, atraso fuera de proceso, etc.")
                 dias = st.number_input("Días de sanción", min_value=1, value=3, step=1)
@@ -184,19 +207,17 @@ def gestion_sanciones(db_manager: DatabaseManager, show_sweet_alert, user: dict
                     if not motivo.strip():
                         show_sweet_alert("Falta motivo", "Escribe el motivo de la sanción.", "warning")
                     else:
-                        db_manager.execute_query(
-                            """INSERT INTO sanciones (usuario_id, prestamo_id, fecha_inicio, fecha_fin, motivo, monto, estado)
-                               VALUES (%s, NULL, UNIX_TIMESTAMP(), UNIX_TIMESTAMP()+%s*86400, %s, %s, 'activa')""",
-                            (destinatario_id, int(dias), motivo.strip(), float(monto)),
-                            return_result=False
+                        # INSERT + UPDATE del usuario en una sola transacción
+                        res = db_manager.call_procedure(
+                            "crear_sancion",
+                            [int(destinatario_id), int(dias), motivo.strip(), float(monto)]
                         )
-                        db_manager.execute_query(
-                            "UPDATE usuarios SET sancionado=TRUE, fecha_fin_sancion=UNIX_TIMESTAMP()+%s*86400 WHERE user_id=%s",
-                            (int(dias), destinatario_id),
-                            return_result=False
-                        )
-                        show_sweet_alert("Éxito", "Sanción creada.", "success")
-                        st.rerun()
+                        if isinstance(res, dict) and res.get("error"):
+                            show_sweet_alert("Error", str(res["error"]).split(": ", 1)[-1], "error")
+                        else:
+                            invalidar_estado_sancion()
+                            show_sweet_alert("Éxito", "Sanción creada.", "success")
+                            st.rerun()
 
     # =========================
     # DOCENTE / ESTUDIANTE
@@ -210,32 +231,37 @@ def gestion_sanciones(db_manager: DatabaseManager, show_sweet_alert, user: dict
         tab1, tab2 = st.tabs(["Activas", "Historial"])
 
         with tab1:
-            q = """
-                SELECT sancion_id, motivo, monto, estado, fecha_inicio, fecha_fin
-                FROM sanciones
-                WHERE usuario_id=%s AND estado='activa'
-                ORDER BY fecha_fin
-            """
-            rows = db_manager.execute_query(q, (user_id,)) or []
-            df = _df_sanciones(rows, incluir_usuario=False)
-            if df is not None and not df.empty:
-                df_page = _paginador_df(df, key_prefix="mis_sanc_act")
-                st.dataframe(df_page, use_container_width=True)
+            total = _contar(
+                db_manager,
+                "SELECT COUNT(*) AS c FROM sanciones WHERE usuario_id=%s AND estado='activa'",
+                (user_id,)
+            )
+            if total:
+                limit, offset = _paginador_sql(total, key_prefix="mis_sanc_act")
+                q = """
+                    SELECT sancion_id, motivo, monto, estado, fecha_inicio, fecha_fin
+                    FROM sanciones
+                    WHERE usuario_id=%s AND estado='activa'
+                    ORDER BY fecha_fin
+                    LIMIT %s OFFSET %s
+                """
+                rows = db_manager.execute_query(q, (user_id, limit, offset)) or []
+                st.dataframe(_df_sanciones(rows, incluir_usuario=False), use_container_width=True)
             else:
                 st.success("No tienes sanciones activas.")
 
         with tab2:
-            qh = """
-                SELECT sancion_id, motivo, monto, estado, fecha_inicio, fecha_fin
-                FROM sanciones
-                WHERE usuario_id=%s
-                ORDER BY fecha_inicio DESC
-                LIMIT 200
-            """
-            rows = db_manager.execute_query(qh, (user_id,)) or []
-            dfh = _df_sanciones(rows, incluir_usuario=False)
-            if dfh is not None and not dfh.empty:
-                df_page = _paginador_df(dfh, key_prefix="mis_sanc_hist")
-                st.dataframe(df_page, use_container_width=True)
+            total = _contar(db_manager, "SELECT COUNT(*) AS c FROM sanciones WHERE usuario_id=%s", (user_id,))
+            if total:
+                limit, offset = _paginador_sql(total, key_prefix="mis_sanc_hist")
+                qh = """
+                    SELECT sancion_id, motivo, monto, estado, fecha_inicio, fecha_fin
+                    FROM sanciones
+                    WHERE usuario_id=%s
+                    ORDER BY fecha_inicio DESC
+                    LIMIT %s OFFSET %s
+                """
+                rows = db_manager.execute_query(qh, (user_id, limit, offset)) or []
+                st.dataframe(_df_sanciones(rows, incluir_usuario=False), use_container_width=True)
             else:
                 st.info("Aún no tienes historial de sanciones.")
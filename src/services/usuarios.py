@@ -7,6 +7,237 @@ from src.auth.auth import AuthManager
 import re
 import secrets
 import string
+import threading
+
+_FT_OPERADORES = re.compile(r'[+\-<>()~*"@]')
+_USER_RE = re.compile(r"^(?=.*[A-Za-z])[A-Za-z0-9_]{4,}$")
+_NAME_RE = re.compile(r"^[A-Za-zÁÉÍÓÚáéíóúÑñ\s]+$")
+_MIN_BUSQUEDA = 2  # ngram_token_size por defecto
+
+def _normalizar_busqueda(search_term: str) -> str:
+    """
+    Deja solo los términos indexables, en minúsculas (la búsqueda FULLTEXT no distingue mayúsculas).
+    Búsquedas equivalentes ("Juan ", "juan", "ju+an") comparten así la misma entrada de caché.
+    """
+    terms = _FT_OPERADORES.sub(" ", search_term or "").lower().split()
+    return " ".join(t for t in terms if len(t) >= _MIN_BUSQUEDA)
+
+def _filtro_busqueda(search_term: str):
+    """
+    (sql, params) para filtrar usuarios por nombre, correo o código con el índice FULLTEXT ngram.
+    Cada término se busca como frase, lo que equivale a un LIKE '%term%' pero usando el índice.
+    Los términos más cortos que un ngram no están indexados y se ignoran.
+    """
+    terms = _normalizar_busqueda(search_term).split()
+    if not terms:
+        return "", ()
+    q = " ".join(f'+"{t}"' for t in terms)
+    return "AND MATCH(nombre_completo, email, codigo_unt) AGAINST (%s IN BOOLEAN MODE)", (q,)
+
+_SI_NO = ["No", "Sí"]
+_INSIGNIAS = {"Sí": "🟢 Sí", "No": "🔴 No"}
+
+_ROL_FILTRO = {
+    "admin": "role != 'admin'",
+    "bibliotecario": "role IN ('estudiante','docente')",
+}
+
+_POR_PAGINA = 100
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _contar_usuarios(_db, search_term: str, version: int, alcance: str = "admin") -> int:
+    filtro, params = _filtro_busqueda(search_term)
+    rows = _db.execute_query(
+        f"SELECT COUNT(*) AS total FROM usuarios WHERE {_ROL_FILTRO[alcance]} {filtro}",
+        params
+    )
+    return int(rows[0]["total"]) if rows else 0
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _load_usuarios(_db, search_term: str, version: int, alcance: str = "admin", offset: int = 0):
+    """
+    Una página (_POR_PAGINA filas) del listado de usuarios, ya armada como DataFrame en español.
+    `version` se incrementa tras cada cambio (ver _invalidar_usuarios) para descartar la caché.
+    """
+    filtro, params = _filtro_busqueda(search_term)
+    query = f"""
+    SELECT user_id, nombre_completo, email, role, codigo_unt, validado, activo
+    FROM usuarios
+    WHERE {_ROL_FILTRO[alcance]}
+    {filtro}
+    ORDER BY nombre_completo
+    LIMIT %s OFFSET %s
+    """
+    usuarios_data = _db.execute_query(query, params + (_POR_PAGINA, offset))
+    if not usuarios_data:
+        return None
+
+    df = pd.DataFrame(usuarios_data)
+    df = df.rename(columns={
+        "user_id": "ID",
+        "nombre_completo": "Nombres",
+        "email": "Correo",
+        "role": "Rol",
+        "codigo_unt": "Código",
+        "validado": "Validado",
+        "activo": "Activo"
+    })
+
+    # Categóricas de dos valores: 1 byte por celda y columna codificada por diccionario en Arrow
+    for col in ("Validado", "Activo"):
+        df[col] = pd.Categorical.from_codes(df[col].fillna(0).astype("int8").to_numpy(), categories=_SI_NO)
+
+    df.index = df.index + offset + 1
+    df.index.name = "#"
+    return df
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _load_duplicados(_db, version: int):
+    """
+    Usuarios que comparten correo, código y DNI, buscados sobre toda la tabla
+    (el listado ya viene paginado y no sirve para detectarlos). El DNI solo se lee aquí.
+    """
+    rows = _db.execute_query("""
+        SELECT u.user_id AS ID, u.nombre_completo AS Nombres, u.email AS Correo,
+               u.codigo_unt AS `Código`, u.dni AS DNI
+        FROM usuarios u
+        JOIN (
+            SELECT email, codigo_unt, dni
+            FROM usuarios
+            WHERE role != 'admin'
+            GROUP BY email, codigo_unt, dni
+            HAVING COUNT(*) > 1
+        ) d ON u.email <=> d.email AND u.codigo_unt <=> d.codigo_unt AND u.dni <=> d.dni
+        WHERE u.role != 'admin'
+        ORDER BY u.email, u.nombre_completo
+    """)
+    return pd.DataFrame(rows) if rows else None
+
+def _paginador_usuarios(total: int, alcance: str) -> int:
+    """Selector de página del listado de usuarios; devuelve el OFFSET a usar."""
+    total_pages = max((total + _POR_PAGINA - 1) // _POR_PAGINA, 1)
+    pag_key = f"usuarios_pag_{alcance}"
+    st.session_state.setdefault(pag_key, 1)
+    page = st.number_input(
+        "Página",
+        min_value=1,
+        max_value=total_pages,
+        value=min(st.session_state[pag_key], total_pages),
+        step=1,
+        key=f"usuarios_pag_input_{alcance}"
+    )
+    st.session_state[pag_key] = page
+    st.caption(f"Página {page} de {total_pages} • {total} usuarios")
+    return (page - 1) * _POR_PAGINA
+
+def _opciones_usuarios(df) -> dict:
+    """Opciones del selector de usuarios, armadas con tuplas planas (sin crear una Serie por fila)."""
+    filas = df[['ID', 'Nombres', 'Correo', 'Rol', 'Validado', 'Activo']].itertuples(index=False, name=None)
+    return {
+        f"{nombres} - {correo} - {rol}": {
+            'id': id_,
+            'validado': validado == 'Sí',
+            'activo': activo == 'Sí',
+            'rol': rol
+        }
+        for id_, nombres, correo, rol, validado, activo in filas
+    }
+
+def _opciones_usuarios_sesion(df, alcance: str, clave: tuple) -> dict:
+    """
+    _opciones_usuarios guardado en session_state. `clave` identifica el resultado cargado
+    (versión, búsqueda, página), así un rerun sobre los mismos datos no rearma el diccionario.
+    """
+    state_key = f"user_opts_{alcance}"
+    guardado = st.session_state.get(state_key)
+    if guardado is None or guardado[0] != clave:
+        guardado = (clave, _opciones_usuarios(df))
+        st.session_state[state_key] = guardado
+    return guardado[1]
+
+@st.cache_resource
+def _estado_usuarios() -> dict:
+    """
+    Versión del listado compartida por todas las sesiones del proceso: st.cache_data también
+    es global, así que un contador en session_state dejaría a los demás admins leyendo la caché vieja.
+    """
+    return {"version": 0, "lock": threading.Lock()}
+
+def _version_usuarios() -> int:
+    return _estado_usuarios()["version"]
+
+def _version_sesion() -> int:
+    """
+    Versión con la que esta sesión lee el listado: (base, propias) en session_state, donde
+    `propias` son los incrementos hechos por sus propios guardados ya parchados en memoria.
+    Mientras nadie más cambie la versión global, la sesión sigue en `base` (caché + parches);
+    si otra sesión la cambió, salta a la versión actual y descarta sus parches.
+    """
+    actual = _version_usuarios()
+    base, propias = st.session_state.get("usuarios_base", (actual, 0))
+    if actual != base + propias:
+        base, propias = actual, 0
+    st.session_state["usuarios_base"] = (base, propias)
+    return base
+
+def _invalidar_usuarios(parchado: bool = False):
+    """
+    Fuerza a _load_usuarios a releer la BD en el siguiente rerun (de cualquier sesión).
+    Con parchado=True el cambio ya está aplicado como parche en esta sesión: las demás
+    releen, pero esta sigue usando su listado en caché.
+    """
+    estado = _estado_usuarios()
+    with estado["lock"]:
+        estado["version"] += 1
+        if parchado:
+            base, propias = st.session_state.get("usuarios_base", (estado["version"] - 1, 0))
+            # Solo cuenta como propio si nadie más incrementó desde la última lectura
+            if base + propias == estado["version"] - 1:
+                st.session_state["usuarios_base"] = (base, propias + 1)
+
+def _parches_usuarios() -> dict:
+    """
+    Cambios ya guardados en la BD que se aplican sobre el listado en caché en lugar de releerlo:
+    {user_id: {columna: valor}}. Se descartan cuando la sesión cambia de versión (el listado se relee).
+    """
+    version = _version_sesion()
+    guardado = st.session_state.get("usuarios_parches")
+    if guardado is None or guardado[0] != version:
+        guardado = (version, {})
+        st.session_state["usuarios_parches"] = guardado
+    return guardado[1]
+
+def _rev_parches() -> int:
+    return st.session_state.get("usuarios_parches_rev", 0)
+
+def _aplicar_parches(df, parches: dict):
+    if not parches:
+        return df
+    df = df.copy()
+    for uid, cambios in parches.items():
+        fila = df["ID"] == uid
+        for col, valor in cambios.items():
+            df.loc[fila, col] = valor
+    return df
+
+def _grid_usuarios(placeholder, df, insignias: bool = False):
+    """Dibuja el listado en `placeholder` para poder redibujarlo tras un cambio sin rerun."""
+    if not insignias:
+        placeholder.dataframe(df, use_container_width=True)
+        return
+    # Insignias con un map vectorizado en lugar de un Styler (callback Python por celda)
+    vista = df.assign(
+        Validado=df["Validado"].map(_INSIGNIAS),
+        Activo=df["Activo"].map(_INSIGNIAS),
+    )
+    placeholder.dataframe(
+        vista,
+        use_container_width=True,
+        column_config={
+            "Validado": st.column_config.TextColumn("Validado", width="small"),
+            "Activo": st.column_config.TextColumn("Activo", width="small"),
+        },
+    )
 
 def generar_password(longitud=12):
     """
@@ -15,15 +246,16 @@ def generar_password(longitud=12):
     - Al menos una minúscula
     - Al menos un número
     - Al menos un carácter especial
+    Se construye tomando un carácter de cada clase y completando con el alfabeto total,
+    así no hace falta reintentar hasta que se cumplan las reglas.
     """
-    caracteres = string.ascii_letters + string.digits + "!@#$%^&*()-_=+"
-    while True:
-        password = ''.join(secrets.choice(caracteres) for _ in range(longitud))
-        if (any(c.islower() for c in password) and
-            any(c.isupper() for c in password) and
-            any(c.isdigit() for c in password) and
-            any(c in "!@#$%^&*()-_=+" for c in password)):
-            return password
+    especiales = "!@#$%^&*()-_=+"
+    clases = (string.ascii_lowercase, string.ascii_uppercase, string.digits, especiales)
+    caracteres = string.ascii_letters + string.digits + especiales
+    password = [secrets.choice(c) for c in clases]
+    password += [secrets.choice(caracteres) for _ in range(max(longitud, len(clases)) - len(clases))]
+    secrets.SystemRandom().shuffle(password)
+    return ''.join(password)
 
 def gestion_usuarios(db_manager, show_sweet_alert):
     """
@@ -50,16 +282,21 @@ def gestion_usuarios(db_manager, show_sweet_alert):
         if st.button("Registrar Bibliotecario", key="btn_reg_user"):
             if not nombre_completo or not usuario or not dni:
                 show_sweet_alert("Error", "Por favor, complete todos los campos.", "error")
-            elif not re.fullmatch(r"^(?=.*[A-Za-z])[A-Za-z0-9_]{4,}$", usuario):
+            elif not _USER_RE.fullmatch(usuario):
                 show_sweet_alert("Error", "El nombre de usuario debe tener al menos 4 caracteres, contener al menos una letra y solo puede incluir letras, números o guiones bajos.", "error")
             elif not len(dni) == 8 or not dni.isdigit():
                 show_sweet_alert("Error", "El DNI debe tener exactamente 8 dígitos numéricos.", "error")
-            elif not re.match(r"^[A-Za-zÁÉÍÓÚáéíóúÑñ\s]+$", nombre_completo):
+            elif not _NAME_RE.match(nombre_completo):
                 show_sweet_alert("Error", "El nombre completo solo puede contener letras y espacios.", "error")
             else:
-                # Validar duplicados exactos
+                # Validar duplicados exactos: una búsqueda indexada por columna
                 existing_user = db_manager.execute_query(
-                    "SELECT * FROM usuarios WHERE LOWER(nombre_completo) = LOWER(%s) OR dni = %s OR username = %s",
+                    """
+                    SELECT 1 FROM usuarios WHERE nombre_completo_lower = LOWER(%s)
+                    UNION ALL SELECT 1 FROM usuarios WHERE dni = %s
+                    UNION ALL SELECT 1 FROM usuarios WHERE username = %s
+                    LIMIT 1
+                    """,
                     (nombre_completo, dni, usuario)
                 )
                 if existing_user:
@@ -83,6 +320,7 @@ def gestion_usuarios(db_manager, show_sweet_alert):
                     )
 
                     if success:
+                        _invalidar_usuarios()
                         show_sweet_alert(
                             "Éxito",
                             f"{message} | 📧 Correo generado: {email} | 🔑 Contraseña: {password}",
@@ -96,75 +334,31 @@ def gestion_usuarios(db_manager, show_sweet_alert):
     search_term = st.text_input("🔍 Buscar usuario por nombre, correo o código")
 
     try:
-        if search_term:
-            query = """
-            SELECT user_id, nombre_completo, email, role, codigo_unt, dni, validado, activo
-            FROM usuarios
-            WHERE role != 'admin'
-            AND (nombre_completo LIKE %s OR email LIKE %s OR codigo_unt LIKE %s)
-            ORDER BY nombre_completo
-            """
-            usuarios_data = db_manager.execute_query(
-                query, (f"%{search_term}%", f"%{search_term}%", f"%{search_term}%")
-            )
-        else:
-            query = """
-            SELECT user_id, nombre_completo, email, role, codigo_unt, dni, validado, activo
-            FROM usuarios
-            WHERE role != 'admin'
-            ORDER BY nombre_completo
-            """
-            usuarios_data = db_manager.execute_query(query)
-
-        if usuarios_data:
-            df = pd.DataFrame(usuarios_data)
-
-            df = df.rename(columns={
-                "user_id": "ID",
-                "nombre_completo": "Nombres",
-                "email": "Correo",
-                "role": "Rol",
-                "codigo_unt": "Código",
-                "dni": "DNI",
-                "validado": "Validado",
-                "activo": "Activo"
-            })
-
-            df['Validado'] = df['Validado'].map({1: "Sí", 0: "No"})
-            df['Activo'] = df['Activo'].map({1: "Sí", 0: "No"})
-
-            df.index = df.index + 1
-            df.index.name = "#"
-
+        termino = _normalizar_busqueda(search_term)
+        if search_term and not termino:
+            st.caption(f"Escribe al menos {_MIN_BUSQUEDA} caracteres para buscar.")
+        version = _version_sesion()
+        total = _contar_usuarios(db_manager, termino, version, "admin")
+        offset = _paginador_usuarios(total, "admin") if total else 0
+        df = _load_usuarios(db_manager, termino, version, "admin", offset)
+
+        if df is not None:
             # Verificar unicidad de correo, código y dni
-            duplicados = df[df.duplicated(subset=["Correo", "Código", "DNI"], keep=False)]
-            if not duplicados.empty:
+            duplicados = _load_duplicados(db_manager, version)
+            if duplicados is not None:
                 st.warning("⚠️ Se detectaron registros duplicados en **Correo, Código o DNI** (nombres pueden repetirse).")
                 st.dataframe(duplicados, use_container_width=True)
 
-            def resaltar_estado(val):
-                if isinstance(val, str):
-                    color = "background-color: #d4edda; color: #155724;" if val == "Sí" else "background-color: #f8d7da; color: #721c24;"
-                    return f"{color} font-weight: bold; border-radius: 5px; text-align: center; padding: 4px;"
-                return ""
-
-            styled_df = df.style.applymap(resaltar_estado, subset=["Validado", "Activo"])
-
-            st.dataframe(styled_df, use_container_width=True)
+            parches = _parches_usuarios()
+            df = _aplicar_parches(df, parches)
+            grid = st.empty()
+            _grid_usuarios(grid, df, insignias=True)
             st.markdown("---")
 
             # Acciones sobre usuarios
             st.write("### Acciones sobre Usuarios")
 
-            user_options = {
-                f"{row['Nombres']} - {row['Correo']} - {row['Rol']}": {
-                    'id': row['ID'],
-                    'validado': row['Validado'] == 'Sí',
-                    'activo': row['Activo'] == 'Sí',
-                    'rol': row['Rol']
-                }
-                for _, row in df.iterrows()
-            }
+            user_options = _opciones_usuarios_sesion(df, "admin", (version, termino, offset, _rev_parches()))
 
             all_user_keys = list(user_options.keys())
 
@@ -199,19 +393,6 @@ def gestion_usuarios(db_manager, show_sweet_alert):
                             key=f"accion_validar_{user_id_to_act}"
                         )
 
-                        if st.button("Aplicar Validación", key=f"apply_validation_{user_id_to_act}", disabled=bloquear_acciones):
-                            if _tiene_prestamos_activos(db_manager, user_id_to_act) and rol_bloqueable:
-                                show_sweet_alert("Bloqueado", "No puede modificar validación: el usuario tiene préstamos activos.", "error")
-                                st.stop()
-                            new_validado_status = (accion_validar == "Validar")
-                            db_manager.execute_query(
-                                "UPDATE usuarios SET validado = %s WHERE user_id = %s",
-                                (new_validado_status, user_id_to_act),
-                                return_result=False
-                            )
-                            show_sweet_alert("Éxito", f"Usuario {'validado' if new_validado_status else 'invalidado'} correctamente.", "success")
-                            st.rerun()
-
                     with col2:
                         st.write("#### Gestión de Activación")
                         accion_activo = st.selectbox(
@@ -221,40 +402,26 @@ def gestion_usuarios(db_manager, show_sweet_alert):
                             key=f"accion_activo_{user_id_to_act}"
                         )
 
-                        if st.button("Aplicar Activación", key=f"apply_activation_{user_id_to_act}", disabled=bloquear_acciones):
-                            if _tiene_prestamos_activos(db_manager, user_id_to_act) and rol_bloqueable:
-                                show_sweet_alert("Bloqueado", "No puede activar/desactivar: el usuario tiene préstamos activos.", "error")
-                                st.stop()
-                            new_activo_status = (accion_activo == "Activar")
-                            db_manager.execute_query(
-                                "UPDATE usuarios SET activo = %s WHERE user_id = %s",
-                                (new_activo_status, user_id_to_act),
-                                return_result=False
-                            )
-                            show_sweet_alert("Éxito", f"Estado de usuario {'activado' if new_activo_status else 'desactivado'} correctamente.", "success")
-                            st.rerun()
-                    
                     with col3:
                         st.write("#### Gestión de Roles")
+                        roles = _opciones_rol(current_role)
                         nuevo_rol = st.selectbox(
                             "Rol del usuario",
-                            ["estudiante", "docente"],
-                            index=0 if current_role == "estudiante" else 1,
+                            roles,
+                            index=roles.index(current_role) if current_role in roles else 0,
                             key=f"rol_select_{user_id_to_act}"
                         )
-                        
-                        if st.button("Cambiar Rol", key=f"change_role_{user_id_to_act}", disabled=bloquear_acciones):
-                            if _tiene_prestamos_activos(db_manager, user_id_to_act) and rol_bloqueable:
-                               show_sweet_alert("Bloqueado", "No puede cambiar el rol: el usuario tiene préstamos activos.", "error")
-                               st.stop()
-                            db_manager.execute_query(
-                                "UPDATE usuarios SET role = %s WHERE user_id = %s",
-                                (nuevo_rol, user_id_to_act),
-                                return_result=False
-                            )
-                            show_sweet_alert("Éxito", f"Rol del usuario cambiado a {nuevo_rol} correctamente.", "success")
-                            st.rerun()
-                        
+
+                    if st.button("Guardar cambios", key=f"save_user_{user_id_to_act}", disabled=bloquear_acciones, type="primary"):
+                        vigentes = _guardar_cambios_usuario(
+                            db_manager, show_sweet_alert, user_id_to_act, rol_bloqueable,
+                            (is_validado, is_activo, current_role),
+                            (accion_validar == "Validar", accion_activo == "Activar", nuevo_rol),
+                        )
+                        if vigentes:
+                            _grid_usuarios(grid, _aplicar_parches(df, vigentes), insignias=True)
+
+                    with col3:
                         # Eliminar usuario
                         st.write("#### Eliminar Usuario")
                         delete_key = f"delete_confirm_{user_id_to_act}"
@@ -275,13 +442,14 @@ def gestion_usuarios(db_manager, show_sweet_alert):
                                     if _tiene_prestamos_activos(db_manager, user_id_to_act) and rol_bloqueable:
                                         show_sweet_alert("Bloqueado", "No puede eliminar: el usuario tiene préstamos activos.", "error")
                                         st.stop()
-                                    db_manager.execute_query(
+                                    db_manager.execute_prepared(
+                                        "del_usuario",
                                         "DELETE FROM usuarios WHERE user_id = %s",
-                                        (user_id_to_act,),
-                                        return_result=False
+                                        (user_id_to_act,)
                                     )
                                     if delete_key in st.session_state:
                                         del st.session_state[delete_key]
+                                    _invalidar_usuarios()
                                     show_sweet_alert("Éxito", "Usuario eliminado correctamente.", "success")
                                     st.rerun()
                             
@@ -299,23 +467,32 @@ def gestion_usuarios(db_manager, show_sweet_alert):
     except Exception as e:
         show_sweet_alert("Error", f"❌ Error al obtener o gestionar los usuarios: {e}", "error")
 
+@st.cache_data(ttl=60, show_spinner=False)
+def _load_pendientes(_db, version: int):
+    """Cuentas de estudiantes/docentes pendientes de validación (ver _invalidar_usuarios)."""
+    return _db.execute_query(
+        "SELECT user_id, nombre_completo, role, email FROM usuarios WHERE validado = FALSE AND activo = TRUE AND role IN ('estudiante','docente')"
+    )
+
 def validar_cuentas(db_manager, show_sweet_alert):
     """
     Función para que el bibliotecario valide cuentas de usuarios pendientes.
     """
     st.subheader("Cuentas Pendientes de Validación")
 
-    usuarios_pendientes = db_manager.execute_query(
-        "SELECT user_id, nombre_completo, role, email FROM usuarios WHERE validado = FALSE AND activo = TRUE AND role IN ('estudiante','docente')"
-    )
+    usuarios_pendientes = _load_pendientes(db_manager, _version_usuarios())
 
     if not usuarios_pendientes:
         st.info("No hay cuentas pendientes por validar.")
         return
 
-    for user in usuarios_pendientes:
+    # Un solo barrido vectorizado del patrón de nombre para todas las cuentas
+    df = pd.DataFrame(usuarios_pendientes)
+    nombre_valido = df['nombre_completo'].str.match(_NAME_RE, na=False).tolist()
+
+    for user, valido in zip(usuarios_pendientes, nombre_valido):
         with st.container():
-            if not re.match(r"^[A-Za-zÁÉÍÓÚáéíóúÑñ\s]+$", user['nombre_completo']):
+            if not valido:
                 st.warning(f"⚠️ El nombre del usuario '{user['nombre_completo']}' contiene caracteres no permitidos.")
                 
             col1, col2, col3 = st.columns([3, 1, 1])
@@ -325,20 +502,22 @@ def validar_cuentas(db_manager, show_sweet_alert):
                 st.caption(f"Email: {user['email']}")
             with col2:
                 if st.button("Validar", key=f"validate_{user['user_id']}"):
-                    db_manager.execute_query(
+                    db_manager.execute_prepared(
+                        "upd_validar",
                         "UPDATE usuarios SET validado = TRUE, fecha_validacion = NOW() WHERE user_id = %s",
-                        (user['user_id'],),
-                        return_result=False
+                        (user['user_id'],)
                     )
+                    _invalidar_usuarios()
                     show_sweet_alert("Cuenta Validada", f"La cuenta de {user['nombre_completo']} ha sido validada.", "success")
                     st.rerun()
             with col3:
                 if st.button("Rechazar", key=f"reject_{user['user_id']}"):
-                    db_manager.execute_query(
+                    db_manager.execute_prepared(
+                        "upd_rechazar",
                         "UPDATE usuarios SET activo = FALSE WHERE user_id = %s",
-                        (user['user_id'],),
-                        return_result=False
+                        (user['user_id'],)
                     )
+                    _invalidar_usuarios()
                     show_sweet_alert("Cuenta Rechazada", f"❌ La cuenta de {user['nombre_completo']} ha sido rechazada y desactivada.", "success")
                     st.rerun()
             st.divider()
@@ -358,6 +537,54 @@ def _tiene_prestamos_activos(db_manager, user_id: int) -> bool:
     v = r[0].get("has_act") if r else 0
     return bool(v == 1 or str(v).lower() in ("true", "1"))
 
+def _opciones_rol(current_role) -> list:
+    """Roles asignables; se conserva el actual si no es estudiante/docente (p. ej. bibliotecario)."""
+    roles = ["estudiante", "docente"]
+    return roles if current_role in roles else roles + [current_role]
+
+def _guardar_cambios_usuario(db_manager, show_sweet_alert, user_id, rol_bloqueable, actual, nuevo):
+    """
+    Aplica validación, activación y rol en un único UPDATE (una sola ida y vuelta y un solo commit).
+    `actual` y `nuevo` son tuplas (validado, activo, rol).
+    Si se guardó, parcha el listado en sesión y retorna los parches vigentes (con el nuevo incluido)
+    para redibujar la grilla sin rerun; si no, retorna None. La versión global se incrementa para
+    que las demás sesiones no sigan con la caché anterior.
+    """
+    if tuple(nuevo) == tuple(actual):
+        show_sweet_alert("Información", "No hay cambios para guardar.", "info")
+        return None
+    if rol_bloqueable and _tiene_prestamos_activos(db_manager, user_id):
+        show_sweet_alert("Bloqueado", "No puede modificar el usuario: tiene préstamos activos.", "error")
+        st.stop()
+    validado, activo, rol = nuevo
+    ok = db_manager.execute_prepared(
+        "upd_usuario",
+        "UPDATE usuarios SET validado = %s, activo = %s, role = %s WHERE user_id = %s",
+        (validado, activo, rol, user_id)
+    )
+    if not ok:
+        # Estado incierto: se relee todo desde la BD
+        _invalidar_usuarios()
+        st.rerun()
+
+    _invalidar_usuarios(parchado=True)
+    parches = _parches_usuarios()
+    parches[user_id] = {
+        "Validado": "Sí" if validado else "No",
+        "Activo": "Sí" if activo else "No",
+        "Rol": rol,
+    }
+    st.session_state["usuarios_parches_rev"] = _rev_parches() + 1
+    cambios = []
+    if validado != actual[0]:
+        cambios.append("validado" if validado else "invalidado")
+    if activo != actual[1]:
+        cambios.append("activado" if activo else "desactivado")
+    if rol != actual[2]:
+        cambios.append(f"rol cambiado a {rol}")
+    show_sweet_alert("Éxito", f"Usuario {', '.join(cambios)} correctamente.", "success")
+    return parches
+
 def gestion_usuarios_bibliotecario(db_manager, show_sweet_alert):
     """
     Gestión de usuarios para bibliotecario:
@@ -369,58 +596,24 @@ def gestion_usuarios_bibliotecario(db_manager, show_sweet_alert):
     search_term = st.text_input("🔍 Buscar usuario por nombre, correo o código")
 
     try:
-        if search_term:
-            query = """
-            SELECT user_id, nombre_completo, email, role, codigo_unt, dni, validado, activo
-            FROM usuarios
-            WHERE role IN ('estudiante','docente')
-            AND (nombre_completo LIKE %s OR email LIKE %s OR codigo_unt LIKE %s)
-            ORDER BY nombre_completo
-            """
-            usuarios_data = db_manager.execute_query(
-                query, (f"%{search_term}%", f"%{search_term}%", f"%{search_term}%")
-            )
-        else:
-            query = """
-            SELECT user_id, nombre_completo, email, role, codigo_unt, dni, validado, activo
-            FROM usuarios
-            WHERE role IN ('estudiante','docente')
-            ORDER BY nombre_completo
-            """
-            usuarios_data = db_manager.execute_query(query)
-
-        if usuarios_data:
-            df = pd.DataFrame(usuarios_data)
-            df = df.rename(columns={
-                "user_id": "ID",
-                "nombre_completo": "Nombres",
-                "email": "Correo",
-                "role": "Rol",
-                "codigo_unt": "Código",
-                "dni": "DNI",
-                "validado": "Validado",
-                "activo": "Activo"
-            })
-
-            df['Validado'] = df['Validado'].map({1: "Sí", 0: "No"})
-            df['Activo'] = df['Activo'].map({1: "Sí", 0: "No"})
-            df.index = df.index + 1
-            df.index.name = "#"
-
-            st.dataframe(df, use_container_width=True)
+        termino = _normalizar_busqueda(search_term)
+        if search_term and not termino:
+            st.caption(f"Escribe al menos {_MIN_BUSQUEDA} caracteres para buscar.")
+        version = _version_sesion()
+        total = _contar_usuarios(db_manager, termino, version, "bibliotecario")
+        offset = _paginador_usuarios(total, "bibliotecario") if total else 0
+        df = _load_usuarios(db_manager, termino, version, "bibliotecario", offset)
+
+        if df is not None:
+            parches = _parches_usuarios()
+            df = _aplicar_parches(df, parches)
+            grid = st.empty()
+            _grid_usuarios(grid, df)
             st.markdown("---")
 
             # Acciones solo sobre estudiante/docente
             st.write("### Acciones sobre Usuarios")
-            user_options = {
-                f"{row['Nombres']} - {row['Correo']} - {row['Rol']}": {
-                    'id': row['ID'],
-                    'validado': row['Validado'] == 'Sí',
-                    'activo': row['Activo'] == 'Sí',
-                    'rol': row['Rol']
-                }
-                for _, row in df.iterrows()
-            }
+            user_options = _opciones_usuarios_sesion(df, "bibliotecario", (version, termino, offset, _rev_parches()))
 
             if not user_options:
                 st.info("No hay usuarios disponibles para gestionar.")
@@ -452,17 +645,6 @@ def gestion_usuarios_bibliotecario(db_manager, show_sweet_alert):
                         index=1 if is_validado else 0,
                         key=f"accion_validar_{user_id_to_act}"
                     )
-                    if st.button("Aplicar Validación", key=f"apply_validation_{user_id_to_act}", disabled=bloquear_acciones):
-                        if _tiene_prestamos_activos(db_manager, user_id_to_act) and rol_bloqueable:
-                                show_sweet_alert("Bloqueado", "No puede modificar validación: el usuario tiene préstamos activos.", "error")
-                                st.stop()
-                        db_manager.execute_query(
-                            "UPDATE usuarios SET validado = %s WHERE user_id = %s",
-                            (accion_validar == "Validar", user_id_to_act),
-                            return_result=False
-                        )
-                        show_sweet_alert("Éxito", f"Usuario {'validado' if accion_validar=='Validar' else 'invalidado'} correctamente.", "success")
-                        st.rerun()
 
                 # Activación
                 with col2:
@@ -473,38 +655,26 @@ def gestion_usuarios_bibliotecario(db_manager, show_sweet_alert):
                         index=1 if is_activo else 0,
                         key=f"accion_activo_{user_id_to_act}"
                     )
-                    if st.button("Aplicar Activación", key=f"apply_activation_{user_id_to_act}", disabled=bloquear_acciones):
-                        if _tiene_prestamos_activos(db_manager, user_id_to_act) and rol_bloqueable:
-                            show_sweet_alert("Bloqueado", "No puede activar/desactivar: el usuario tiene préstamos activos.", "error")
-                            st.stop()
-                        db_manager.execute_query(
-                            "UPDATE usuarios SET activo = %s WHERE user_id = %s",
-                            (accion_activo == "Activar", user_id_to_act),
-                            return_result=False
-                        )
-                        show_sweet_alert("Éxito", f"Usuario {'activado' if accion_activo=='Activar' else 'desactivado'} correctamente.", "success")
-                        st.rerun()
 
                 # Roles
                 with col3:
                     st.write("#### Gestión de Roles")
+                    roles = _opciones_rol(current_role)
                     nuevo_rol = st.selectbox(
                         "Rol del usuario",
-                        ["estudiante", "docente"],
-                        index=0 if current_role == "estudiante" else 1,
+                        roles,
+                        index=roles.index(current_role) if current_role in roles else 0,
                         key=f"rol_select_{user_id_to_act}"
                     )
-                    if st.button("Cambiar Rol", key=f"change_role_{user_id_to_act}", disabled=bloquear_acciones):
-                        if _tiene_prestamos_activos(db_manager, user_id_to_act) and rol_bloqueable:
-                            show_sweet_alert("Bloqueado", "No puede cambiar el rol: el usuario tiene préstamos activos.", "error")
-                            st.stop()
-                        db_manager.execute_query(
-                            "UPDATE usuarios SET role = %s WHERE user_id = %s",
-                            (nuevo_rol, user_id_to_act),
-                            return_result=False
-                        )
-                        show_sweet_alert("Éxito", f"Rol cambiado a {nuevo_rol}.", "success")
-                        st.rerun()
+
+                if st.button("Guardar cambios", key=f"save_user_{user_id_to_act}", disabled=bloquear_acciones, type="primary"):
+                    vigentes = _guardar_cambios_usuario(
+                        db_manager, show_sweet_alert, user_id_to_act, rol_bloqueable,
+                        (is_validado, is_activo, current_role),
+                        (accion_validar == "Validar", accion_activo == "Activar", nuevo_rol),
+                    )
+                    if vigentes:
+                        _grid_usuarios(grid, _aplicar_parches(df, vigentes))
 
         else:
             st.info("No hay usuarios registrados.")
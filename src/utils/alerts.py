@@ -1,6 +1,8 @@
 # src/utils/alerts.py - Sistema de alertas y notificaciones
 import streamlit as st
 import time
+import logging
+import threading
 from datetime import datetime
 
 def show_alert(title, text, icon="success", button="OK", timer=None):
@@ -19,101 +21,170 @@ def show_alert(title, text, icon="success", button="OK", timer=None):
     if timer:
         time.sleep(timer/1000)  
 
-def verificar_alertas():
+logger = logging.getLogger(__name__)
+
+_ASUNTO_RECORDATORIO = "Recordatorio de Devolución — "
+
+def _enviar_recordatorios(email_manager, prestamos):
     """
-    Verifica condiciones que requieren alertas y las muestra/envía
+    Envía los recordatorios con bulk_por_vencer: reutiliza el pool de conexiones SMTP
+    persistentes (un solo TLS/AUTH por conexión) y registra las notificaciones en lote.
     """
-    # Solo ejecutar para administradores y bibliotecarios
-    if 'user' not in st.session_state or st.session_state.user['role'] not in ['admin', 'bibliotecario']:
+    if not prestamos:
         return
+    for p in prestamos:
+        p['fecha_prevista'] = datetime.fromtimestamp(p['fecha_devolucion_estimada']).strftime('%d/%m/%Y')
+    resultado = email_manager.bulk_por_vencer(prestamos)
+    if resultado["ok"] < resultado["total"]:
+        logger.warning("Recordatorios enviados: %s de %s", resultado["ok"], resultado["total"])
+
+_INTERVALO_ALERTAS = 3600  # segundos entre ejecuciones del planificador
+
+def generar_alertas(db_manager, email_manager):
+    """
+    Calcula las alertas de préstamos y reservas, las guarda en alertas_pendientes
+    y envía los recordatorios por correo. La ejecuta el planificador en segundo plano.
+    """
+    # Instante fijo enviado como parámetro: los rangos sobre (estado, fecha) quedan comparando
+    # la columna contra constantes y aprovechan los índices ix_prestamos_estado_fdevest / ix_reservas_estado_exp
+    now_ts = int(time.time())
+    hoy = datetime.fromtimestamp(now_ts).strftime('%Y-%m-%d')
+    alertas = []  # (clave, titulo, mensaje, icono); la clave evita repetir la alerta en el mismo día
     
-    # Importar aquí para evitar circularidad
-    from src.database.database import DatabaseManager
-    from src.utils.email_manager import EmailManager
-    
-    db_manager = DatabaseManager()
-    email_manager = EmailManager()
-    
-    # Alertas para préstamos próximos a vencer (en los próximos 2 días)
+    # Alertas para préstamos próximos a vencer (en los próximos 2 días).
+    # El último recordatorio enviado viene en la misma consulta (antes era un SELECT por préstamo);
+    # notificaciones no guarda prestamo_id, así que se identifica por usuario y asunto.
     prestamos_proximos_vencer = db_manager.execute_query("""
-        SELECT p.prestamo_id, l.titulo, u.nombre, u.apellido, u.email,
+        SELECT p.prestamo_id, l.titulo, u.nombre_completo, u.email,
                p.fecha_devolucion_estimada,
-               FLOOR((p.fecha_devolucion_estimada - UNIX_TIMESTAMP()) / 86400) as dias_restantes
+               FLOOR((p.fecha_devolucion_estimada - %s) / 86400) as dias_restantes,
+               (n.ultimo_envio IS NULL OR DATE(n.ultimo_envio) < CURDATE()) AS enviar_email
         FROM prestamos p
         JOIN libros l ON p.libro_id = l.libro_id
         JOIN usuarios u ON p.usuario_id = u.user_id
+        LEFT JOIN (
+            SELECT usuario_id, asunto, MAX(created_at) AS ultimo_envio
+            FROM notificaciones
+            WHERE tipo = 'email' AND estado = 'enviado'
+            GROUP BY usuario_id, asunto
+        ) n ON n.usuario_id = u.user_id AND n.asunto = CONCAT(%s, l.titulo)
         WHERE p.estado = 'activo'
-        AND p.fecha_devolucion_estimada BETWEEN UNIX_TIMESTAMP() AND UNIX_TIMESTAMP() + 172800
+        AND p.fecha_devolucion_estimada BETWEEN %s AND %s
         ORDER BY p.fecha_devolucion_estimada
-    """)
+    """, (now_ts, _ASUNTO_RECORDATORIO, now_ts, now_ts + 172800))
     
-    if prestamos_proximos_vencer:
-        for prestamo in prestamos_proximos_vencer:
-            # Mostrar alerta en la interfaz
-            if prestamo['dias_restantes'] <= 1:
-                show_alert("Préstamo por vencer", 
-                          f"El libro '{prestamo['titulo']}' prestado a {prestamo['nombre']} {prestamo['apellido']} vence hoy.", 
-                          "warning")
-            else:
-                show_alert("Préstamo por vencer", 
-                          f"El libro '{prestamo['titulo']}' prestado a {prestamo['nombre']} {prestamo['apellido']} vence en {int(prestamo['dias_restantes'])} días.", 
-                          "info")
-            
-            # Enviar correo de recordatorio (solo una vez al día)
-            last_notification = db_manager.execute_query(
-                "SELECT MAX(fecha_envio) as ultimo_envio FROM notificaciones WHERE prestamo_id = %s AND tipo = 'recordatorio_vencimiento'",
-                (prestamo['prestamo_id'],)
-            )
-            
-            should_send_email = True
-            if last_notification and last_notification[0]['ultimo_envio']:
-                # Verificar si ya se envió una notificación hoy
-                if last_notification[0]['ultimo_envio'].date() == datetime.now().date():
-                    should_send_email = False
-            
-            if should_send_email and prestamo['email']:
-                # Enviar correo electrónico
-                return_date = datetime.fromtimestamp(prestamo['fecha_devolucion_estimada']).strftime('%d/%m/%Y')
-                email_manager.send_reminder_notification(
-                    prestamo['email'], 
-                    prestamo['titulo'], 
-                    int(prestamo['dias_restantes'])
-                )
+    for prestamo in prestamos_proximos_vencer or []:
+        if prestamo['dias_restantes'] <= 1:
+            texto, icono = f"El libro '{prestamo['titulo']}' prestado a {prestamo['nombre_completo']} vence hoy.", "warning"
+        else:
+            texto, icono = f"El libro '{prestamo['titulo']}' prestado a {prestamo['nombre_completo']} vence en {int(prestamo['dias_restantes'])} días.", "info"
+        alertas.append((f"por_vencer:{prestamo['prestamo_id']}:{hoy}", "Préstamo por vencer", texto, icono))
     
     # Alertas para préstamos vencidos
     prestamos_vencidos = db_manager.execute_query("""
-        SELECT p.prestamo_id, l.titulo, u.nombre, u.apellido, u.email,
+        SELECT p.prestamo_id, l.titulo, u.nombre_completo, u.email,
                p.fecha_devolucion_estimada,
-               FLOOR((UNIX_TIMESTAMP() - p.fecha_devolucion_estimada) / 86400) as dias_vencido
+               FLOOR((%s - p.fecha_devolucion_estimada) / 86400) as dias_vencido
         FROM prestamos p
         JOIN libros l ON p.libro_id = l.libro_id
         JOIN usuarios u ON p.usuario_id = u.user_id
         WHERE p.estado = 'activo'
-        AND p.fecha_devolucion_estimada < UNIX_TIMESTAMP()
+        AND p.fecha_devolucion_estimada < %s
         ORDER BY p.fecha_devolucion_estimada
-    """)
+    """, (now_ts, now_ts))
     
-    if prestamos_vencidos:
-        for prestamo in prestamos_vencidos:
-            show_alert("Préstamo vencido", 
-                      f"El libro '{prestamo['titulo']}' prestado a {prestamo['nombre']} {prestamo['apellido']} está vencido hace {int(prestamo['dias_vencido'])} días.", 
-                      "error")
+    for prestamo in prestamos_vencidos or []:
+        alertas.append((
+            f"vencido:{prestamo['prestamo_id']}:{hoy}",
+            "Préstamo vencido",
+            f"El libro '{prestamo['titulo']}' prestado a {prestamo['nombre_completo']} está vencido hace {int(prestamo['dias_vencido'])} días.",
+            "error"
+        ))
     
     # Alertas para reservas próximas a expirar
     reservas_proximas_expirar = db_manager.execute_query("""
-        SELECT r.reserva_id, l.titulo, u.nombre, u.apellido, u.email,
+        SELECT r.reserva_id, l.titulo, u.nombre_completo, u.email,
                r.fecha_expiracion,
-               FLOOR((r.fecha_expiracion - UNIX_TIMESTAMP()) / 3600) as horas_restantes
+               FLOOR((r.fecha_expiracion - %s) / 3600) as horas_restantes
         FROM reservas r
         JOIN libros l ON r.libro_id = l.libro_id
         JOIN usuarios u ON r.usuario_id = u.user_id
         WHERE r.estado = 'pendiente'
-        AND r.fecha_expiracion BETWEEN UNIX_TIMESTAMP() AND UNIX_TIMESTAMP() + 43200
+        AND r.fecha_expiracion BETWEEN %s AND %s
         ORDER BY r.fecha_expiracion
-    """)
+    """, (now_ts, now_ts, now_ts + 43200))
+    
+    for reserva in reservas_proximas_expirar or []:
+        alertas.append((
+            f"reserva:{reserva['reserva_id']}:{hoy}",
+            "Reserva por expirar",
+            f"La reserva del libro '{reserva['titulo']}' por {reserva['nombre_completo']} expira en {int(reserva['horas_restantes'])} horas.",
+            "warning"
+        ))
+    
+    if alertas:
+        db_manager.execute_query(
+            "INSERT IGNORE INTO alertas_pendientes (clave, titulo, mensaje, icono) VALUES "
+            + ", ".join(["(%s, %s, %s, %s)"] * len(alertas)),
+            tuple(v for alerta in alertas for v in alerta),
+            return_result=False
+        )
+    
+    # Enviar correo de recordatorio (solo una vez al día)
+    _enviar_recordatorios(
+        email_manager,
+        [p for p in prestamos_proximos_vencer or [] if p['enviar_email'] and p['email']]
+    )
+
+def _bucle_alertas():
+    from src.database.database import DatabaseManager
+    from src.utils.email_manager import EmailManager
+    
+    db_manager = DatabaseManager()  # conexión propia: no se comparte con los reruns
+    email_manager = EmailManager()
+    while True:
+        try:
+            generar_alertas(db_manager, email_manager)
+        except Exception:
+            # El hilo no debe morir por un fallo puntual (BD caída, SMTP), pero queda registrado
+            logger.exception("Fallo al generar las alertas programadas")
+        time.sleep(_INTERVALO_ALERTAS)
+
+@st.cache_resource
+def iniciar_planificador_alertas():
+    """
+    Arranca (una sola vez por proceso) el hilo que genera las alertas cada hora
+    y envía los recordatorios de devolución por correo. Llamar después de init_database().
+    """
+    hilo = threading.Thread(target=_bucle_alertas, name="planificador-alertas", daemon=True)
+    hilo.start()
+    return hilo
+
+def verificar_alertas(db_manager=None):
+    """
+    Muestra las alertas pendientes generadas por el planificador
+    """
+    # Solo ejecutar para administradores y bibliotecarios
+    if 'user' not in st.session_state or st.session_state.user['role'] not in ['admin', 'bibliotecario']:
+        return
+    
+    # Importar aquí para evitar circularidad
+    from src.database.database import get_db
+    
+    db_manager = db_manager or get_db()
+    alertas = db_manager.execute_query(
+        "SELECT alerta_id, titulo, mensaje, icono FROM alertas_pendientes WHERE visto = FALSE ORDER BY alerta_id"
+    )
+    if not alertas:
+        return
+    
+    for alerta in alertas:
+        show_alert(alerta['titulo'], alerta['mensaje'], alerta['icono'])
     
-    if reservas_proximas_expirar:
-        for reserva in reservas_proximas_expirar:
-            show_alert("Reserva por expirar", 
-                      f"La reserva del libro '{reserva['titulo']}' por {reserva['nombre']} {reserva['apellido']} expira en {int(reserva['horas_restantes'])} horas.", 
-                      "warning")
\ No newline at end of file
+    if st.button("Marcar alertas como vistas", key="alertas_vistas"):
+        db_manager.execute_query(
+            "UPDATE alertas_pendientes SET visto = TRUE WHERE visto = FALSE AND alerta_id <= %s",
+            (alertas[-1]['alerta_id'],),
+            return_result=False
+        )
+        st.rerun()
@@ -1,6 +1,15 @@
 # src/utils/email_manager.py 
+import atexit
+import queue
 import smtplib
 import ssl
+import string
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from pathlib import Path
@@ -17,11 +26,215 @@ except Exception:
 
 # Jinja2 
 try:
-    from jinja2 import Environment, FileSystemLoader, select_autoescape
+    from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, ModuleLoader, select_autoescape
     JINJA_OK = True
 except Exception:
     JINJA_OK = False
 
+_TEMPLATES_DIR = Path(__file__).resolve().parents[2] / "templates" / "emails"
+_PLANTILLAS = ("prestamo_confirmacion.html", "recordatorio.html", "atraso.html", "reserva_pendiente.html")
+# Generado por scripts/compile_templates.py (plantillas ya compiladas a módulos Python)
+_COMPILED_ZIP = _TEMPLATES_DIR.parent / "compiled_templates.zip"
+
+
+def _zip_vigente() -> bool:
+    """El zip precompilado solo se usa si es más nuevo que todas las plantillas fuente."""
+    try:
+        zip_mtime = _COMPILED_ZIP.stat().st_mtime
+        return all(p.stat().st_mtime <= zip_mtime for p in _TEMPLATES_DIR.iterdir() if p.is_file())
+    except OSError:
+        return False
+
+
+def _crear_env():
+    """
+    Environment único del módulo. Si existe templates/compiled_templates.zip vigente se cargan
+    las plantillas ya compiladas; si no, se compilan una vez por proceso
+    (y el bytecode queda en disco para los siguientes arranques).
+    """
+    if not (JINJA_OK and _TEMPLATES_DIR.exists()):
+        return None
+    if _zip_vigente():
+        return Environment(
+            loader=ModuleLoader(str(_COMPILED_ZIP)),
+            autoescape=select_autoescape(["html", "xml"]),
+            auto_reload=False,
+            cache_size=400
+        )
+    try:
+        cache_dir = Path(tempfile.gettempdir()) / "biblioteca_jinja_cache"
+        cache_dir.mkdir(exist_ok=True)
+        bytecode_cache = FileSystemBytecodeCache(str(cache_dir))
+    except OSError:
+        bytecode_cache = None
+    env = Environment(
+        loader=FileSystemLoader(str(_TEMPLATES_DIR)),
+        autoescape=select_autoescape(["html", "xml"]),
+        auto_reload=False,
+        cache_size=400,
+        bytecode_cache=bytecode_cache
+    )
+    for name in _PLANTILLAS:
+        try:
+            env.get_template(name)
+        except Exception:
+            pass
+    return env
+
+
+_ENV = _crear_env()
+
+
+@lru_cache(maxsize=None)
+def _get_template(name: str):
+    return _ENV.get_template(name)
+
+
+# Envoltorio HTML de respaldo (sin Jinja): partes fijas armadas una sola vez
+_HEAD_OPEN = """
+        <!doctype html>
+        <html><head><meta charset="utf-8"><title>"""
+_HEAD_MID = """</title></head>
+        <body style="font-family:Segoe UI,Tahoma,Arial,sans-serif;background:#f9f9f9;margin:0;padding:24px">
+          <div style="max-width:600px;margin:0 auto;background:#fff;border-radius:8px;padding:24px;border:1px solid #eee">
+            <h2 style="margin-top:0">"""
+_HEAD_CLOSE = """</h2>
+            """
+_TAIL = """
+            <hr style="border:none;border-top:1px solid #eee;margin:24px 0">
+            <p style="color:#888;font-size:13px">© Biblioteca UNT</p>
+          </div>
+        </body></html>
+        """
+
+
+_TABLAS_EXISTENTES = set()  # (db_name, tabla) ya confirmadas
+
+# Registro de envíos: los INSERT en notificaciones los hace un hilo escritor en lotes
+# (executemany), así ni el request ni los hilos SMTP esperan a la BD.
+_LOG_QUEUE: "queue.SimpleQueue" = queue.SimpleQueue()
+_LOG_LOCK = threading.Lock()  # serializa la conexión de log (hilo escritor y vaciado final)
+_LOG_DB = None
+_LOG_THREAD = None
+
+
+def _log_db():
+    global _LOG_DB
+    if _LOG_DB is None:
+        from src.database.database import DatabaseManager
+        _LOG_DB = DatabaseManager()
+    return _LOG_DB
+
+
+def _drenar_logs(primero=None) -> None:
+    """Escribe todo lo encolado hasta ahora, agrupado por EmailManager, en un lote cada uno."""
+    pendientes = {} if primero is None else {id(primero[0]): (primero[0], list(primero[1]))}
+    while True:
+        try:
+            manager, rows = _LOG_QUEUE.get_nowait()
+        except queue.Empty:
+            break
+        pendientes.setdefault(id(manager), (manager, []))[1].extend(rows)
+    for manager, rows in pendientes.values():
+        manager._escribir_logs(rows)
+
+
+def _escritor_logs() -> None:
+    while True:
+        _drenar_logs(_LOG_QUEUE.get())
+
+
+def _encolar_logs(manager: "EmailManager", rows: List[tuple]) -> None:
+    global _LOG_THREAD
+    if not rows:
+        return
+    _LOG_QUEUE.put((manager, rows))
+    if _LOG_THREAD is None:
+        with _LOG_LOCK:
+            if _LOG_THREAD is None:
+                _LOG_THREAD = threading.Thread(target=_escritor_logs, name="email-log", daemon=True)
+                _LOG_THREAD.start()
+                atexit.register(_drenar_logs)
+
+_MAX_POR_CONEXION = 100   # envíos antes de renovar la conexión SMTP
+_MAX_INACTIVIDAD = 120    # segundos sin uso tras los cuales se reconecta
+_SMTP_TIMEOUT = 30
+_MAX_CONEXIONES_LOTE = 4  # conexiones simultáneas por lote (límite de tasa del servidor SMTP)
+
+
+class _SesionSMTP:
+    """
+    Conexión SMTP reutilizable entre envíos (STARTTLS + LOGIN una sola vez).
+    Se abre al primer envío y se renueva cada _MAX_POR_CONEXION mensajes,
+    tras _MAX_INACTIVIDAD segundos sin uso o si el servidor cortó la conexión.
+    """
+    def __init__(self, manager: "EmailManager", log_diferido: bool = False):
+        self.manager = manager
+        self.log_diferido = [] if log_diferido else None
+        self.server = None
+        self.enviados = 0
+        self.ultimo_ok = 0.0
+
+    def _abrir(self):
+        self.cerrar()
+        self.server = self.manager._connect()
+        self.enviados = 0
+
+    def send_message(self, msg, from_addr: str, to_addrs: List[str]):
+        if (self.server is None or self.enviados >= _MAX_POR_CONEXION
+                or time.monotonic() - self.ultimo_ok > _MAX_INACTIVIDAD):
+            self._abrir()
+        try:
+            self.server.send_message(msg, from_addr, to_addrs)
+        except smtplib.SMTPServerDisconnected:
+            self._abrir()
+            self.server.send_message(msg, from_addr, to_addrs)
+        self.enviados += 1
+        self.ultimo_ok = time.monotonic()
+
+    def cerrar(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except Exception:
+            self.server.close()
+        self.server = None
+
+
+class SMTPPool:
+    """
+    Varias _SesionSMTP compartidas por hilos: cada envío toma una libre y la devuelve.
+    Las conexiones se abren al primer uso, así el arranque también ocurre en paralelo.
+    """
+    def __init__(self, manager: "EmailManager", size: int, log_diferido: bool = False):
+        self.sesiones = [_SesionSMTP(manager, log_diferido) for _ in range(size)]
+        self._libres: "queue.Queue" = queue.Queue()
+        for sesion in self.sesiones:
+            self._libres.put(sesion)
+
+    def acquire(self) -> _SesionSMTP:
+        return self._libres.get()
+
+    def release(self, sesion: _SesionSMTP) -> None:
+        self._libres.put(sesion)
+
+    @contextmanager
+    def sesion(self):
+        sesion = self.acquire()
+        try:
+            yield sesion
+        finally:
+            self.release(sesion)
+
+    def cerrar(self) -> List[tuple]:
+        """Cierra todas las conexiones y devuelve los registros diferidos acumulados."""
+        registros = []
+        for sesion in self.sesiones:
+            sesion.cerrar()
+            registros.extend(sesion.log_diferido or [])
+        return registros
+
 
 class EmailManager:
     def __init__(self):
@@ -33,73 +246,126 @@ class EmailManager:
         self.use_tls = bool(st.secrets.get("SMTP_USE_TLS", True))
         self.from_name = str(st.secrets.get("SMTP_FROM_NAME", "Biblioteca UNT"))
         self.from_email = str(st.secrets.get("SMTP_FROM_EMAIL", self.smtp_username or "no-reply@biblioteca.edu"))
+        self.from_header = f"{self.from_name} <{self.from_email}>"
 
         # Datos de BD 
         self.db_name = str(st.secrets.get("DB_NAME", "biblioteca_db"))
 
-        # Templates
-        self.templates_dir = Path(__file__).resolve().parents[2] / "templates" / "emails"
-        self.env = None
-        if JINJA_OK and self.templates_dir.exists():
-            self.env = Environment(
-                loader=FileSystemLoader(str(self.templates_dir)),
-                autoescape=select_autoescape(["html", "xml"])
-            )
+        # Templates (compartidos por todas las instancias)
+        self.templates_dir = _TEMPLATES_DIR
+        self.env = _ENV
 
     # ---------- Templates ----------
     def _render_template(self, name: str, context: Dict) -> Optional[str]:
         if self.env:
             try:
-                tpl = self.env.get_template(name)
+                tpl = _get_template(name)
                 return tpl.render(**context)
             except Exception:
                 return None
         return None
 
-    def _basic_wrapper(self, subject: str, inner_html: str) -> str:
-        return f"""
-        <!doctype html>
-        <html><head><meta charset="utf-8"><title>{subject}</title></head>
-        <body style="font-family:Segoe UI,Tahoma,Arial,sans-serif;background:#f9f9f9;margin:0;padding:24px">
-          <div style="max-width:600px;margin:0 auto;background:#fff;border-radius:8px;padding:24px;border:1px solid #eee">
-            <h2 style="margin-top:0">{subject}</h2>
-            {inner_html}
-            <hr style="border:none;border-top:1px solid #eee;margin:24px 0">
-            <p style="color:#888;font-size:13px">© Biblioteca UNT</p>
-          </div>
-        </body></html>
-        """
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def _basic_wrapper(subject: str, inner_html: str) -> str:
+        return "".join((_HEAD_OPEN, subject, _HEAD_MID, subject, _HEAD_CLOSE, inner_html, _TAIL))
 
     # ---------- Logger seguro ----------
     def _table_exists(self, db, table: str) -> bool:
+        # Solo se recuerda el "sí": si la tabla aún no existe se vuelve a consultar
+        clave = (self.db_name, table)
+        if clave in _TABLAS_EXISTENTES:
+            return True
         try:
             q = "SELECT 1 FROM information_schema.tables WHERE table_schema=%s AND table_name=%s LIMIT 1"
             res = db.execute_query(q, (self.db_name, table))
-            return bool(res)
         except Exception:
             return False
+        if res:
+            _TABLAS_EXISTENTES.add(clave)
+        return bool(res)
 
     def _log_notification(self, subject: str, to_email: str, estado: str = "enviado") -> None:
-        # Evita mostrar el error si no existe la tabla
+        self._log_notifications_bulk([(subject, to_email, estado)])
+
+    def _log_notifications_bulk(self, rows: List[tuple]) -> None:
+        """Encola registros de envío: rows = [(subject, to_email, estado), ...]. No espera a la BD."""
+        _encolar_logs(self, rows)
+
+    def _escribir_logs(self, rows: List[tuple]) -> None:
+        """
+        Inserta los registros con un solo executemany; todos los user_id salen de un SELECT ... IN.
+        Evita mostrar el error si no existe la tabla.
+        """
+        if not rows:
+            return
         try:
-            from src.database.database import DatabaseManager
-            db = DatabaseManager()
-            if not self._table_exists(db, "notificaciones"):
-                return
-            db.execute_query(
-                "INSERT INTO notificaciones (usuario_id, tipo, asunto, mensaje, estado) "
-                "VALUES ((SELECT user_id FROM usuarios WHERE email=%s), %s, %s, %s, %s)",
-                (to_email, "email", subject, f"Email enviado: {subject}", estado),
-                return_result=False
-            )
+            with _LOG_LOCK:
+                db = _log_db()
+                if not self._table_exists(db, "notificaciones"):
+                    return
+                emails = sorted({to_email for _, to_email, _ in rows})
+                usuarios = db.execute_query(
+                    f"SELECT user_id, email FROM usuarios WHERE email IN ({', '.join(['%s'] * len(emails))})",
+                    tuple(emails)
+                ) or []
+                ids = {u["email"]: u["user_id"] for u in usuarios}
+                db.execute_many(
+                    "INSERT INTO notificaciones (usuario_id, tipo, asunto, mensaje, estado) VALUES (%s, %s, %s, %s, %s)",
+                    [(ids.get(to_email), "email", subject, f"Email enviado: {subject}", estado)
+                     for subject, to_email, estado in rows]
+                )
         except Exception:
             pass
 
+    def _registrar_envio(self, subject: str, to_email: str, estado: str, sesion: "_SesionSMTP") -> None:
+        if sesion.log_diferido is not None:
+            sesion.log_diferido.append((subject, to_email, estado))
+        else:
+            self._log_notification(subject, to_email, estado)
+
+    # ---------- Conexión ----------
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=_SMTP_TIMEOUT)
+        server.ehlo()
+        if self.use_tls:
+            server.starttls(context=ssl.create_default_context())
+            server.ehlo()
+        server.login(self.smtp_username, self.smtp_password)
+        return server
+
+    @contextmanager
+    def open_session(self, log_diferido: bool = False):
+        """
+        Sesión SMTP compartida por varios envíos: `with em.open_session() as s: em.send_email(..., sesion=s)`.
+        Con log_diferido=True los registros en notificaciones se escriben todos juntos al cerrar.
+        """
+        sesion = _SesionSMTP(self, log_diferido)
+        try:
+            yield sesion
+        finally:
+            sesion.cerrar()
+            if sesion.log_diferido:
+                self._log_notifications_bulk(sesion.log_diferido)
+
+    @contextmanager
+    def open_pool(self, size: int, log_diferido: bool = False):
+        """SMTPPool de `size` conexiones; al salir las cierra y escribe el log diferido en un lote."""
+        pool = SMTPPool(self, size, log_diferido)
+        try:
+            yield pool
+        finally:
+            self._log_notifications_bulk(pool.cerrar())
+
     # ---------- Envío base ----------
-    def send_email(self, to_email: str, subject: str, html: Optional[str] = None, text: Optional[str] = None) -> bool:
+    def send_email(self, to_email: str, subject: str, html: Optional[str] = None, text: Optional[str] = None,
+                   sesion: Optional[_SesionSMTP] = None) -> bool:
+        if sesion is None:
+            with self.open_session() as nueva:
+                return self.send_email(to_email, subject, html=html, text=text, sesion=nueva)
         try:
             msg = MIMEMultipart("alternative")
-            msg["From"] = f"{self.from_name} <{self.from_email}>"
+            msg["From"] = self.from_header
             msg["To"] = to_email
             msg["Subject"] = subject
 
@@ -108,112 +374,201 @@ class EmailManager:
             if html:
                 msg.attach(MIMEText(html, "html", "utf-8"))
 
-            context = ssl.create_default_context()
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                if self.use_tls:
-                    server.starttls(context=context)
-                server.login(self.smtp_username, self.smtp_password)
-                server.sendmail(self.from_email, [to_email], msg.as_string())
+            # send_message serializa el mensaje una sola vez dentro de smtplib (sin as_string() aparte)
+            sesion.send_message(msg, self.from_email, [to_email])
 
-            self._log_notification(subject, to_email, "enviado")
+            self._registrar_envio(subject, to_email, "enviado", sesion)
             return True
 
         except Exception as e:
-            self._log_notification(subject, to_email, "error")
+            self._registrar_envio(subject, to_email, "error", sesion)
             _ui_alert("Error al enviar correo", str(e), "error")
             return False
 
     # ---------- Dominios ----------
+    # Cuerpos de respaldo (sin Jinja), compilados una vez; se completan con el mismo contexto de la plantilla
+    _INNER_PRESTAMO = string.Template("<p>Estimado/a $usuario_nombre,</p>"
+                                      "<p>Se registró el préstamo del libro <b>“$libro_titulo”</b>.</p>"
+                                      "<p><b>Fecha de préstamo:</b> $fecha_prestamo<br>"
+                                      "<b>Fecha estimada de devolución:</b> $fecha_devolucion</p>")
+    _INNER_RECORDATORIO = string.Template("<p>Hola $usuario_nombre,</p>"
+                                          "<p>El préstamo de <b>“$libro_titulo”</b> vence el <b>$fecha_devolucion</b> "
+                                          "(en $dias_restantes día(s)).</p>")
+    _INNER_ATRASO = string.Template("<p>Hola $usuario_nombre,</p>"
+                                    "<p>El préstamo de <b>“$libro_titulo”</b> está atrasado "
+                                    "($dias_atraso día(s)). Fecha prevista: <b>$fecha_prevista</b>.</p>")
+    _INNER_RESERVA = string.Template("<p>Hola $usuario_nombre,</p>"
+                                     "<p>Tu reserva de <b>“$libro_titulo”</b> está pendiente desde "
+                                     "<b>$fecha_reserva</b> ($dias_espera día(s)).</p>")
+
     def send_prestamo_confirmacion(self, user_email: str, usuario_nombre: str,
-                                   libro_titulo: str, fecha_prestamo: str, fecha_devolucion: str) -> bool:
+                                   libro_titulo: str, fecha_prestamo: str, fecha_devolucion: str,
+                                   sesion: Optional[_SesionSMTP] = None) -> bool:
         subject = f"Confirmación de Préstamo — {libro_titulo}"
-        html = self._render_template("prestamo_confirmacion.html", {
+        ctx = {
             "subject": subject,
             "usuario_nombre": usuario_nombre,
             "libro_titulo": libro_titulo,
             "fecha_prestamo": fecha_prestamo,
             "fecha_devolucion": fecha_devolucion
-        })
+        }
+        html = self._render_template("prestamo_confirmacion.html", ctx)
         if not html:
-            inner = (f"<p>Estimado/a {usuario_nombre},</p>"
-                     f"<p>Se registró el préstamo del libro <b>“{libro_titulo}”</b>.</p>"
-                     f"<p><b>Fecha de préstamo:</b> {fecha_prestamo}<br>"
-                     f"<b>Fecha estimada de devolución:</b> {fecha_devolucion}</p>")
-            html = self._basic_wrapper(subject, inner)
-        return self.send_email(user_email, subject, html=html)
+            html = self._basic_wrapper(subject, self._INNER_PRESTAMO.substitute(ctx))
+        return self.send_email(user_email, subject, html=html, sesion=sesion)
 
     def send_recordatorio(self, user_email: str, usuario_nombre: str,
-                          libro_titulo: str, fecha_devolucion: str, dias_restantes: int) -> bool:
+                          libro_titulo: str, fecha_devolucion: str, dias_restantes: int,
+                          sesion: Optional[_SesionSMTP] = None) -> bool:
         subject = f"Recordatorio de Devolución — {libro_titulo}"
-        html = self._render_template("recordatorio.html", {
+        ctx = {
             "subject": subject,
             "usuario_nombre": usuario_nombre,
             "libro_titulo": libro_titulo,
             "fecha_devolucion": fecha_devolucion,
             "dias_restantes": dias_restantes
-        })
+        }
+        html = self._render_template("recordatorio.html", ctx)
         if not html:
-            inner = (f"<p>Hola {usuario_nombre},</p>"
-                     f"<p>El préstamo de <b>“{libro_titulo}”</b> vence el <b>{fecha_devolucion}</b> "
-                     f"(en {dias_restantes} día(s)).</p>")
-            html = self._basic_wrapper(subject, inner)
-        return self.send_email(user_email, subject, html=html)
+            html = self._basic_wrapper(subject, self._INNER_RECORDATORIO.substitute(ctx))
+        return self.send_email(user_email, subject, html=html, sesion=sesion)
 
     def send_atraso(self, user_email: str, usuario_nombre: str,
-                    libro_titulo: str, fecha_prevista: str, dias_atraso: int) -> bool:
+                    libro_titulo: str, fecha_prevista: str, dias_atraso: int,
+                    sesion: Optional[_SesionSMTP] = None) -> bool:
         subject = f"⚠️ Atraso de Devolución — {libro_titulo}"
-        html = self._render_template("atraso.html", {
+        ctx = {
             "subject": subject,
             "usuario_nombre": usuario_nombre,
             "libro_titulo": libro_titulo,
             "fecha_prevista": fecha_prevista,
             "dias_atraso": dias_atraso
-        })
+        }
+        html = self._render_template("atraso.html", ctx)
         if not html:
-            inner = (f"<p>Hola {usuario_nombre},</p>"
-                     f"<p>El préstamo de <b>“{libro_titulo}”</b> está atrasado "
-                     f"({dias_atraso} día(s)). Fecha prevista: <b>{fecha_prevista}</b>.</p>")
-            html = self._basic_wrapper(subject, inner)
-        return self.send_email(user_email, subject, html=html)
+            html = self._basic_wrapper(subject, self._INNER_ATRASO.substitute(ctx))
+        return self.send_email(user_email, subject, html=html, sesion=sesion)
 
     def send_reserva_pendiente(self, user_email: str, usuario_nombre: str,
-                               libro_titulo: str, fecha_reserva: str, dias_espera: int) -> bool:
+                               libro_titulo: str, fecha_reserva: str, dias_espera: int,
+                               sesion: Optional[_SesionSMTP] = None) -> bool:
         subject = f"Reserva Pendiente — {libro_titulo}"
-        html = self._render_template("reserva_pendiente.html", {
+        ctx = {
             "subject": subject,
             "usuario_nombre": usuario_nombre,
             "libro_titulo": libro_titulo,
             "fecha_reserva": fecha_reserva,
             "dias_espera": dias_espera
-        })
+        }
+        html = self._render_template("reserva_pendiente.html", ctx)
         if not html:
-            inner = (f"<p>Hola {usuario_nombre},</p>"
-                     f"<p>Tu reserva de <b>“{libro_titulo}”</b> está pendiente desde "
-                     f"<b>{fecha_reserva}</b> ({dias_espera} día(s)).</p>")
-            html = self._basic_wrapper(subject, inner)
-        return self.send_email(user_email, subject, html=html)
+            html = self._basic_wrapper(subject, self._INNER_RESERVA.substitute(ctx))
+        return self.send_email(user_email, subject, html=html, sesion=sesion)
 
     # ---------- Bulk ----------
-    def bulk_atrasos(self, rows: List[Dict]) -> Dict[str, int]:
-        ok = 0
-        for r in rows:
-            ok += 1 if self.send_atraso(
-                r["email"], r["nombre_completo"], r["titulo"], r["fecha_prevista"], r["dias_atraso"]
-            ) else 0
+    # Pocas conexiones SMTP persistentes usadas en paralelo: el envío es I/O, los hilos
+    # solapan las esperas en lugar de hacer un handshake TCP+TLS+AUTH por correo.
+    def _bulk(self, tipo: str, rows: List[Dict]) -> Dict[str, int]:
+        if not rows:
+            return {"ok": 0, "total": 0}
+        metodo, argumentos = _LOTES[tipo]
+        enviar = getattr(self, metodo)
+        workers = min(_MAX_CONEXIONES_LOTE, len(rows))
+
+        with self.open_pool(workers, log_diferido=True) as pool:
+            def _uno(r):
+                with pool.sesion() as sesion:
+                    return enviar(*argumentos(r), sesion=sesion)
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                ok = sum(1 for enviado in executor.map(_uno, rows) if enviado)
         return {"ok": ok, "total": len(rows)}
 
+    def bulk_atrasos(self, rows: List[Dict]) -> Dict[str, int]:
+        return self._bulk("atrasos", rows)
+
     def bulk_por_vencer(self, rows: List[Dict]) -> Dict[str, int]:
-        ok = 0
-        for r in rows:
-            ok += 1 if self.send_recordatorio(
-                r["email"], r["nombre_completo"], r["titulo"], r["fecha_prevista"], int(r["dias_restantes"])
-            ) else 0
-        return {"ok": ok, "total": len(rows)}
+        return self._bulk("por_vencer", rows)
 
     def bulk_reservas(self, rows: List[Dict]) -> Dict[str, int]:
-        ok = 0
-        for r in rows:
-            ok += 1 if self.send_reserva_pendiente(
-                r["email"], r["nombre_completo"], r["titulo"], r["fecha_reserva_str"], int(r["dias_espera"])
-            ) else 0
-        return {"ok": ok, "total": len(rows)}
+        return self._bulk("reservas", rows)
+
+
+# Lotes: tipo -> (método de EmailManager, argumentos a partir de la fila)
+_LOTES = {
+    "atrasos": ("send_atraso", lambda r: (
+        r["email"], r["nombre_completo"], r["titulo"], r["fecha_prevista"], r["dias_atraso"])),
+    "por_vencer": ("send_recordatorio", lambda r: (
+        r["email"], r["nombre_completo"], r["titulo"], r["fecha_prevista"], int(r["dias_restantes"]))),
+    "reservas": ("send_reserva_pendiente", lambda r: (
+        r["email"], r["nombre_completo"], r["titulo"], r["fecha_reserva_str"], int(r["dias_espera"]))),
+}
+
+
+class EmailDispatcher:
+    """
+    Cola de correos atendida por hilos en segundo plano: encolar es inmediato y el
+    rerun de Streamlit no espera al SMTP. Cada hilo tiene su propio EmailManager y
+    su propia conexión SMTP persistente, que cierra si queda inactiva.
+    """
+    def __init__(self, workers: int = 4):
+        self.cola: "queue.Queue" = queue.Queue()
+        self.hilos = [
+            threading.Thread(target=self._worker, name=f"email-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for hilo in self.hilos:
+            hilo.start()
+
+    def _worker(self):
+        manager = EmailManager()
+        with manager.open_session() as sesion:
+            while True:
+                try:
+                    item = self.cola.get(timeout=_MAX_INACTIVIDAD)
+                except queue.Empty:
+                    sesion.cerrar()
+                    continue
+                if item is None:
+                    self.cola.task_done()
+                    return
+                futuro, metodo, args = item
+                try:
+                    futuro.set_result(getattr(manager, metodo)(*args, sesion=sesion))
+                except Exception as e:
+                    futuro.set_exception(e)
+                finally:
+                    self.cola.task_done()
+
+    def encolar(self, metodo: str, *args) -> Future:
+        """Encola `EmailManager.<metodo>(*args)`; el Future resuelve al bool del envío."""
+        futuro = Future()
+        self.cola.put((futuro, metodo, args))
+        return futuro
+
+    def encolar_lote(self, tipo: str, rows: List[Dict]) -> List[Future]:
+        """Equivalente en segundo plano de bulk_atrasos / bulk_por_vencer / bulk_reservas."""
+        metodo, argumentos = _LOTES[tipo]
+        return [self.encolar(metodo, *argumentos(r)) for r in rows]
+
+    def shutdown(self, timeout: float = 30):
+        """Deja terminar lo ya encolado y detiene los hilos."""
+        for _ in self.hilos:
+            self.cola.put(None)
+        limite = time.monotonic() + timeout
+        for hilo in self.hilos:
+            hilo.join(max(limite - time.monotonic(), 0))
+
+
+@st.cache_resource
+def get_email_manager() -> EmailManager:
+    """EmailManager único por proceso: no se reconstruye en cada rerun."""
+    return EmailManager()
+
+
+@st.cache_resource
+def get_email_dispatcher() -> EmailDispatcher:
+    """Despachador único por proceso."""
+    dispatcher = EmailDispatcher()
+    atexit.register(dispatcher.shutdown)
+    return dispatcher
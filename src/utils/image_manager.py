@@ -1,61 +1,139 @@
 # src/utils/image_manager.py - Gestión de imágenes
 import os
 import streamlit as st
-from PIL import Image as PILImage
+from PIL import Image as PILImage, ImageOps
 import base64
-import time
+import hashlib
+from functools import cached_property
+from io import BytesIO
 from src.database.database import DatabaseManager
 from src.utils.alert_utils import show_sweet_alert
 
+_EXTENSIONES = ('jpg', 'jpeg', 'png')
+_MAX_BYTES = 2 * 1024 * 1024  # 2MB
+_MAX_LADO = (800, 1200)            # tamaño máximo guardado (ancho, alto)
+_MINIATURA = (200, 300)            # variante para vistas con width <= 200
+_UMBRAL_ORIGINAL = 150 * 1024      # por debajo (y dentro de _MAX_LADO) se guarda el original tal cual
+
+
+_CARPETAS_LISTAS = set()  # carpetas de subida ya creadas en este proceso
+
+
+def _asegurar_carpeta(path):
+    if path not in _CARPETAS_LISTAS:
+        os.makedirs(path, exist_ok=True)
+        _CARPETAS_LISTAS.add(path)
+
+
+def _ruta_miniatura(filepath):
+    return f"{os.path.splitext(filepath)[0]}_thumb.webp"
+
+
+def miniatura(filepath):
+    """Ruta de la miniatura de una imagen subida si existe; si no, la imagen original."""
+    if filepath:
+        thumb = _ruta_miniatura(filepath)
+        if os.path.exists(thumb):
+            return thumb
+    return filepath
+
+
+def _webp(im, quality):
+    buf = BytesIO()
+    im.save(buf, "WEBP", quality=quality, method=4)
+    return buf.getvalue()
+
 class ImageManager:
     def __init__(self):
-        self.db_manager = DatabaseManager()
         self.upload_folder = "uploads"
-        if not os.path.exists(self.upload_folder):
-            os.makedirs(self.upload_folder)
+        _asegurar_carpeta(self.upload_folder)
+        # (archivo, bytes) de la última validación correcta, para que save_image no lo relea
+        self._ultima_validada = None
 
     def get_default_cover(self):
        """Retorna la ruta de la imagen por defecto para portadas de libros"""
        return "assets/default_cover.jpg"
 
+    def _leer_validada(self, image_file):
+        """
+        Valida el archivo leyéndolo una sola vez: (ok, mensaje, bytes).
+        Extensión y tamaño se revisan antes de cualquier trabajo con PIL.
+        """
+        # Verificar extensión
+        file_ext = os.path.splitext(image_file.name)[1].lower().lstrip(".")
+        if file_ext not in _EXTENSIONES:
+            return False, "Formato de archivo no permitido. Use JPG, JPEG o PNG.", None
+
+        # Verificar tamaño (máximo 2MB)
+        if image_file.size > _MAX_BYTES:
+            return False, f"El archivo es demasiado grande. Tamaño máximo: 2MB.", None
+
+        # Verificar que sea una imagen válida (sobre una copia en memoria: no consume el upload)
+        data = image_file.getvalue()
+        PILImage.open(BytesIO(data)).verify()
+        return True, "Imagen válida", data
+
     def validate_image(self, image_file):
         """Valida que el archivo sea una imagen y cumpla con los requisitos"""
         try:
-            # Verificar extensión
-            allowed_extensions = ['jpg', 'jpeg', 'png']
-            file_ext = image_file.name.split('.')[-1].lower()
-            if file_ext not in allowed_extensions:
-                return False, "Formato de archivo no permitido. Use JPG, JPEG o PNG."
-            
-            # Verificar tamaño (máximo 2MB)
-            max_size = 2 * 1024 * 1024
-            if image_file.size > max_size:
-                return False, f"El archivo es demasiado grande. Tamaño máximo: 2MB."
-            
-            # Verificar que sea una imagen válida y obtener dimensiones
-            image = PILImage.open(image_file)
-            image.verify()
-            
-            return True, "Imagen válida"
+            is_valid, message, data = self._leer_validada(image_file)
         except Exception as e:
+            self._ultima_validada = None
             return False, f"Error validando imagen: {str(e)}"
+        self._ultima_validada = (image_file, data) if is_valid else None
+        return is_valid, message
     
+    @cached_property
+    def db_manager(self):
+        # Solo se conecta si se usa (borrado de imágenes); la mayoría de vistas no lo necesita
+        return DatabaseManager()
+
+    def _reencodar(self, data, file_ext):
+        """
+        (bytes a guardar, extensión, bytes de la miniatura). Las imágenes grandes se reducen
+        a _MAX_LADO y se recodifican en WEBP; las pequeñas se conservan sin cambios.
+        """
+        im = ImageOps.exif_transpose(PILImage.open(BytesIO(data)))
+        modo = "RGBA" if ("A" in im.getbands() or "transparency" in im.info) else "RGB"
+        im = im.convert(modo)
+
+        thumb = im.copy()
+        thumb.thumbnail(_MINIATURA, PILImage.LANCZOS)
+        thumb_bytes = _webp(thumb, 75)
+
+        if len(data) <= _UMBRAL_ORIGINAL and im.width <= _MAX_LADO[0] and im.height <= _MAX_LADO[1]:
+            return data, file_ext, thumb_bytes
+        im.thumbnail(_MAX_LADO, PILImage.LANCZOS)
+        return _webp(im, 80), "webp", thumb_bytes
+
     def save_image(self, image_file, entity_type, entity_id):
         try:
-            # Validar imagen
-            is_valid, message = self.validate_image(image_file)
-            if not is_valid:
-                show_sweet_alert("Error", message, "error")
-                return None
+            # Reutilizar los bytes si el mismo archivo se acaba de validar
+            previa, self._ultima_validada = self._ultima_validada, None
+            if previa is not None and previa[0] is image_file:
+                data = previa[1]
+            else:
+                is_valid, message, data = self._leer_validada(image_file)
+                if not is_valid:
+                    show_sweet_alert("Error", message, "error")
+                    return None
             
-            # Generar nombre único para el archivo
-            file_ext = image_file.name.split('.')[-1].lower()
-            filename = f"{entity_type}_{entity_id}_{int(time.time())}.{file_ext}"
+            # Reducir/recodificar antes de guardar
+            file_ext = os.path.splitext(image_file.name)[1].lower().lstrip(".")
+            data, file_ext, thumb_bytes = self._reencodar(data, file_ext)
+
+            # Nombre por contenido: la misma imagen subida otra vez reutiliza el archivo existente
+            digest = hashlib.blake2b(data, digest_size=8).hexdigest()
+            filename = f"{entity_type}_{entity_id}_{digest}.{file_ext}"
             filepath = os.path.join(self.upload_folder, filename)
+            if os.path.exists(filepath) and os.path.exists(_ruta_miniatura(filepath)):
+                return filepath
             
-            # Guardar archivo
+            # Guardar archivo y su miniatura
             with open(filepath, "wb") as f:
-                f.write(image_file.getbuffer())
+                f.write(data)
+            with open(_ruta_miniatura(filepath), "wb") as f:
+                f.write(thumb_bytes)
             
             # Retornar el filepath en lugar del ID para una referencia directa
             return filepath
@@ -63,11 +141,32 @@ class ImageManager:
             show_sweet_alert("Error", f"Error guardando imagen: {e}", "error")
             return None
     
-    def delete_image_by_path(self, filepath):
-        """Elimina un archivo de imagen dado su filepath."""
+    def _referencias(self, filepath):
+        """Cuántos libros/usuarios apuntan a este archivo (con nombres por contenido puede compartirse)."""
+        res = self.db_manager.execute_query(
+            """
+            SELECT (SELECT COUNT(*) FROM libros WHERE portada_id = %s)
+                 + (SELECT COUNT(*) FROM usuarios WHERE foto_perfil_id = %s) AS total
+            """,
+            (filepath, filepath)
+        )
+        return int(res[0]["total"]) if res else 0
+
+    def delete_image_by_path(self, filepath, propias=1):
+        """
+        Elimina un archivo de imagen dado su filepath (si ningún otro registro lo sigue usando).
+        `propias`: cuántas de las referencias en la BD pertenecen a quien llama (1 si su fila
+        aún apunta al archivo; 0 si no, p. ej. cuando falló el INSERT del libro nuevo).
+        """
         try:
             if filepath and os.path.exists(filepath):
+                # Con nombres por contenido, otro libro/usuario puede compartir el mismo archivo
+                if self._referencias(filepath) > propias:
+                    return False
                 os.remove(filepath)
+                thumb = _ruta_miniatura(filepath)
+                if os.path.exists(thumb):
+                    os.remove(thumb)
                 return True
             return False
         except Exception as e:
@@ -83,6 +182,8 @@ class ImageManager:
     def display_image(self, image_data, caption=None, width=200):
         """Muestra una imagen en Streamlit"""
         if image_data:
+            if isinstance(image_data, str) and width and width <= _MINIATURA[0]:
+                image_data = miniatura(image_data)
             st.image(image_data, caption=caption, width=width)
         else:
             st.info("❌ No hay imagen disponible")
\ No newline at end of file
@@ -1,9 +1,14 @@
 # src/utils/reports.py
 # Generación robusta de PDF solo en memoria
 from __future__ import annotations
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from io import BytesIO
 from datetime import datetime
-from typing import List, Dict, Optional
+from functools import lru_cache
+from xml.sax.saxutils import escape
+from typing import Callable, List, Dict, Optional
 
 try:
     from zoneinfo import ZoneInfo
@@ -18,12 +23,21 @@ try:
     from reportlab.lib.pagesizes import A4, landscape
     from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
     from reportlab.lib.units import cm
+    from reportlab.pdfbase.pdfmetrics import stringWidth
     from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
     from reportlab.platypus.tables import LongTable, TableStyle
     _HAS_REPORTLAB = True
 except Exception:
     pass
 
+# Une los trozos del render en paralelo (si faltara, los reportes grandes se dibujan en serie)
+_HAS_PYPDF = False
+try:
+    from pypdf import PdfWriter
+    _HAS_PYPDF = True
+except Exception:
+    pass
+
 if not _HAS_REPORTLAB:
     try:
         from fpdf import FPDF
@@ -34,14 +48,21 @@ if not _HAS_REPORTLAB:
 # -------------------------
 # Utilidades de formateo
 # -------------------------
+_FMT12 = '%d/%m/%Y %I:%M %p'
+
+
+@lru_cache(maxsize=8192)
+def _fmt12_epoch(ival: int) -> str:
+    # En un reporte muchas filas comparten fecha: cada epoch se formatea una sola vez
+    return datetime.fromtimestamp(ival, tz=LIMA).strftime(_FMT12)
+
+
 def _fmt12(ts: object) -> str:
     try:
         ival = int(ts)
     except Exception:
         return str(ts)
-    if LIMA is not None:
-        return datetime.fromtimestamp(ival, tz=LIMA).strftime('%d/%m/%Y %I:%M %p')
-    return datetime.fromtimestamp(ival).strftime('%d/%m/%Y %I:%M %p')
+    return _fmt12_epoch(ival)
 
 
 def _translate_headers(keys: List[str]) -> List[str]:
@@ -78,28 +99,81 @@ def _translate_headers(keys: List[str]) -> List[str]:
     return [mapping.get(k, k.replace("_", " ").capitalize()) for k in keys]
 
 
-def _format_cell(key: str, val: object) -> str:
+def _fmt_fecha(val: object) -> str:
+    return "-" if val is None else _fmt12(val)
+
+
+def _fmt_atrasado(val: object) -> str:
     if val is None:
         return "-"
+    s = str(val)
+    if s in ("1", "True", "true", "Sí", "Si"):
+        return "Sí"
+    if s in ("0", "False", "false", "No"):
+        return "No"
+    return s
+
+
+def _fmt_capitalize(val: object) -> str:
+    return "-" if val is None else str(val).capitalize()
+
+
+def _fmt_monto(val: object) -> str:
+    if val is None:
+        return "-"
+    try:
+        return f"S/ {float(val):.2f}"
+    except Exception:
+        return str(val)
+
+
+def _fmt_str(val: object) -> str:
+    return "-" if val is None else str(val)
+
+
+def _pick_formatter(key: str) -> Callable[[object], str]:
+    """Elige el formateador de una columna una sola vez, fuera del bucle por celda."""
     k = (key or "").lower()
     if k.startswith("fecha_") or k.endswith("_ts") or k.endswith("_epoch"):
-        return _fmt12(val)
-    if k in ("atrasado",):
-        s = str(val)
-        if s in ("1", "True", "true", "Sí", "Si"):
-            return "Sí"
-        if s in ("0", "False", "false", "No"):
-            return "No"
-    if k == "role":
-        return str(val).capitalize()
-    if k == "estado":
-        return str(val).capitalize()
+        return _fmt_fecha
+    if k == "atrasado":
+        return _fmt_atrasado
+    if k in ("role", "estado"):
+        return _fmt_capitalize
     if k == "monto":
-        try:
-            return f"S/ {float(val):.2f}"
-        except Exception:
-            return str(val)
-    return str(val)
+        return _fmt_monto
+    return _fmt_str
+
+
+def _format_cell(key: str, val: object) -> str:
+    return _pick_formatter(key)(val)
+
+# Columnas de texto libre que pueden necesitar varias líneas: solo estas van en Paragraph
+# (parsear mini-HTML por celda es lo más caro del render); el resto se dibuja como texto plano.
+_WRAP_COLS = {"titulo", "libro", "autor", "usuario", "editorial", "categoria", "observaciones", "motivo"}
+
+_MUESTRA_ANCHOS = 200   # filas que se miden para repartir el ancho entre columnas
+
+
+def _col_widths(keys: List[str], headers: List[str], datos: List[Dict], fmts: List[Callable[[object], str]],
+                available: float, min_w: float, max_w: float) -> List[float]:
+    """
+    Reparte el ancho disponible en proporción al largo (en caracteres) de cada columna,
+    medido sobre una muestra de filas: las columnas numéricas quedan angostas y los títulos
+    ganan espacio (menos saltos de línea y menos páginas). Cada ancho se acota a [min_w, max_w].
+    """
+    muestra = datos[:_MUESTRA_ANCHOS]
+    largos = [
+        max([1, len(h)] + [len(fmts[j](r.get(k, ""))) for r in muestra])
+        for j, (k, h) in enumerate(zip(keys, headers))
+    ]
+    total = sum(largos) or 1
+    anchos = [min(max(available * n / total, min_w), max_w) for n in largos]
+    # Los mínimos pueden desbordar la página con muchas columnas: se reescala al disponible
+    suma = sum(anchos)
+    if suma > available:
+        anchos = [w * available / suma for w in anchos]
+    return anchos
 
 # -------------------------
 # Render con REPORTLAB 
@@ -118,8 +192,14 @@ def _render_with_reportlab(datos: List[Dict], titulo: str) -> bytes:
 
     table_data = []
     table_data.append([Paragraph(str(h), head_style) for h in headers])
+    wrap = [k in _WRAP_COLS for k in keys]
+    fmts = [_pick_formatter(k) for k in keys]
     for row in datos:
-        table_data.append([Paragraph(_format_cell(k, row.get(k, "")), body_style) for k in keys])
+        table_data.append([
+            Paragraph(escape(fmts[i](row.get(k, ""))), body_style) if wrap[i]
+            else fmts[i](row.get(k, ""))
+            for i, k in enumerate(keys)
+        ])
 
     pagesize = A4 if len(headers) <= 7 else landscape(A4)
 
@@ -132,12 +212,14 @@ def _render_with_reportlab(datos: List[Dict], titulo: str) -> bytes:
     available_width = page_width - (doc.leftMargin + doc.rightMargin)
 
     from reportlab.platypus import LongTable, TableStyle
-    col_widths = [available_width / len(headers)] * len(headers)
+    col_widths = _col_widths(keys, headers, datos, fmts, available_width, 1.2 * cm, 6 * cm)
 
     table = LongTable(table_data, colWidths=col_widths, repeatRows=1, splitByRow=1)
     table.setStyle(TableStyle([
         ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#F0F0F0")),
         ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+        ("FONT", (0, 1), (-1, -1), "Helvetica", 9, 11),
+        ("VALIGN", (0, 0), (-1, -1), "TOP"),
     ]))
 
     story = []
@@ -155,9 +237,198 @@ def _render_with_reportlab(datos: List[Dict], titulo: str) -> bytes:
         canvas.restoreState()
 
     doc.build(story, onFirstPage=_footer, onLaterPages=_footer)
-    pdf = buffer.getvalue()
-    buffer.close()
-    return pdf
+    # getvalue() entrega el bytes interno del BytesIO sin copiarlo (no hay vistas exportadas);
+    # getbuffer() obligaría a copiar después para obtener bytes cacheables.
+    return buffer.getvalue()
+
+# -------------------------
+# Render directo en canvas (reportes grandes)
+# -------------------------
+_FAST_ROWS = 5000       # a partir de aquí se evita Platypus
+_FAST_FONT_SIZE = 8
+_FAST_ROW_H = _FAST_FONT_SIZE + 4
+_FAST_MARGINS = (1.3 * cm, 1.3 * cm, 1.7 * cm, 1.7 * cm) if _HAS_REPORTLAB else None
+_FAST_TITLE_H = 40      # alto del título + "Generado:" en la primera página
+_MAX_PROCESOS = 8
+
+
+def _fast_geometria(ncols: int):
+    """Tamaño de página y filas por página (primera y siguientes) del render en canvas."""
+    pagesize = A4 if ncols <= 7 else landscape(A4)
+    _, page_height = pagesize
+    _, _, top, bottom = _FAST_MARGINS
+    y = page_height - top
+    filas_resto = max(int((y - _FAST_ROW_H - bottom) // _FAST_ROW_H), 1)
+    filas_primera = max(int((y - _FAST_TITLE_H - _FAST_ROW_H - bottom) // _FAST_ROW_H), 1)
+    return pagesize, filas_primera, filas_resto
+
+
+def _fast_col_widths(datos: List[Dict]) -> List[float]:
+    keys = list(datos[0].keys())
+    pagesize, _, _ = _fast_geometria(len(keys))
+    left, right, _, _ = _FAST_MARGINS
+    return _col_widths(keys, _translate_headers(keys), datos, [_pick_formatter(k) for k in keys],
+                       pagesize[0] - left - right, 1.2 * cm, 6 * cm)
+
+
+_FAST_PADDING = 4        # 2 pt a cada lado del texto dentro de la celda
+
+
+def _fast_cabe_en_linea(datos: List[Dict]) -> bool:
+    """
+    True si ninguna celda (de todas las filas) supera el ancho de su columna en el render en canvas.
+    Se mide el texto real con stringWidth (acelerado en C), no un promedio por carácter.
+    """
+    keys = list(datos[0].keys())
+    fmts = [_pick_formatter(k) for k in keys]
+    anchos = [w - _FAST_PADDING for w in _fast_col_widths(datos)]
+    return all(
+        stringWidth(fmts[j](row.get(k, "")).replace("\n", " "), "Helvetica", _FAST_FONT_SIZE) <= anchos[j]
+        for row in datos
+        for j, k in enumerate(keys)
+    )
+
+
+def _recorta_a_ancho(texto: str, ancho: float, fuente: str) -> str:
+    """Texto más largo (con "…") cuyo ancho medido cabe en `ancho` puntos."""
+    lo, hi = 0, len(texto)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if stringWidth(texto[:mid] + "…", fuente, _FAST_FONT_SIZE) <= ancho:
+            lo = mid
+        else:
+            hi = mid - 1
+    return texto[:lo] + "…"
+
+
+def _render_with_reportlab_fast(datos: List[Dict], titulo: str, col_w: Optional[List[float]] = None,
+                                pagina_inicial: int = 1, con_titulo: bool = True) -> bytes:
+    """
+    Dibuja la tabla fila por fila con canvas.drawString, sin flowables: sin medición
+    ni partición de celdas. Cada celda ocupa una línea; generar_reporte_pdf solo llega aquí si
+    todas caben (ver _fast_cabe_en_linea). Lo que aun así no cabe (p. ej. un encabezado) se
+    recorta al ancho medido de su columna y la página lo indica en el pie.
+    col_w / pagina_inicial / con_titulo permiten renderizar un trozo de un reporte mayor.
+    """
+    from reportlab.pdfgen import canvas as rl_canvas
+
+    keys = list(datos[0].keys())
+    headers = _translate_headers(keys)
+    fmts = [_pick_formatter(k) for k in keys]
+
+    pagesize, _, _ = _fast_geometria(len(headers))
+    page_width, page_height = pagesize
+    left, right, top, bottom = _FAST_MARGINS
+
+    if col_w is None:
+        col_w = _fast_col_widths(datos)
+    xs = [left]
+    for w in col_w:
+        xs.append(xs[-1] + w)
+    row_h = _FAST_ROW_H
+    anchos = [w - _FAST_PADDING for w in col_w]
+    recortes = [False]  # ¿la página actual recortó alguna celda?
+
+    def _corta(texto: str, j: int, fuente: str = "Helvetica") -> str:
+        texto = texto.replace("\n", " ")
+        if stringWidth(texto, fuente, _FAST_FONT_SIZE) <= anchos[j]:
+            return texto
+        recortes[0] = True
+        return _recorta_a_ancho(texto, anchos[j], fuente)
+
+    buffer = BytesIO()
+    c = rl_canvas.Canvas(buffer, pagesize=pagesize)
+    c.setTitle(titulo or "Reporte")
+    ahora = datetime.now(tz=LIMA) if LIMA else datetime.now()
+
+    i, page, total = 0, pagina_inicial, len(datos)
+    while True:
+        y = page_height - top
+        if con_titulo and page == pagina_inicial:
+            c.setFont("Helvetica-Bold", 14)
+            c.drawString(left, y - 14, titulo or "Reporte")
+            c.setFont("Helvetica", 9)
+            c.drawString(left, y - 30, f"Generado: {ahora.strftime('%d/%m/%Y %I:%M %p')}")
+            y -= _FAST_TITLE_H
+
+        recortes[0] = False
+        # Encabezado (se repite en cada página)
+        c.setFillColor(colors.HexColor("#F0F0F0"))
+        c.rect(left, y - row_h, xs[-1] - left, row_h, fill=1, stroke=0)
+        c.setFillColor(colors.black)
+        c.setFont("Helvetica-Bold", _FAST_FONT_SIZE)
+        for j, h in enumerate(headers):
+            c.drawString(xs[j] + 2, y - row_h + 3, _corta(h, j, "Helvetica-Bold"))
+
+        filas = max(int((y - row_h - bottom) // row_h), 1)
+        bloque = datos[i:i + filas]
+        c.setFont("Helvetica", _FAST_FONT_SIZE)
+        yy = y - row_h
+        for row in bloque:
+            yy -= row_h
+            for j, k in enumerate(keys):
+                c.drawString(xs[j] + 2, yy + 3, _corta(fmts[j](row.get(k, "")), j))
+
+        c.setStrokeColor(colors.grey)
+        c.setLineWidth(0.25)
+        c.grid(xs, [y - r * row_h for r in range(len(bloque) + 2)])
+
+        c.setFont("Helvetica", 8)
+        c.drawRightString(page_width - right, 1.0 * cm, f"Página {page}")
+        if recortes[0]:
+            c.drawString(left, 1.0 * cm, "… = texto recortado al ancho de la columna")
+
+        i += len(bloque)
+        if i >= total:
+            break
+        c.showPage()
+        page += 1
+
+    c.save()
+    return buffer.getvalue()
+
+
+def _render_chunk(args) -> bytes:
+    # Nivel de módulo para que ProcessPoolExecutor pueda serializarla
+    chunk, titulo, col_w, pagina_inicial, con_titulo = args
+    return _render_with_reportlab_fast(chunk, titulo, col_w, pagina_inicial, con_titulo)
+
+
+def _render_with_reportlab_parallel(datos: List[Dict], titulo: str) -> bytes:
+    """
+    Reparte las páginas del render en canvas entre procesos (ReportLab es CPU puro y
+    no suelta el GIL) y une los PDF parciales con pypdf. Los cortes caen en límites de
+    página, así cada trozo conoce su número de página inicial.
+    """
+    _, filas_primera, filas_resto = _fast_geometria(len(datos[0]))
+    total = len(datos)
+    paginas = 1 + -(-max(total - filas_primera, 0) // filas_resto)
+    procesos = min(os.cpu_count() or 1, _MAX_PROCESOS, paginas)
+    if procesos < 2:
+        return _render_with_reportlab_fast(datos, titulo)
+
+    def _fila(pagina: int) -> int:
+        # Índice de la primera fila de la página (base 0)
+        return 0 if pagina == 0 else filas_primera + (pagina - 1) * filas_resto
+
+    col_w = _fast_col_widths(datos)
+    por_trozo = -(-paginas // procesos)
+    trozos = [
+        (datos[_fila(p):_fila(p + por_trozo)], titulo, col_w, p + 1, p == 0)
+        for p in range(0, paginas, por_trozo)
+    ]
+    # spawn y no fork: el servidor de Streamlit ya tiene hilos (alertas, correo, logs) y
+    # sockets de BD/SMTP abiertos que no deben duplicarse en los procesos hijos
+    with ProcessPoolExecutor(max_workers=len(trozos), mp_context=multiprocessing.get_context("spawn")) as ex:
+        partes = list(ex.map(_render_chunk, trozos))
+
+    writer = PdfWriter()
+    for parte in partes:
+        writer.append(BytesIO(parte))
+    writer.add_metadata({"/Title": titulo or "Reporte"})
+    out = BytesIO()
+    writer.write(out)
+    return out.getvalue()
 
 # -------------------------
 # Render con FPDF (fallback)
@@ -180,7 +451,8 @@ def _render_with_fpdf(datos: List[Dict], titulo: str) -> bytes:
     pdf.cell(0, 8, txt=f"Generado: {ahora.strftime('%d/%m/%Y %I:%M %p')}", ln=1)
     pdf.ln(2)
 
-    col_w = [pdf.w / len(headers)] * len(headers)
+    fmts = [_pick_formatter(k) for k in keys]
+    col_w = _col_widths(keys, headers, datos, fmts, pdf.w - pdf.l_margin - pdf.r_margin, 12, 60)
 
     pdf.set_font("Arial", "B", 9)
     for i, h in enumerate(headers):
@@ -190,14 +462,17 @@ def _render_with_fpdf(datos: List[Dict], titulo: str) -> bytes:
     pdf.set_font("Arial", "", 8)
     for row in datos:
         for i, k in enumerate(keys):
-            pdf.multi_cell(col_w[i], 5, _format_cell(k, row.get(k, "")), border=1, align="L", max_line_height=5)
+            pdf.multi_cell(col_w[i], 5, fmts[i](row.get(k, "")), border=1, align="L", max_line_height=5)
             x = pdf.get_x() + col_w[i]
             y = pdf.get_y() - 5
             pdf.set_xy(x, y)
         pdf.ln()
 
-    pdf_bytes = pdf.output(dest="S").encode("latin1")
-    return pdf_bytes
+    # fpdf 1.x devuelve str (latin-1); fpdf2 ya devuelve un bytearray
+    out = pdf.output(dest="S")
+    if isinstance(out, str):
+        return out.encode("latin1")
+    return bytes(out)
 
 # ==============================
 # API PÚBLICA
@@ -207,6 +482,15 @@ def generar_reporte_pdf(report_id: str, datos: List[Dict], titulo: Optional[str]
         datos = [{"mensaje": "Sin datos para mostrar"}]
 
     if _HAS_REPORTLAB:
+        # El render en canvas no parte celdas: si la muestra necesita varias líneas, se usa Platypus
+        if len(datos) > _FAST_ROWS and _fast_cabe_en_linea(datos):
+            if _HAS_PYPDF:
+                try:
+                    return _render_with_reportlab_parallel(datos, titulo or "Reporte")
+                except Exception:
+                    # Sin procesos disponibles o datos no serializables: render en serie
+                    pass
+            return _render_with_reportlab_fast(datos, titulo or "Reporte")
         return _render_with_reportlab(datos, titulo or "Reporte")
     if _HAS_FPDF:
         return _render_with_fpdf(datos, titulo or "Reporte")